@@ -0,0 +1,389 @@
+from sqlalchemy import text, bindparam
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from config import Config
+from key_allocator import AsyncEmplcodeAllocator
+from database import (
+    SYNC_INSERTED, SYNC_EXISTS, SYNC_NOT_FOUND, SYNC_BATCH_SIZE, EMPLOYEE_SYNC_COLUMNS,
+    TARGET_EXISTS_SQL, SOURCE_ACTIVE_EMPLOYEE_SQL, INSERT_EMPLOYEE_SQL, SOURCE_STATUS_SQL, UPDATE_STATUS_SQL,
+    SOURCE_CANDIDATES_QUERY, PREPARE_CANDIDATES_SQL, FINISH_APPLYING_SQL, INSERT_CANDIDATES_SQL,
+    EXISTING_CANDIDATES_SQL, PENDING_CANDIDATES_SQL, INSERT_MISSING_CANDIDATES_SQL,
+    DatabaseManager
+)
+from change_tracking import SET_ORIGIN_SQL
+from history_tracking import (
+    CARRY_HISTORY_SQL, FINISH_CARRYING_SQL, EMPLOYEE_HISTORY_SQL, INSERT_EMPLOYEE_HISTORY_SQL,
+    INSERT_EMPLOYEE_HISTORY_DELTAS_SQL, SOURCE_HISTORY_SQL, HISTORY_COLUMNS, HISTORY_BATCH_SIZE,
+    PREPARE_HISTORY_SQL, INSERT_HISTORY_SQL, APPLY_HISTORY_SQL, APPLY_HISTORY_DELTAS_SQL, history_arrays
+)
+from query_catalog import function_call, function_params
+from cleanup_registry import CLEANUP_BATCH_SIZE, CLEANUP_RUN_BATCH_SQL, REGISTRY_INSTALLED_SQL
+from contextlib import asynccontextmanager, AsyncExitStack
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabaseManager:
+    """Асинхронный менеджер баз филиалов на SQLAlchemy asyncio и asyncpg.
+
+    Повторяет публичные методы DatabaseManager. Независимые операции в разных
+    базах выполняются одновременно, число одновременных операций в каждой базе
+    ограничено Config.ASYNC_MAX_CONCURRENCY.
+    """
+
+    def __init__(self, max_concurrency=None, branches=None, test_run_id=None):
+        self.branches = branches if branches is not None else Config.get_branches()
+        self.test_run_id = test_run_id or Config.TEST_RUN_ID
+        self.engines = {}
+        self.sessions = {}
+        self.allocators = {}
+        self.max_concurrency = max_concurrency or Config.ASYNC_MAX_CONCURRENCY
+        self._limits = {}
+        self._setup_databases()
+
+    def _setup_databases(self):
+        """Настройка асинхронных подключений ко всем базам реестра (соединения открываются лениво)"""
+        for name, branch in self.branches.items():
+            engine = create_async_engine(
+                Config.get_db_url(branch, driver='asyncpg'), **Config.get_engine_options(self.test_run_id, driver='asyncpg')
+            )
+            self.engines[name] = engine
+            self.sessions[name] = async_sessionmaker(bind=engine, expire_on_commit=False)
+            self.allocators[name] = AsyncEmplcodeAllocator(engine, block_size=Config.EMPLCODE_BLOCK_SIZE)
+            self._limits[name] = asyncio.Semaphore(self.max_concurrency)
+
+    async def connect(self):
+        """Проверка подключения ко всем базам одновременно"""
+        async def probe(name):
+            try:
+                async with self.engines[name].connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+                    # Реестр тестовых записей устанавливает только миграция 0006_test_registry
+                    if self.test_run_id and not (await conn.execute(REGISTRY_INSTALLED_SQL)).scalar():
+                        raise RuntimeError(
+                            f"Реестр тестовых записей не установлен в {name}: примените миграции (python migrations.py)"
+                        )
+                logger.info(f"Успешное подключение к {name}")
+            except Exception as e:
+                logger.error(f"Ошибка подключения к {name}: {e}")
+                raise
+
+        await asyncio.gather(*(probe(name) for name in self.engines))
+        return self
+
+    _filial_number = DatabaseManager._filial_number
+
+    @asynccontextmanager
+    async def _slot(self, database_name):
+        """Слот ограничения параллелизма для базы"""
+        async with self._limits[database_name]:
+            yield
+
+    @asynccontextmanager
+    async def _slots(self, *database_names):
+        """Слоты нескольких баз сразу, в порядке имен: встречные операции не ждут друг друга по кругу"""
+        async with AsyncExitStack() as stack:
+            for database_name in sorted(set(database_names)):
+                await stack.enter_async_context(self._slot(database_name))
+            yield
+
+    def get_session(self, database_name):
+        """Получить асинхронную сессию для указанной базы"""
+        if database_name not in self.sessions:
+            raise ValueError(f"База данных {database_name} не настроена")
+        return self.sessions[database_name]()
+
+    async def gather(self, *aws):
+        """Выполнить корутины одновременно и вернуть результаты в исходном порядке"""
+        return await asyncio.gather(*aws)
+
+    async def execute_function(self, database_name, function_name, *args):
+        """Выполнить функцию в базе данных"""
+        statement = function_call(function_name, len(args))
+        async with self._slot(database_name), self.get_session(database_name) as session:
+            result = await session.execute(statement, function_params(args))
+            return result.fetchall()
+
+    async def _scalar(self, database_name, statement, params):
+        async with self._slot(database_name), self.get_session(database_name) as session:
+            return (await session.execute(statement, params)).scalar()
+
+    async def _fetchone(self, database_name, statement, params):
+        async with self._slot(database_name), self.get_session(database_name) as session:
+            return (await session.execute(statement, params)).fetchone()
+
+    async def _fetchall(self, database_name, statement, params):
+        async with self._slot(database_name), self.get_session(database_name) as session:
+            return (await session.execute(statement, params)).fetchall()
+
+    async def safe_synchronize_employee(self, source_db, target_db, passport):
+        """Безопасная синхронизация сотрудника по паспорту - только если его нет в целевой базе"""
+        target_filial = self._filial_number(target_db)
+        source_filial = self._filial_number(source_db)
+
+        try:
+            # Проверка в целевой базе и чтение сотрудника и его истории из источника выполняются одновременно
+            target_exists, employee_data, history = await asyncio.gather(
+                self._scalar(target_db, TARGET_EXISTS_SQL, {'passport': passport, 'filial': target_filial}),
+                self._fetchone(source_db, SOURCE_ACTIVE_EMPLOYEE_SQL, {'passport': passport, 'filial': source_filial}),
+                self._fetchall(source_db, EMPLOYEE_HISTORY_SQL, {'passport': passport, 'filial': source_filial})
+            )
+
+            if target_exists > 0:
+                # Сотрудник уже есть: переносятся только недостающие записи его истории
+                carried = await self._carry_history_deltas(target_db, passport, history)
+                logger.info(
+                    f"Сотрудник с паспортом {passport} уже существует в {target_db} (филиал {target_filial}), "
+                    f"перенесено записей истории: {carried}"
+                )
+                return False
+
+            if not employee_data:
+                logger.warning(
+                    f"Активный сотрудник с паспортом {passport} не найден в {source_db} (филиал {source_filial})")
+                return False
+
+            new_emplcode = await self.allocators[target_db].next_code()
+
+            # Вместо записи о приеме переносится история источника
+            async with self._slot(target_db), self.get_session(target_db) as target_session:
+                await target_session.execute(CARRY_HISTORY_SQL)
+                await target_session.execute(
+                    INSERT_EMPLOYEE_SQL,
+                    {
+                        'emplcode': new_emplcode,
+                        'name': employee_data.name,
+                        'surname': employee_data.surname,
+                        'patronymic': employee_data.patronymic,
+                        'birthday': employee_data.birthday,
+                        'passport': employee_data.passport,
+                        'poscode': employee_data.poscode,
+                        'filial': target_filial,
+                        'status': employee_data.status
+                    }
+                )
+                if history:
+                    await target_session.execute(INSERT_EMPLOYEE_HISTORY_SQL, {
+                        'emplcode': new_emplcode, 'passport': passport, **history_arrays(history)
+                    })
+                await target_session.execute(FINISH_CARRYING_SQL)
+                await target_session.commit()
+
+            logger.info(f"Сотрудник {passport} синхронизирован из {source_db} в {target_db} с кодом {new_emplcode}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации сотрудника {passport}: {e}")
+            return False
+
+    async def _carry_history_deltas(self, target_db, passport, history):
+        """Перенос недостающих записей прочитанной истории источника сотруднику целевого филиала.
+
+        Возвращает число перенесенных записей.
+        """
+        if not history:
+            return 0
+        async with self._slot(target_db), self.get_session(target_db) as target_session:
+            result = await target_session.execute(INSERT_EMPLOYEE_HISTORY_DELTAS_SQL, {
+                'passport': passport, 'filial': self._filial_number(target_db), **history_arrays(history)
+            })
+            await target_session.commit()
+            return result.rowcount
+
+    async def synchronize_employees(self, source_db, target_db, passports):
+        """Построчная синхронизация списка паспортов с ограниченным параллелизмом"""
+        results = await asyncio.gather(
+            *(self.safe_synchronize_employee(source_db, target_db, passport) for passport in passports)
+        )
+        return dict(zip(passports, results))
+
+    async def bulk_synchronize_employees(self, source_db, target_db, passports=None, batch_size=SYNC_BATCH_SIZE):
+        """Пакетная синхронизация новых сотрудников из source в target.
+
+        Чтение очередной пачки из источника идет одновременно с загрузкой
+        предыдущей во временную таблицу целевой базы.
+        Возвращает словарь {паспорт: SYNC_INSERTED | SYNC_EXISTS | SYNC_NOT_FOUND}.
+        """
+        source_filial = self._filial_number(source_db)
+        target_filial = self._filial_number(target_db)
+        outcomes = {}
+
+        source_query = SOURCE_CANDIDATES_QUERY
+        source_params = {'filial': source_filial}
+        if passports is not None:
+            passports = list(passports)
+            outcomes = {passport: SYNC_NOT_FOUND for passport in passports}
+            if not passports:
+                return outcomes
+            source_query += " AND passport IN :passports"
+            source_params['passports'] = passports
+
+        source_statement = text(source_query)
+        if passports is not None:
+            source_statement = source_statement.bindparams(bindparam('passports', expanding=True))
+
+        partitions = asyncio.Queue(maxsize=2)
+
+        async def produce():
+            cancelled = False
+            try:
+                async with self.engines[source_db].connect() as source_conn:
+                    result = await source_conn.stream(source_statement, source_params)
+                    async for partition in result.partitions(batch_size):
+                        await partitions.put(partition)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+            finally:
+                # После отмены очередь никто не читает: конец потока ставится только для потребителя
+                if not cancelled:
+                    await partitions.put(None)
+
+        try:
+            # Слоты обеих баз берутся до начала: производитель под слотом источника,
+            # ожидающий его при занятом слоте цели, блокировал бы встречную синхронизацию
+            async with self._slots(source_db, target_db), self.engines[target_db].begin() as target_conn:
+                for statement in PREPARE_CANDIDATES_SQL:
+                    await target_conn.execute(text(statement))
+
+                producer = asyncio.create_task(produce())
+                try:
+                    while (partition := await partitions.get()) is not None:
+                        columns = {column: [getattr(row, column) for row in partition] for column in EMPLOYEE_SYNC_COLUMNS}
+                        await target_conn.execute(INSERT_CANDIDATES_SQL, columns)
+                    await producer
+                finally:
+                    # Ошибка потребителя: производитель ждал бы места в очереди, удерживая соединение источника
+                    producer.cancel()
+                    await asyncio.gather(producer, return_exceptions=True)
+
+                existing = (await target_conn.execute(
+                    EXISTING_CANDIDATES_SQL, {'filial': target_filial}
+                )).scalars().all()
+                pending_count = (await target_conn.execute(
+                    PENDING_CANDIDATES_SQL, {'filial': target_filial}
+                )).scalar()
+                codes = await self.allocators[target_db].reserve_range(pending_count)
+                await target_conn.execute(SET_ORIGIN_SQL, {'origin': source_db})
+                await target_conn.execute(CARRY_HISTORY_SQL)
+                inserted = (await target_conn.execute(
+                    INSERT_MISSING_CANDIDATES_SQL, {'base_code': codes.start - 1, 'filial': target_filial}
+                )).scalars().all()
+                await self._carry_history(target_conn, source_db, target_db, codes, inserted + existing)
+                await target_conn.execute(FINISH_CARRYING_SQL)
+                await target_conn.execute(FINISH_APPLYING_SQL)
+        except Exception as e:
+            logger.error(f"Ошибка пакетной синхронизации из {source_db} в {target_db}: {e}")
+            raise
+
+        outcomes.update({passport: SYNC_EXISTS for passport in existing})
+        outcomes.update({passport: SYNC_INSERTED for passport in inserted})
+
+        logger.info(
+            f"Пакетная синхронизация {source_db} -> {target_db}: добавлено {len(inserted)}, "
+            f"уже существуют {len(existing)}"
+        )
+        return outcomes
+
+    async def _carry_history(self, target_conn, source_db, target_db, codes, passports,
+                             batch_size=HISTORY_BATCH_SIZE):
+        """Перенос истории источника сотрудникам целевой базы, как в DatabaseManager._carry_history.
+
+        Новые сотрудники с кодами из codes получают всю историю, остальные - недостающие записи.
+        asyncpg не выгружает запрос через COPY, поэтому история каждой пачки паспортов
+        читается из источника и загружается во временную таблицу массивами.
+        Возвращает число перенесенных записей.
+        """
+        if not passports:
+            return 0
+        for statement in PREPARE_HISTORY_SQL:
+            await target_conn.execute(text(statement))
+        async with self.engines[source_db].connect() as source_conn:
+            for start in range(0, len(passports), batch_size):
+                rows = (await source_conn.execute(SOURCE_HISTORY_SQL, {
+                    'filial': self._filial_number(source_db), 'passports': passports[start:start + batch_size]
+                })).fetchall()
+                if rows:
+                    await target_conn.execute(INSERT_HISTORY_SQL, dict(zip(HISTORY_COLUMNS, map(list, zip(*rows)))))
+
+        params = {'filial': self._filial_number(target_db), 'first_code': codes.start, 'last_code': codes.stop - 1}
+        carried = (await target_conn.execute(APPLY_HISTORY_SQL, params)).rowcount if codes else 0
+        return carried + (await target_conn.execute(APPLY_HISTORY_DELTAS_SQL, params)).rowcount
+
+    async def safe_synchronize_dismissal(self, source_db, target_db, passport):
+        """Безопасная синхронизация увольнения"""
+        try:
+            source_filial = self._filial_number(source_db)
+            source_status, history = await asyncio.gather(
+                self._scalar(source_db, SOURCE_STATUS_SQL, {'passport': passport, 'filial': source_filial}),
+                self._fetchall(source_db, EMPLOYEE_HISTORY_SQL, {'passport': passport, 'filial': source_filial})
+            )
+
+            if not source_status:
+                logger.warning(f"Сотрудник с паспортом {passport} не найден в {source_db}")
+                return False
+
+            # Запись об увольнении переносится из истории источника, а не пишется триггером повторно
+            target_filial = self._filial_number(target_db)
+            async with self._slot(target_db), self.get_session(target_db) as target_session:
+                await target_session.execute(CARRY_HISTORY_SQL)
+                result = await target_session.execute(
+                    UPDATE_STATUS_SQL,
+                    {'status': source_status, 'passport': passport, 'filial': target_filial}
+                )
+                updated_count = result.rowcount
+                if updated_count > 0 and history:
+                    await target_session.execute(INSERT_EMPLOYEE_HISTORY_DELTAS_SQL, {
+                        'passport': passport, 'filial': target_filial, **history_arrays(history)
+                    })
+                await target_session.execute(FINISH_CARRYING_SQL)
+                await target_session.commit()
+
+            if updated_count > 0:
+                logger.info(f"Статус сотрудника {passport} обновлен в {target_db}: {source_status}")
+                return True
+            else:
+                logger.warning(f"Сотрудник с паспортом {passport} не найден в {target_db} для обновления статуса")
+                return False
+
+        except Exception as e:
+            logger.error(f"Ошибка синхронизации увольнения для {passport}: {e}")
+            return False
+
+    async def synchronize_dismissals(self, source_db, target_db, passports):
+        """Синхронизация увольнений списка паспортов с ограниченным параллелизмом"""
+        results = await asyncio.gather(
+            *(self.safe_synchronize_dismissal(source_db, target_db, passport) for passport in passports)
+        )
+        return dict(zip(passports, results))
+
+    async def _cleanup_database(self, db_name, run_id, batch_size):
+        removed = 0
+        try:
+            while True:
+                async with self._slot(db_name), self.engines[db_name].begin() as conn:
+                    count = (await conn.execute(
+                        CLEANUP_RUN_BATCH_SQL, {'run_id': run_id, 'batch_size': batch_size}
+                    )).scalar()
+                removed += count
+                if count < batch_size:
+                    break
+            logger.info(f"Тестовые данные прогона {run_id} очищены в {db_name}: {removed} сотрудников")
+            return removed
+        except Exception as e:
+            logger.error(f"Ошибка при очистке данных в {db_name}: {e}")
+            return None
+
+    async def cleanup_test_data(self, run_id=None, batch_size=CLEANUP_BATCH_SIZE):
+        """Очистка записей тестового прогона пачками во всех базах одновременно"""
+        run_id = run_id or self.test_run_id
+        if not run_id:
+            logger.warning("Идентификатор тестового прогона не задан, очистка пропущена")
+            return {}
+        removed = await asyncio.gather(*(self._cleanup_database(db_name, run_id, batch_size) for db_name in self.engines))
+        return dict(zip(self.engines, removed))
+
+    async def close(self):
+        """Закрыть все соединения"""
+        await asyncio.gather(*(engine.dispose() for engine in self.engines.values()))
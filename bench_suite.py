@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+from data_generator import (
+    GeneratorProfile, GENERATOR_PASSPORT_PATTERN, GENERATOR_POSCODE_BASE, load_branch_pair, purge_generated,
+    passports, is_duplicate, is_partial_match, is_dismissed
+)
+from database import DatabaseManager, SYNC_INSERTED
+from migrations import apply_migrations
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+RESULTS_VERSION = 2
+
+# Сценарии в порядке выполнения: каждый следующий работает с состоянием после предыдущего
+SCENARIOS = (
+    'new_hire_single', 'new_hire_bulk',
+    'dismissal_single', 'dismissal_bulk',
+    'conflict_detection',
+    'history_single', 'history_bulk',
+    'reorg_single', 'reorg_bulk',
+    'cleanup',
+)
+
+# Допустимое ухудшение пропускной способности и p99 относительно базового прогона
+DEFAULT_THRESHOLD = 0.2
+
+INSERT_HISTORY_SQL = text("""
+    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+    SELECT emplcode, CURRENT_DATE, surname, passport, poscode, 'Перевод'
+    FROM employee WHERE passport = :passport AND filial = :filial
+""")
+
+INSERT_HISTORY_BULK_SQL = text("""
+    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+    SELECT emplcode, CURRENT_DATE, surname, passport, poscode, 'Перевод'
+    FROM employee WHERE passport LIKE :pattern AND filial = :filial
+""")
+
+# Реорганизация: сотрудник переходит на следующую должность набора, историю пишет триггер
+REORG_SQL = text("""
+    UPDATE employee SET poscode = :pos_base + (poscode - :pos_base + 1) % :positions
+    WHERE passport = :passport AND filial = :filial
+""")
+
+REORG_BULK_SQL = text("""
+    UPDATE employee SET poscode = :pos_base + (poscode - :pos_base + 1) % :positions
+    WHERE passport LIKE :pattern AND filial = :filial
+""")
+
+COUNT_DATASET_SQL = text("SELECT COUNT(*) FROM employee WHERE passport LIKE :pattern AND filial = :filial")
+
+
+def percentile(sorted_values, q):
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(scenario, employees, rows, func, calls=None):
+    """Замер сценария: calls - аргументы отдельных вызовов для задержек, без них - один вызов func().
+
+    Память - прирост пикового RSS процесса за сценарий: он виден, только если сценарий
+    поднял пик выше предыдущих.
+    """
+    rss_before = peak_rss_mb()
+    latencies = []
+    started = time.perf_counter()
+    if calls is None:
+        affected = func()
+    else:
+        affected = 0
+        for args in calls:
+            call_started = time.perf_counter()
+            affected += bool(func(*args))
+            latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    return {
+        'scenario': scenario,
+        'employees': employees,
+        'rows': rows,
+        'affected': affected,
+        'sec': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed else None,
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+        'rss_growth_mb': peak_rss_mb() - rss_before,
+    }
+
+
+def sample_passports(mask, samples):
+    """Паспорта людей источника, равномерно выбранных среди отмеченных в mask"""
+    numbers = np.flatnonzero(mask)
+    return passports(numbers[::max(1, len(numbers) // samples)][:samples]).tolist()
+
+
+def run_profile(profile, samples, source_db='filial1', target_db='filial2'):
+    """Полный прогон сценариев на наборе данных профиля. Возвращает список результатов.
+
+    Набор строит data_generator. Пакетные сценарии обрабатывают филиал целиком, включая
+    несинтетических сотрудников; все вставки соединений прогона регистрируются и удаляются
+    сценарием cleanup.
+    """
+    run_id = f'bench-{os.getpid()}-{profile.employees}-{int(time.time())}'
+    db = DatabaseManager(test_run_id=run_id)
+    source_filial = db.branches[source_db]['filial']
+    target_filial = db.branches[target_db]['filial']
+    pattern = GENERATOR_PASSPORT_PATTERN
+    numbers = np.arange(profile.employees, dtype=np.int64)
+    results = []
+
+    def count(database_name, filial):
+        with db.engines[database_name].connect() as conn:
+            return conn.execute(COUNT_DATASET_SQL, {'pattern': pattern, 'filial': filial}).scalar()
+
+    try:
+        for database_name in (source_db, target_db):
+            # Набор заполняет структурированные поля журнала конфликтов из миграций
+            apply_migrations(db.engines[database_name])
+            with db.engines[database_name].begin() as conn:
+                purge_generated(conn)
+        with db.engines[source_db].begin() as source_conn, db.engines[target_db].begin() as target_conn:
+            load_branch_pair(source_conn, target_conn, profile, source_filial, target_filial)
+
+        n = profile.employees
+        new_hires = sample_passports(~is_duplicate(numbers, profile) & ~is_partial_match(numbers, profile), samples)
+        results.append(measure(
+            'new_hire_single', n, len(new_hires), db.safe_synchronize_employee,
+            [(source_db, target_db, passport) for passport in new_hires]
+        ))
+        results.append(measure(
+            'new_hire_bulk', n, n,
+            lambda: sum(1 for outcome in db.bulk_synchronize_employees(source_db, target_db).values()
+                        if outcome == SYNC_INSERTED)
+        ))
+
+        # Уволенные в получателе дубликаты: их паспорт совпадает с паспортом источника
+        dismissed = sample_passports(is_duplicate(numbers, profile) & is_dismissed(numbers, profile, target_filial),
+                                     samples)
+        results.append(measure(
+            'dismissal_single', n, len(dismissed), db.safe_synchronize_dismissal,
+            [(target_db, source_db, passport) for passport in dismissed]
+        ))
+        target_rows = count(target_db, target_filial)
+        results.append(measure(
+            'dismissal_bulk', n, target_rows,
+            lambda: db.bulk_synchronize_dismissals(target_db, source_db)['updated']
+        ))
+
+        results.append(measure(
+            'conflict_detection', n, n + target_rows,
+            lambda: db.detect_conflicts(source_db, target_db)['partial_matches']
+        ))
+
+        def write_history(passport):
+            with db.connection_scope(source_db) as conn:
+                return conn.execute(INSERT_HISTORY_SQL, {'passport': passport, 'filial': source_filial}).rowcount
+
+        history = sample_passports(np.ones(profile.employees, dtype=bool), samples)
+        results.append(measure(
+            'history_single', n, len(history), write_history, [(passport,) for passport in history]
+        ))
+
+        def write_history_bulk():
+            with db.connection_scope(source_db) as conn:
+                return conn.execute(INSERT_HISTORY_BULK_SQL, {'pattern': pattern, 'filial': source_filial}).rowcount
+
+        results.append(measure('history_bulk', n, n, write_history_bulk))
+
+        reorg_params = {'pos_base': GENERATOR_POSCODE_BASE, 'positions': profile.positions,
+                        'filial': source_filial}
+
+        def reorg(passport):
+            with db.connection_scope(source_db) as conn:
+                return conn.execute(REORG_SQL, dict(reorg_params, passport=passport)).rowcount
+
+        results.append(measure(
+            'reorg_single', n, len(history), reorg, [(passport,) for passport in history]
+        ))
+
+        def reorg_bulk():
+            with db.connection_scope(source_db) as conn:
+                return conn.execute(REORG_BULK_SQL, dict(reorg_params, pattern=pattern)).rowcount
+
+        results.append(measure('reorg_bulk', n, n, reorg_bulk))
+
+        registered = count(source_db, source_filial) + target_rows
+        results.append(measure(
+            'cleanup', n, registered,
+            lambda: sum(removed or 0 for removed in db.cleanup_test_data(run_id).values())
+        ))
+    finally:
+        for database_name in (source_db, target_db):
+            with db.engines[database_name].begin() as conn:
+                purge_generated(conn)
+        db.close()
+
+    return results
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Сравнение с базовым прогоном по (сценарий, размер набора).
+
+    Регрессия - пропускная способность ниже базовой или p99 выше базового больше чем на threshold.
+    Возвращает список строк сравнения с флагом regression.
+    """
+    baseline_index = {(item['scenario'], item['employees']): item for item in baseline['results']}
+    comparison = []
+    for item in results['results']:
+        base = baseline_index.get((item['scenario'], item['employees']))
+        if base is None:
+            continue
+        throughput_ratio = (
+            item['rows_per_sec'] / base['rows_per_sec'] if item['rows_per_sec'] and base['rows_per_sec'] else None
+        )
+        p99_ratio = item['p99_ms'] / base['p99_ms'] if item['p99_ms'] and base['p99_ms'] else None
+        comparison.append({
+            'scenario': item['scenario'],
+            'employees': item['employees'],
+            'throughput_ratio': throughput_ratio,
+            'p99_ratio': p99_ratio,
+            'regression': (
+                (throughput_ratio is not None and throughput_ratio < 1 - threshold)
+                or (p99_ratio is not None and p99_ratio > 1 + threshold)
+            ),
+        })
+    return comparison
+
+
+def format_result(item):
+    latency = ''
+    if item['p50_ms'] is not None:
+        latency = f", p50 {item['p50_ms']:.2f} мс, p99 {item['p99_ms']:.2f} мс"
+    return (
+        f"  {item['employees']:>8} | {item['scenario']:<18} | {item['rows']:>8} строк за {item['sec']:.3f} с "
+        f"({item['rows_per_sec']:.0f} строк/с){latency}, затронуто {item['affected']}, "
+        f"+{item['rss_growth_mb']:.1f} МБ RSS"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Набор бенчмарков синхронизации на синтетических данных')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='число сотрудников филиала-источника')
+    defaults = GeneratorProfile._field_defaults
+    parser.add_argument('--duplicate-rate', type=float, default=defaults['duplicate_rate'])
+    parser.add_argument('--partial-rate', type=float, default=defaults['partial_match_rate'])
+    parser.add_argument('--target-only-rate', type=float, default=defaults['target_only_rate'])
+    parser.add_argument('--dismissal-rate', type=float, default=defaults['dismissal_rate'])
+    parser.add_argument('--transfers', type=float, default=defaults['transfers_per_employee'],
+                        help='среднее число переводов в истории сотрудника')
+    parser.add_argument('--seed', type=int, default=defaults['seed'])
+    parser.add_argument('--samples', type=int, default=500, help='вызовов в сценариях с замером задержек')
+    parser.add_argument('--output', help='файл результатов JSON (по умолчанию bench_results_<время>.json)')
+    parser.add_argument('--compare', help='файл результатов базового прогона')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'profile': {
+            'duplicate_rate': args.duplicate_rate,
+            'partial_match_rate': args.partial_rate,
+            'target_only_rate': args.target_only_rate,
+            'dismissal_rate': args.dismissal_rate,
+            'transfers_per_employee': args.transfers,
+            'seed': args.seed,
+        },
+        'samples': args.samples,
+        'results': [],
+    }
+
+    print("=== НАБОР БЕНЧМАРКОВ СИНХРОНИЗАЦИИ ===")
+    for size in args.sizes:
+        profile = GeneratorProfile(size, duplicate_rate=args.duplicate_rate, partial_match_rate=args.partial_rate,
+                                   target_only_rate=args.target_only_rate, dismissal_rate=args.dismissal_rate,
+                                   transfers_per_employee=args.transfers, seed=args.seed)
+        for item in run_profile(profile, args.samples):
+            results['results'].append(item)
+            print(format_result(item))
+
+    output = args.output or f'bench_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {output}")
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"=== СРАВНЕНИЕ С {args.compare} (коммит {baseline.get('commit')}) ===")
+    comparison = compare_results(results, baseline, args.threshold)
+    for row in comparison:
+        throughput = f"x{row['throughput_ratio']:.2f}" if row['throughput_ratio'] is not None else '-'
+        p99 = f"x{row['p99_ratio']:.2f}" if row['p99_ratio'] is not None else '-'
+        mark = ' РЕГРЕССИЯ' if row['regression'] else ''
+        print(f"  {row['employees']:>8} | {row['scenario']:<18} | пропускная способность {throughput}, p99 {p99}{mark}")
+    return 1 if any(row['regression'] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,800 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+from async_database import AsyncDatabaseManager
+from config import Config
+from database import (
+    DatabaseManager, SOURCE_CANDIDATES_QUERY, TARGET_EXISTS_SQL, SOURCE_ACTIVE_EMPLOYEE_SQL, get_shared_manager
+)
+from diff_engine import DIFF_ADD, DIFF_UPDATE, DIFF_CONFLICT
+from key_allocator import EmplcodeAllocator
+from migrations import apply_migrations
+from models import Base
+from query_catalog import QueryCatalog
+from sync_scheduler import SyncScheduler, plan_pairwise, plan_hub_and_spoke
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Паспорта бенчмарка начинаются с буквы и не пересекаются с реальными данными
+BENCH_PASSPORT_PREFIX = 'B'
+BENCH_BASE_CODE = 100000
+
+
+def bench_passport(number):
+    return f'{BENCH_PASSPORT_PREFIX}{number:09d}'
+
+
+INSERT_EMPLOYEE_SQL = text("""
+    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+    VALUES (:emplcode, :name, :surname, :patronymic, :birthday, :passport, :poscode, :filial, :status)
+""")
+
+
+def bench_employee(number, emplcode, filial=1):
+    return {
+        'emplcode': emplcode,
+        'name': 'Бенч',
+        'surname': f'Сотрудник{number}',
+        'patronymic': 'Тестович',
+        'birthday': date(1980 + number % 20, 1 + number % 12, 1 + number % 28),
+        'passport': bench_passport(number),
+        'poscode': 1 + number % 2,
+        'filial': filial,
+        'status': 'Active'
+    }
+
+
+def seed_employees(db, database_name, count, filial=1):
+    """Заполнение базы синтетическими сотрудниками для замеров"""
+    rows = [bench_employee(i, BENCH_BASE_CODE + i, filial) for i in range(count)]
+    with db.engines[database_name].begin() as conn:
+        conn.execute(INSERT_EMPLOYEE_SQL, rows)
+    return [row['passport'] for row in rows]
+
+
+def cleanup_bench_data(db, databases=('filial1', 'filial2')):
+    """Удаление данных бенчмарка"""
+    for database_name in databases:
+        with db.engines[database_name].begin() as conn:
+            conn.execute(
+                text("""
+                    DELETE FROM conflist WHERE emplcode IN (
+                        SELECT emplcode FROM employee WHERE passport LIKE :prefix
+                    )
+                """),
+                {'prefix': f'{BENCH_PASSPORT_PREFIX}%'}
+            )
+            conn.execute(
+                text("""
+                    DELETE FROM emplhistory WHERE emplcode IN (
+                        SELECT emplcode FROM employee WHERE passport LIKE :prefix
+                    )
+                """),
+                {'prefix': f'{BENCH_PASSPORT_PREFIX}%'}
+            )
+            conn.execute(
+                text("DELETE FROM employee WHERE passport LIKE :prefix"),
+                {'prefix': f'{BENCH_PASSPORT_PREFIX}%'}
+            )
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def bench_employee_sync(db, count):
+    """Сравнение построчной и пакетной синхронизации новых сотрудников"""
+    cleanup_bench_data(db)
+    passports = seed_employees(db, 'filial1', count)
+
+    try:
+        per_row_time, _ = timed(
+            lambda: [db.safe_synchronize_employee('filial1', 'filial2', passport) for passport in passports]
+        )
+        cleanup_bench_data(db, databases=('filial2',))
+
+        bulk_time, outcomes = timed(db.bulk_synchronize_employees, 'filial1', 'filial2', passports)
+        assert len(outcomes) == count
+    finally:
+        cleanup_bench_data(db)
+
+    return {
+        'rows': count,
+        'per_row_sec': per_row_time,
+        'bulk_sec': bulk_time,
+        'speedup': per_row_time / bulk_time if bulk_time else float('inf')
+    }
+
+
+def bench_dismissal_sync(db, count):
+    """Сравнение построчной и пакетной синхронизации увольнений"""
+    cleanup_bench_data(db)
+    passports = seed_employees(db, 'filial1', count)
+    seed_employees(db, 'filial2', count, filial=2)
+
+    def fire_in_filial2():
+        with db.engines['filial2'].begin() as conn:
+            conn.execute(
+                text("UPDATE employee SET status = 'Fired' WHERE passport LIKE :prefix"),
+                {'prefix': f'{BENCH_PASSPORT_PREFIX}%'}
+            )
+
+    def reset_filial1():
+        with db.engines['filial1'].begin() as conn:
+            conn.execute(
+                text("UPDATE employee SET status = 'Active' WHERE passport LIKE :prefix"),
+                {'prefix': f'{BENCH_PASSPORT_PREFIX}%'}
+            )
+
+    try:
+        fire_in_filial2()
+        per_row_time, _ = timed(
+            lambda: [db.safe_synchronize_dismissal('filial2', 'filial1', passport) for passport in passports]
+        )
+        reset_filial1()
+
+        bulk_time, result = timed(db.bulk_synchronize_dismissals, 'filial2', 'filial1')
+        assert result['updated'] >= count
+    finally:
+        cleanup_bench_data(db)
+
+    return {
+        'rows': count,
+        'per_row_sec': per_row_time,
+        'bulk_sec': bulk_time,
+        'speedup': per_row_time / bulk_time if bulk_time else float('inf')
+    }
+
+
+def bench_twophase_dismissal_sync(db, count, batch_size):
+    """Встречная синхронизация увольнений: фиксация на каждой строке против согласованной на пачку"""
+    cleanup_bench_data(db)
+    passports = seed_employees(db, 'filial1', count)
+    seed_employees(db, 'filial2', count, filial=2)
+
+    def set_statuses(database_name, status):
+        with db.engines[database_name].begin() as conn:
+            conn.execute(
+                text("UPDATE employee SET status = :status WHERE passport LIKE :prefix"),
+                {'status': status, 'prefix': f'{BENCH_PASSPORT_PREFIX}%'}
+            )
+
+    def bidirectional(passport):
+        db.safe_synchronize_dismissal('filial2', 'filial1', passport)
+        db.safe_synchronize_dismissal('filial1', 'filial2', passport)
+
+    def per_row():
+        for passport in passports:
+            bidirectional(passport)
+
+    def twophase():
+        for start in range(0, count, batch_size):
+            with db.unit_of_work(twophase=True):
+                for passport in passports[start:start + batch_size]:
+                    bidirectional(passport)
+
+    try:
+        set_statuses('filial2', 'Fired')
+        per_row_time, _ = timed(per_row)
+        set_statuses('filial1', 'Active')
+
+        twophase_time, _ = timed(twophase)
+        with db.engines['filial1'].connect() as conn:
+            fired = conn.execute(
+                text("SELECT COUNT(*) FROM employee WHERE passport LIKE :prefix AND status = 'Fired'"),
+                {'prefix': f'{BENCH_PASSPORT_PREFIX}%'}
+            ).scalar()
+        assert fired == count
+    finally:
+        cleanup_bench_data(db)
+
+    return {
+        'rows': count,
+        'batch_size': batch_size,
+        'per_row_rows_per_sec': count / per_row_time,
+        'twophase_rows_per_sec': count / twophase_time,
+        'speedup': per_row_time / twophase_time
+    }
+
+
+def bench_async_bidirectional_sync(db, count):
+    """Встречная пакетная синхронизация: последовательно по базам против одновременной"""
+    cleanup_bench_data(db)
+    passports_f1 = seed_employees(db, 'filial1', count, filial=1)
+    rows_f2 = [bench_employee(count + i, BENCH_BASE_CODE + count + i, filial=2) for i in range(count)]
+    with db.engines['filial2'].begin() as conn:
+        conn.execute(INSERT_EMPLOYEE_SQL, rows_f2)
+    passports_f2 = [row['passport'] for row in rows_f2]
+
+    def reset_synced_rows():
+        for database_name, synced_filial in (('filial1', 1), ('filial2', 2)):
+            synced = passports_f2 if database_name == 'filial1' else passports_f1
+            with db.engines[database_name].begin() as conn:
+                conn.execute(
+                    text("""
+                        DELETE FROM emplhistory WHERE emplcode IN (
+                            SELECT emplcode FROM employee WHERE passport = ANY(:passports) AND filial = :filial
+                        )
+                    """),
+                    {'passports': synced, 'filial': synced_filial}
+                )
+                conn.execute(
+                    text("DELETE FROM employee WHERE passport = ANY(:passports) AND filial = :filial"),
+                    {'passports': synced, 'filial': synced_filial}
+                )
+
+    async def run_async():
+        async_db = await AsyncDatabaseManager().connect()
+        try:
+            return await async_db.gather(
+                async_db.bulk_synchronize_employees('filial1', 'filial2', passports_f1),
+                async_db.bulk_synchronize_employees('filial2', 'filial1', passports_f2)
+            )
+        finally:
+            await async_db.close()
+
+    try:
+        sync_time, _ = timed(lambda: (
+            db.bulk_synchronize_employees('filial1', 'filial2', passports_f1),
+            db.bulk_synchronize_employees('filial2', 'filial1', passports_f2)
+        ))
+        reset_synced_rows()
+        async_time, _ = timed(asyncio.run, run_async())
+    finally:
+        cleanup_bench_data(db)
+
+    return {
+        'rows': count,
+        'sync_sec': sync_time,
+        'async_sec': async_time,
+        'speedup': sync_time / async_time if async_time else float('inf')
+    }
+
+
+def bench_key_allocation(db, count, workers):
+    """Параллельные вставки: MAX(emplcode) + 1 на строку против блоков аллокатора"""
+    engine = db.engines['filial2']
+    per_worker = count // workers
+
+    def insert_with_max(worker):
+        collisions = 0
+        for i in range(per_worker):
+            number = worker * per_worker + i
+            try:
+                with engine.begin() as conn:
+                    code = conn.execute(text("SELECT COALESCE(MAX(emplcode), 0) FROM employee")).scalar() + 1
+                    conn.execute(INSERT_EMPLOYEE_SQL, bench_employee(number, code, filial=2))
+            except IntegrityError:
+                collisions += 1
+        return collisions
+
+    def insert_with_allocator(worker):
+        allocator = EmplcodeAllocator(engine)
+        collisions = 0
+        for i in range(per_worker):
+            number = worker * per_worker + i
+            try:
+                with engine.begin() as conn:
+                    conn.execute(INSERT_EMPLOYEE_SQL, bench_employee(number, allocator.next_code(), filial=2))
+            except IntegrityError:
+                collisions += 1
+        return collisions
+
+    results = {'rows': per_worker * workers, 'workers': workers}
+    for label, insert in (('max', insert_with_max), ('allocator', insert_with_allocator)):
+        cleanup_bench_data(db, databases=('filial2',))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            elapsed, collisions = timed(lambda: sum(pool.map(insert, range(workers))))
+        results[f'{label}_rows_per_sec'] = (results['rows'] - collisions) / elapsed
+        results[f'{label}_collisions'] = collisions
+    cleanup_bench_data(db, databases=('filial2',))
+    return results
+
+
+def bench_connection_reuse(count):
+    """Короткие операции: новый менеджер на каждую против общего менеджера и единицы работы"""
+    query = text("SELECT COUNT(*) FROM employee WHERE passport = :passport")
+
+    def fresh_manager_per_operation():
+        for i in range(count):
+            db = DatabaseManager()
+            try:
+                session = db.get_session('filial1')
+                try:
+                    session.execute(query, {'passport': bench_passport(i)}).scalar()
+                finally:
+                    session.close()
+            finally:
+                db.close()
+
+    def shared_manager_unit_of_work():
+        db = get_shared_manager()
+        with db.unit_of_work():
+            for i in range(count):
+                session = db.get_session('filial1')
+                try:
+                    session.execute(query, {'passport': bench_passport(i)}).scalar()
+                finally:
+                    session.close()
+
+    fresh_time, _ = timed(fresh_manager_per_operation)
+    shared_time, _ = timed(shared_manager_unit_of_work)
+    return {
+        'operations': count,
+        'fresh_sec': fresh_time,
+        'shared_sec': shared_time,
+        'speedup': fresh_time / shared_time if shared_time else float('inf')
+    }
+
+
+
+OVERHEAD_QUERIES = (
+    ('count', TARGET_EXISTS_SQL),
+    ('select', SOURCE_ACTIVE_EMPLOYEE_SQL),
+    ('insert', INSERT_EMPLOYEE_SQL),
+)
+OVERHEAD_MODES = ('inline', 'cached', 'prepared')
+
+
+def bench_query_overhead(db, calls):
+    """Накладные расходы на вызов для тройки COUNT/SELECT/INSERT поштучной синхронизации.
+
+    inline - text() создается на каждый вызов, как в обработчиках до каталога запросов;
+    cached - заранее созданные операторы; prepared - каталог с серверным PREPARE.
+    Вставки выполняются в транзакции, которая откатывается после замера.
+    """
+    cleanup_bench_data(db, databases=('filial1',))
+    passport = seed_employees(db, 'filial1', 1)[0]
+    catalog = QueryCatalog(prepare=True)
+    for kind, statement in OVERHEAD_QUERIES:
+        catalog.register(f'bench_{kind}', statement)
+
+    def params(kind, i):
+        if kind == 'insert':
+            return bench_employee(1000 + i, BENCH_BASE_CODE + 1000 + i)
+        return {'passport': passport, 'filial': 1}
+
+    def execute(conn, mode, kind, statement, i):
+        if mode == 'inline':
+            return conn.execute(text(statement.text), params(kind, i))
+        if mode == 'cached':
+            return conn.execute(statement, params(kind, i))
+        return catalog.execute(conn, f'bench_{kind}', params(kind, i))
+
+    results = {'calls': calls}
+    try:
+        for mode in OVERHEAD_MODES:
+            elapsed = {kind: 0.0 for kind, _ in OVERHEAD_QUERIES}
+            with db.engines['filial1'].connect() as conn:
+                transaction = conn.begin()
+                try:
+                    for i in range(calls):
+                        for kind, statement in OVERHEAD_QUERIES:
+                            started = time.perf_counter()
+                            result = execute(conn, mode, kind, statement, i)
+                            if result.returns_rows:
+                                result.all()
+                            elapsed[kind] += time.perf_counter() - started
+                finally:
+                    transaction.rollback()
+            results[mode] = {kind: seconds / calls * 1e6 for kind, seconds in elapsed.items()}
+    finally:
+        cleanup_bench_data(db, databases=('filial1',))
+    return results
+
+# Генерация сотрудников на стороне сервера: миллион строк без передачи по сети.
+# Во втором филиале каждый 10-й сотрудник совпадает по ФИО и дате рождения с другим паспортом,
+# следующий - по паспорту и дате рождения с другой фамилией, еще один не совпадает ни с кем,
+# остальные полностью совпадают с сотрудниками первого филиала.
+SEED_CONFLICT_EMPLOYEES_SQL = text("""
+    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+    SELECT :base_code + i, 'Бенч',
+           CASE WHEN :filial = 2 AND i % 10 IN (1, 2) THEN 'Другой' ELSE 'Сотрудник' END || i,
+           'Тестович', DATE '1980-01-01' + i % 10000,
+           :prefix || lpad((CASE WHEN :filial = 2 AND i % 10 IN (0, 2) THEN i + 900000000 ELSE i END)::text, 9, '0'),
+           1 + i % 2, :filial, 'Active'
+    FROM generate_series(0, :count - 1) AS i
+""")
+
+
+def bench_conflict_detection(db, count):
+    """Поиск конфликтов 2 из 3 между филиалами по ключам блокировки"""
+    cleanup_bench_data(db)
+    for database_name, filial in (('filial1', 1), ('filial2', 2)):
+        with db.engines[database_name].begin() as conn:
+            conn.execute(SEED_CONFLICT_EMPLOYEES_SQL, {
+                'base_code': BENCH_BASE_CODE, 'filial': filial, 'count': count, 'prefix': BENCH_PASSPORT_PREFIX
+            })
+            conn.execute(text("ANALYZE employee"))
+
+    expected_partial = sum(1 for i in range(count) if i % 10 in (0, 1))
+    try:
+        detect_time, result = timed(db.detect_conflicts, 'filial1', 'filial2')
+        assert result['partial_matches'] == expected_partial
+    finally:
+        cleanup_bench_data(db)
+
+    return {
+        'rows': count,
+        'detect_sec': detect_time,
+        'rows_per_sec': 2 * count / detect_time,
+        **result
+    }
+
+
+SEED_DIFF_EMPLOYEES_SQL = text("""
+    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+    SELECT :base_code + i, 'Бенч', 'Сотрудник' || i, 'Тестович', DATE '1980-01-01' + i % 10000,
+           :prefix || lpad(i::text, 9, '0'), 1 + i % 2, :filial, 'Active'
+    FROM generate_series(0, :count - 1) AS i
+""")
+
+# Расхождения во втором филиале: каждый step-й сотрудник уволен, следующий переименован,
+# еще один отсутствует
+DIVERGE_DIFF_EMPLOYEES_SQL = [
+    "UPDATE employee SET status = 'Fired' WHERE emplcode >= :base_code AND (emplcode - :base_code) % :step = 1",
+    "UPDATE employee SET surname = 'Другой' || emplcode WHERE emplcode >= :base_code AND (emplcode - :base_code) % :step = 2",
+    "DELETE FROM emplhistory WHERE emplcode >= :base_code AND (emplcode - :base_code) % :step = 3",
+    "DELETE FROM employee WHERE emplcode >= :base_code AND (emplcode - :base_code) % :step = 3",
+]
+
+
+def bench_branch_diff(db, count, changes=100):
+    """Сверка филиалов по хешам корзин против выгрузки и построчного сравнения всех строк"""
+    cleanup_bench_data(db)
+    step = max(count // changes, 4)
+    for database_name, filial in (('filial1', 1), ('filial2', 2)):
+        with db.engines[database_name].begin() as conn:
+            conn.execute(SEED_DIFF_EMPLOYEES_SQL, {
+                'base_code': BENCH_BASE_CODE, 'filial': filial, 'count': count, 'prefix': BENCH_PASSPORT_PREFIX
+            })
+            if filial == 2:
+                for statement in DIVERGE_DIFF_EMPLOYEES_SQL:
+                    conn.execute(text(statement), {'base_code': BENCH_BASE_CODE, 'step': step})
+            conn.execute(text("ANALYZE employee"))
+
+    full_query = text("""
+        SELECT passport, surname, name, patronymic, birthday, poscode, status
+        FROM employee WHERE filial = :filial
+    """)
+
+    def full_compare():
+        sides, transferred = [], 0
+        for database_name, filial in (('filial1', 1), ('filial2', 2)):
+            rows = {}
+            for partition in db.stream_query(database_name, full_query, {'filial': filial}, batch_size=10000):
+                for row in partition:
+                    transferred += sum(len(str(value)) for value in row)
+                    rows[row.passport] = tuple(row[1:])
+            sides.append(rows)
+        source, target = sides
+        differing = sum(1 for passport, row in source.items() if target.get(passport) != row)
+        return differing, transferred
+
+    try:
+        diff_time, delta = timed(db.diff_branches, 'filial1', 'filial2')
+        full_time, (full_differing, full_bytes) = timed(full_compare)
+    finally:
+        cleanup_bench_data(db)
+
+    bench_delta = {
+        kind: [passport for passport in delta[kind] if passport.startswith(BENCH_PASSPORT_PREFIX)]
+        for kind in (DIFF_ADD, DIFF_UPDATE, DIFF_CONFLICT)
+    }
+    expected = len(range(1, count, step))
+    assert len(bench_delta[DIFF_UPDATE]) == expected and len(bench_delta[DIFF_CONFLICT]) == len(range(2, count, step))
+    assert len(bench_delta[DIFF_ADD]) == len(range(3, count, step))
+
+    return {
+        'rows': count,
+        'diff_sec': diff_time,
+        'diff_bytes': delta['stats']['transferred_bytes'],
+        'diff_levels': delta['stats']['levels'],
+        'full_sec': full_time,
+        'full_bytes': full_bytes,
+        'differing': sum(len(passports) for passports in bench_delta.values()),
+        'full_differing': full_differing
+    }
+
+
+def bench_bulk_load(db, count):
+    """Сравнение построчных INSERT, executemany и COPY FROM STDIN на загрузке сотрудников"""
+    cleanup_bench_data(db)
+    rows = [bench_employee(i, BENCH_BASE_CODE + i) for i in range(count)]
+    result = {'rows': count}
+
+    def single_row():
+        with db.engines['filial1'].begin() as conn:
+            for row in rows:
+                conn.execute(INSERT_EMPLOYEE_SQL, row)
+
+    def executemany():
+        with db.engines['filial1'].begin() as conn:
+            conn.execute(INSERT_EMPLOYEE_SQL, rows)
+
+    try:
+        for method, load in (('single_row', single_row), ('executemany', executemany),
+                             ('copy', lambda: db.bulk_load_employees('filial1', rows))):
+            elapsed, _ = timed(load)
+            result[f'{method}_sec'] = elapsed
+            result[f'{method}_rows_per_sec'] = count / elapsed
+            cleanup_bench_data(db, databases=('filial1',))
+    finally:
+        cleanup_bench_data(db)
+
+    return result
+
+
+class RollbackScenario(Exception):
+    """Откат единицы работы после замера: изменения сценария не фиксируются"""
+
+
+MEMORY_SCENARIOS = ('fetchall', 'stream', 'sync_incremental')
+
+
+def _memory_scenario(scenario, queue):
+    """Один сценарий чтения филиала 1 в отдельном процессе, чтобы пик RSS не смешивался с другими"""
+    db = DatabaseManager()
+    try:
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        if scenario == 'fetchall':
+            with db.connection_scope('filial1') as conn:
+                rows = len(conn.execute(text(SOURCE_CANDIDATES_QUERY), {'filial': 1}).fetchall())
+        elif scenario == 'stream':
+            rows = sum(len(partition) for partition in db.stream_query('filial1', SOURCE_CANDIDATES_QUERY, {'filial': 1}))
+        else:
+            # Полный проход без водяного знака; вставленные в filial2 строки откатываются
+            try:
+                with db.unit_of_work() as uow:
+                    uow.connection('filial2').execute(
+                        text("DELETE FROM sync_watermark WHERE source_db = 'filial1' AND target_db = 'filial2'")
+                    )
+                    rows = db.sync_incremental('filial1', 'filial2')['inserted']
+                    raise RollbackScenario()
+            except RollbackScenario:
+                pass
+        elapsed = time.perf_counter() - started
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        queue.put({'rows': rows, 'sec': elapsed, 'peak_rss_mb': peak_kb / 1024, 'growth_mb': (peak_kb - baseline_kb) / 1024})
+    finally:
+        db.close()
+
+
+def bench_streaming_memory(db, count):
+    """Пиковый RSS при полной загрузке результата, потоковом чтении и полной синхронизации филиала"""
+    cleanup_bench_data(db)
+    for engine in db.engines.values():
+        apply_migrations(engine)
+    with db.engines['filial1'].begin() as conn:
+        conn.execute(SEED_CONFLICT_EMPLOYEES_SQL, {
+            'base_code': BENCH_BASE_CODE, 'filial': 1, 'count': count, 'prefix': BENCH_PASSPORT_PREFIX
+        })
+        conn.execute(text("ANALYZE employee"))
+
+    context = multiprocessing.get_context('spawn')
+    result = {'rows': count}
+    try:
+        for scenario in MEMORY_SCENARIOS:
+            queue = context.Queue()
+            process = context.Process(target=_memory_scenario, args=(scenario, queue))
+            process.start()
+            result[scenario] = queue.get()
+            process.join()
+    finally:
+        cleanup_bench_data(db)
+
+    return result
+
+
+def create_bench_branches(count):
+    """Создание баз bench_branchN со схемой и должностями на локальном сервере"""
+    branches = {
+        f'bench_branch{number}': {**Config.DB_FILIAL1, 'database': f'bench_branch{number}', 'filial': number}
+        for number in range(1, count + 1)
+    }
+    admin_engine = create_engine(
+        Config.get_db_url({**Config.DB_FILIAL1, 'database': 'postgres'}), isolation_level='AUTOCOMMIT'
+    )
+    try:
+        with admin_engine.connect() as conn:
+            existing = set(conn.execute(text("SELECT datname FROM pg_database")).scalars())
+            for name in branches:
+                if name not in existing:
+                    conn.execute(text(f'CREATE DATABASE "{name}"'))
+    finally:
+        admin_engine.dispose()
+
+    for branch in branches.values():
+        engine = create_engine(Config.get_db_url(branch))
+        try:
+            Base.metadata.create_all(engine)
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    INSERT INTO positions (poscode, posname, parentpos, filial)
+                    VALUES (1, 'Менеджер', NULL, 1), (2, 'Разработчик', NULL, 1)
+                    ON CONFLICT (poscode) DO NOTHING
+                """))
+        finally:
+            engine.dispose()
+    return branches
+
+
+def bench_branch_topologies(branch_count, rows, workers, branch_limit):
+    """Последовательная синхронизация всех направлений против параллельного планировщика"""
+    branches = create_bench_branches(branch_count)
+    db = DatabaseManager(branches=branches)
+    results = {'branches': branch_count, 'rows_per_branch': rows}
+
+    def reset_branches():
+        for number, name in enumerate(branches, start=1):
+            with db.engines[name].begin() as conn:
+                conn.execute(text("""
+                    DELETE FROM emplhistory WHERE emplcode IN (
+                        SELECT emplcode FROM employee WHERE passport LIKE :prefix
+                    )
+                """), {'prefix': f'{BENCH_PASSPORT_PREFIX}%'})
+                conn.execute(text("DELETE FROM employee WHERE passport LIKE :prefix"),
+                             {'prefix': f'{BENCH_PASSPORT_PREFIX}%'})
+                conn.execute(INSERT_EMPLOYEE_SQL, [
+                    bench_employee(number * rows + i, BENCH_BASE_CODE + number * rows + i, filial=number)
+                    for i in range(rows)
+                ])
+
+    try:
+        names = list(branches)
+        for topology, tasks in (('pairwise', plan_pairwise(names)), ('hub', plan_hub_and_spoke(names[0], names))):
+            reset_branches()
+            sequential_time, _ = timed(SyncScheduler(
+                db, operation=db.bulk_synchronize_employees, max_workers=1, branch_limit=1
+            ).run, tasks)
+            reset_branches()
+            parallel_time, _ = timed(SyncScheduler(
+                db, operation=db.bulk_synchronize_employees, max_workers=workers, branch_limit=branch_limit
+            ).run, tasks)
+            results[f'{topology}_sequential_sec'] = sequential_time
+            results[f'{topology}_parallel_sec'] = parallel_time
+    finally:
+        db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк синхронизации филиалов')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--branches', type=int, nargs='*', default=[2, 4, 8])
+    parser.add_argument('--branch-rows', type=int, default=1000)
+    parser.add_argument('--branch-limit', type=int, default=Config.SYNC_BRANCH_CONCURRENCY)
+    parser.add_argument('--conflict-rows', type=int, nargs='*', default=[10000, 100000, 1000000])
+    parser.add_argument('--diff-rows', type=int, nargs='*', default=[100000, 1000000])
+    parser.add_argument('--load-rows', type=int, nargs='*', default=[10000, 100000])
+    parser.add_argument('--memory-rows', type=int, nargs='*', default=[100000, 1000000])
+    parser.add_argument('--tpc-batch', type=int, default=100, help='сотрудников в одной согласованной фиксации')
+    parser.add_argument('--overhead-calls', type=int, default=2000, help='вызовов каждого запроса в замере накладных расходов')
+    args = parser.parse_args()
+
+    db = DatabaseManager()
+    try:
+        print("=== БЕНЧМАРК СИНХРОНИЗАЦИИ НОВЫХ СОТРУДНИКОВ ===")
+        for count in args.rows:
+            result = bench_employee_sync(db, count)
+            print(
+                f"  {result['rows']:>7} строк: построчно {result['per_row_sec']:.3f} с, "
+                f"пакетно {result['bulk_sec']:.3f} с, ускорение x{result['speedup']:.1f}"
+            )
+
+        print("=== БЕНЧМАРК СИНХРОНИЗАЦИИ УВОЛЬНЕНИЙ ===")
+        for count in args.rows:
+            result = bench_dismissal_sync(db, count)
+            print(
+                f"  {result['rows']:>7} строк: построчно {result['per_row_sec']:.3f} с, "
+                f"пакетно {result['bulk_sec']:.3f} с, ускорение x{result['speedup']:.1f}"
+            )
+
+        print(f"=== БЕНЧМАРК СОГЛАСОВАННОЙ ФИКСАЦИИ (пачка {args.tpc_batch}) ===")
+        for count in args.rows:
+            result = bench_twophase_dismissal_sync(db, count, args.tpc_batch)
+            print(
+                f"  {result['rows']:>7} строк: фиксация на строку {result['per_row_rows_per_sec']:.0f} стр/с, "
+                f"2PC на пачку {result['twophase_rows_per_sec']:.0f} стр/с, ускорение x{result['speedup']:.1f}"
+            )
+
+        print("=== БЕНЧМАРК ПОИСКА КОНФЛИКТОВ ===")
+        for count in args.conflict_rows:
+            result = bench_conflict_detection(db, count)
+            print(
+                f"  {result['rows']:>7} сотрудников в филиале: {result['detect_sec']:.3f} с "
+                f"({result['rows_per_sec']:.0f} строк/с), конфликтов 2 из 3: {result['partial_matches']}, "
+                f"полных совпадений: {result['full_matches']}"
+            )
+
+        print("=== БЕНЧМАРК СВЕРКИ ФИЛИАЛОВ ===")
+        for count in args.diff_rows:
+            result = bench_branch_diff(db, count)
+            print(
+                f"  {result['rows']:>7} строк, расхождений {result['differing']}: "
+                f"хеши корзин {result['diff_sec']:.3f} с, {result['diff_bytes'] / 1024:.1f} КБ; "
+                f"полная выгрузка {result['full_sec']:.3f} с, {result['full_bytes'] / 1024 / 1024:.1f} МБ"
+            )
+
+        print("=== БЕНЧМАРК МАССОВОЙ ЗАГРУЗКИ ===")
+        for count in args.load_rows:
+            result = bench_bulk_load(db, count)
+            print(
+                f"  {result['rows']:>7} строк: построчно {result['single_row_rows_per_sec']:.0f} стр/с, "
+                f"executemany {result['executemany_rows_per_sec']:.0f} стр/с, "
+                f"COPY {result['copy_rows_per_sec']:.0f} стр/с"
+            )
+
+        print("=== БЕНЧМАРК ПАМЯТИ ПОТОКОВОГО ЧТЕНИЯ ===")
+        for count in args.memory_rows:
+            result = bench_streaming_memory(db, count)
+            for scenario in MEMORY_SCENARIOS:
+                measured = result[scenario]
+                print(
+                    f"  {result['rows']:>7} строк, {scenario}: {measured['sec']:.3f} с, "
+                    f"пик RSS {measured['peak_rss_mb']:.0f} МБ (+{measured['growth_mb']:.0f} МБ)"
+                )
+
+        print("=== БЕНЧМАРК АСИНХРОННОЙ ВСТРЕЧНОЙ СИНХРОНИЗАЦИИ ===")
+        for count in args.rows:
+            result = bench_async_bidirectional_sync(db, count)
+            print(
+                f"  {result['rows']:>7} строк: синхронно {result['sync_sec']:.3f} с, "
+                f"асинхронно {result['async_sec']:.3f} с, ускорение x{result['speedup']:.1f}"
+            )
+
+        print(f"=== БЕНЧМАРК ВЫДАЧИ EMPLCODE ({args.workers} воркеров) ===")
+        for count in args.rows:
+            result = bench_key_allocation(db, count, args.workers)
+            print(
+                f"  {result['rows']:>7} строк: MAX+1 {result['max_rows_per_sec']:.0f} вст/с "
+                f"(коллизий {result['max_collisions']}), "
+                f"аллокатор {result['allocator_rows_per_sec']:.0f} вст/с "
+                f"(коллизий {result['allocator_collisions']})"
+            )
+
+        print("=== БЕНЧМАРК ПЕРЕИСПОЛЬЗОВАНИЯ СОЕДИНЕНИЙ ===")
+        for count in args.rows:
+            result = bench_connection_reuse(min(count, 1000))
+            print(
+                f"  {result['operations']:>7} операций: новый менеджер {result['fresh_sec']:.3f} с, "
+                f"общий менеджер {result['shared_sec']:.3f} с, ускорение x{result['speedup']:.1f}"
+            )
+
+        print(f"=== БЕНЧМАРК НАКЛАДНЫХ РАСХОДОВ НА ЗАПРОС ({args.overhead_calls} вызовов) ===")
+        result = bench_query_overhead(db, args.overhead_calls)
+        for mode in OVERHEAD_MODES:
+            timings = ', '.join(f"{kind} {result[mode][kind]:.0f} мкс" for kind, _ in OVERHEAD_QUERIES)
+            print(f"  {mode:>8}: {timings}")
+
+        print(f"=== БЕНЧМАРК ТОПОЛОГИЙ ФИЛИАЛОВ ({args.workers} воркеров, лимит на филиал {args.branch_limit}) ===")
+        for branch_count in args.branches:
+            result = bench_branch_topologies(branch_count, args.branch_rows, args.workers, args.branch_limit)
+            for topology, label in (('pairwise', 'попарно'), ('hub', 'звезда')):
+                sequential = result[f'{topology}_sequential_sec']
+                parallel = result[f'{topology}_parallel_sec']
+                print(
+                    f"  {branch_count} филиалов, {label}: последовательно {sequential:.3f} с, "
+                    f"параллельно {parallel:.3f} с, ускорение x{sequential / parallel:.1f}"
+                )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+from sqlalchemy import text
+
+# Триггеры уровня оператора пишут журнал одним INSERT ... SELECT на весь оператор.
+# Изменения, внесенные самой синхронизацией (sync.applying = on), журналируются с базой,
+# из которой они пришли (sync.origin): центральный филиал раздает изменения одного филиала
+# остальным, а направление обратно в базу-источник их пропускает, чтобы перенесенные
+# записи не возвращались встречной синхронизацией.
+CHANGELOG_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION log_employee_changes()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF current_setting('sync.applying', true) IS DISTINCT FROM 'on' THEN
+            INSERT INTO employee_changelog (emplcode, operation)
+            SELECT emplcode, LEFT(TG_OP, 1) FROM changed_rows;
+        ELSE
+            INSERT INTO employee_changelog (emplcode, operation, origin)
+            SELECT emplcode, LEFT(TG_OP, 1), NULLIF(current_setting('sync.origin', true), '')
+            FROM changed_rows;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+CHANGELOG_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS employee_changelog_insert ON employee",
+    """
+    CREATE TRIGGER employee_changelog_insert
+    AFTER INSERT ON employee
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_employee_changes()
+    """,
+    "DROP TRIGGER IF EXISTS employee_changelog_update ON employee",
+    """
+    CREATE TRIGGER employee_changelog_update
+    AFTER UPDATE ON employee
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION log_employee_changes()
+    """,
+]
+
+# Миграция журнала изменений: таблицы повторяют модели EmployeeChangelog и SyncWatermark
+CHANGE_TRACKING_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS employee_changelog (
+        changeid BIGSERIAL PRIMARY KEY,
+        txid BIGINT NOT NULL DEFAULT txid_current(),
+        emplcode INTEGER NOT NULL,
+        operation VARCHAR(1) NOT NULL,
+        changedate TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_employee_changelog_txid ON employee_changelog (txid)",
+    """
+    CREATE TABLE IF NOT EXISTS sync_watermark (
+        source_db VARCHAR(50) NOT NULL,
+        target_db VARCHAR(50) NOT NULL,
+        last_txid BIGINT NOT NULL,
+        synced_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (source_db, target_db)
+    )
+    """,
+    CHANGELOG_FUNCTION_SQL,
+] + CHANGELOG_TRIGGERS_SQL
+
+# Миграция источника изменений: записи, примененные синхронизацией, помнят базу-источник
+CHANGELOG_ORIGIN_SQL = [
+    "ALTER TABLE employee_changelog ADD COLUMN IF NOT EXISTS origin VARCHAR(50)",
+    CHANGELOG_FUNCTION_SQL,
+]
+
+# Журнал установлен, если применены обе миграции: 0004_change_tracking и 0008_changelog_origin
+CHANGE_TRACKING_INSTALLED_SQL = text("""
+    SELECT to_regclass('employee_changelog') IS NOT NULL
+       AND to_regclass('sync_watermark') IS NOT NULL
+       AND EXISTS (
+           SELECT 1 FROM information_schema.columns
+           WHERE table_name = 'employee_changelog' AND column_name = 'origin'
+       )
+""")
+
+# База-источник применяемых изменений до конца транзакции (параметр нельзя передать в SET LOCAL)
+SET_ORIGIN_SQL = text("SELECT set_config('sync.origin', :origin, true)")
+
+# Все транзакции с txid меньше xmin текущего снимка уже завершены, поэтому
+# изменения в диапазоне [водяной знак, xmin) можно забирать без пропусков.
+SAFE_UPPER_TXID_SQL = text("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+
+
+def get_watermark(target_conn, source_db, target_db):
+    """Водяной знак направления с блокировкой строки до конца транзакции"""
+    return target_conn.execute(
+        text("""
+            SELECT last_txid FROM sync_watermark
+            WHERE source_db = :source_db AND target_db = :target_db
+            FOR UPDATE
+        """),
+        {'source_db': source_db, 'target_db': target_db}
+    ).scalar()
+
+
+def set_watermark(target_conn, source_db, target_db, last_txid):
+    """Сдвиг водяного знака в той же транзакции, что и примененные изменения"""
+    target_conn.execute(
+        text("""
+            INSERT INTO sync_watermark (source_db, target_db, last_txid, synced_at)
+            VALUES (:source_db, :target_db, :last_txid, NOW())
+            ON CONFLICT (source_db, target_db) DO UPDATE
+            SET last_txid = EXCLUDED.last_txid, synced_at = EXCLUDED.synced_at
+        """),
+        {'source_db': source_db, 'target_db': target_db, 'last_txid': last_txid}
+    )
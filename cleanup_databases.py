@@ -1,43 +1,34 @@
 #!/usr/bin/env python3
 from database import DatabaseManager
-from sqlalchemy import text
+from cleanup_registry import registered_runs
 import logging
+import sys
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def force_cleanup_databases():
-    """Принудительная очистка тестовых данных в обеих базах"""
+def force_cleanup_databases(run_id=None):
+    """Принудительная очистка тестовых данных: одного прогона или всех прогонов из реестра"""
     db = DatabaseManager()
 
     try:
-        for db_name in ['filial1', 'filial2']:
-            session = db.get_session(db_name)
-            try:
-                # Полная очистка тестовых данных
-                session.execute(text("DELETE FROM conflist WHERE emplcode >= 5000 OR errlist LIKE '%TEST%'"))
-                session.execute(text("DELETE FROM emplhistory WHERE emplcode >= 5000"))
-                session.execute(text("DELETE FROM employee WHERE emplcode >= 5000 OR passport LIKE '600%600%0'"))
-
-                session.commit()
-                logger.info(f"✅ База {db_name} полностью очищена от тестовых данных")
-
-                # Проверяем результат
-                remaining = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE emplcode >= 5000 OR passport LIKE '600%600%0'")
-                ).scalar()
-
-                if remaining == 0:
-                    logger.info(f"✅ В {db_name} нет тестовых данных")
+        if run_id:
+            run_ids = {run_id}
+        else:
+            # Прогоны, не успевшие убрать за собой (например, прерванные)
+            run_ids = {run for engine in db.engines.values() for run in registered_runs(engine)}
+
+        if not run_ids:
+            logger.info("✅ В реестре нет тестовых данных")
+            return
+
+        for run in sorted(run_ids):
+            for db_name, removed in db.cleanup_test_data(run_id=run).items():
+                if removed is None:
+                    logger.error(f"❌ Ошибка при очистке прогона {run} в {db_name}")
                 else:
-                    logger.warning(f"⚠️ В {db_name} осталось {remaining} тестовых записей")
-
-            except Exception as e:
-                session.rollback()
-                logger.error(f"❌ Ошибка при очистке {db_name}: {e}")
-            finally:
-                session.close()
+                    logger.info(f"✅ Прогон {run}: в {db_name} удалено {removed} сотрудников")
 
     finally:
         db.close()
@@ -45,4 +36,4 @@ def force_cleanup_databases():
 
 if __name__ == "__main__":
     print("=== ПРИНУДИТЕЛЬНАЯ ОЧИСТКА БАЗ ДАННЫХ ===")
-    force_cleanup_databases()
\ No newline at end of file
+    force_cleanup_databases(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,101 @@
+from sqlalchemy import text
+
+# Сколько сотрудников удаляется за одну транзакцию очистки
+CLEANUP_BATCH_SIZE = 500
+
+# Соединения тестового прогона передают его идентификатор параметром sync.test_run.
+# Триггер уровня оператора записывает коды всех вставленных ими сотрудников в реестр,
+# в том числе записанных синхронизацией и COPY, одним INSERT ... SELECT на оператор.
+REGISTRY_FUNCTION_SQL = """
+    CREATE OR REPLACE FUNCTION register_test_rows()
+    RETURNS TRIGGER AS $$
+    DECLARE
+        run_id TEXT := current_setting('sync.test_run', true);
+    BEGIN
+        IF run_id IS NOT NULL AND run_id <> '' THEN
+            INSERT INTO test_run_registry (run_id, emplcode)
+            SELECT run_id, emplcode FROM inserted_rows
+            ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+REGISTRY_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS employee_test_registry ON employee",
+    """
+    CREATE TRIGGER employee_test_registry
+    AFTER INSERT ON employee
+    REFERENCING NEW TABLE AS inserted_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION register_test_rows()
+    """,
+]
+
+# Миграция реестра: таблица повторяет модель RegisteredTestRow. Триггер ничего не пишет,
+# пока соединение не передало sync.test_run, поэтому рабочие вставки не затрагивает
+TEST_REGISTRY_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS test_run_registry (
+        run_id VARCHAR(64) NOT NULL,
+        emplcode INTEGER NOT NULL,
+        PRIMARY KEY (run_id, emplcode)
+    )
+    """,
+    REGISTRY_FUNCTION_SQL,
+] + REGISTRY_TRIGGERS_SQL
+
+REGISTRY_INSTALLED_SQL = text("""
+    SELECT to_regclass('test_run_registry') IS NOT NULL
+       AND EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'employee_test_registry')
+""")
+
+# Одна пачка: строки реестра удаляются вместе с сотрудниками и зависимыми записями.
+# Все части оператора выполняются в одной транзакции, проверка внешних ключей -
+# в конце оператора, когда ссылающиеся строки уже удалены. Поиск идет по первичным
+# ключам реестра и employee и индексам emplcode зависимых таблиц.
+CLEANUP_RUN_BATCH_SQL = text("""
+    WITH batch AS (
+        DELETE FROM test_run_registry
+        WHERE (run_id, emplcode) IN (
+            SELECT run_id, emplcode FROM test_run_registry
+            WHERE run_id = :run_id
+            LIMIT :batch_size
+        )
+        RETURNING emplcode
+    ),
+    conflicts AS (
+        DELETE FROM conflist c USING batch b WHERE c.emplcode = b.emplcode
+    ),
+    history AS (
+        DELETE FROM emplhistory h USING batch b WHERE h.emplcode = b.emplcode
+    ),
+    employees AS (
+        DELETE FROM employee e USING batch b WHERE e.emplcode = b.emplcode
+    )
+    SELECT COUNT(*) FROM batch
+""")
+
+REGISTERED_RUNS_SQL = text("SELECT DISTINCT run_id FROM test_run_registry")
+
+
+def cleanup_run(engine, run_id, batch_size=CLEANUP_BATCH_SIZE):
+    """Удаление записей тестового прогона пачками, каждая в своей короткой транзакции.
+
+    Возвращает число удаленных сотрудников.
+    """
+    removed = 0
+    while True:
+        with engine.begin() as conn:
+            count = conn.execute(CLEANUP_RUN_BATCH_SQL, {'run_id': run_id, 'batch_size': batch_size}).scalar()
+        removed += count
+        if count < batch_size:
+            return removed
+
+
+def registered_runs(engine):
+    """Идентификаторы прогонов, чьи записи еще не удалены"""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass('test_run_registry') IS NOT NULL")).scalar():
+            return list(conn.execute(REGISTERED_RUNS_SQL).scalars())
+    return []
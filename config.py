@@ -24,12 +24,101 @@ class Config:
         'password': os.getenv('DB_PASSWORD', 'password')
     }
 
+    # Параллельный планировщик синхронизации филиалов
+    SYNC_WORKERS = int(os.getenv('SYNC_WORKERS', '4'))
+    SYNC_BRANCH_CONCURRENCY = int(os.getenv('SYNC_BRANCH_CONCURRENCY', '2'))
+
+    # Настройки пула соединений
+    POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+    POOL_MAX_OVERFLOW = int(os.getenv('DB_POOL_MAX_OVERFLOW', '10'))
+    POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+    POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+    # Сколько операций одновременно выполняется в одной базе асинхронным менеджером
+    ASYNC_MAX_CONCURRENCY = int(os.getenv('DB_ASYNC_MAX_CONCURRENCY', '4'))
+
+    # Сколько табельных номеров резервируется за одно обращение к аллокатору
+    EMPLCODE_BLOCK_SIZE = int(os.getenv('EMPLCODE_BLOCK_SIZE', '100'))
+
+    # Повторы операций синхронизации после временных ошибок базы: число попыток
+    # и границы экспоненциальной задержки со случайным разбросом, секунды
+    SYNC_RETRY_ATTEMPTS = int(os.getenv('SYNC_RETRY_ATTEMPTS', '5'))
+    SYNC_RETRY_BASE_DELAY = float(os.getenv('SYNC_RETRY_BASE_DELAY', '0.05'))
+    SYNC_RETRY_MAX_DELAY = float(os.getenv('SYNC_RETRY_MAX_DELAY', '2.0'))
+
+    # Через сколько секунд подготовленная транзакция согласованной фиксации считается
+    # оставленной упавшим координатором и завершается восстановлением (sync_all_branches,
+    # python recover_transactions.py)
+    TPC_RECOVERY_GRACE = int(os.getenv('TPC_RECOVERY_GRACE', '60'))
+
+    # Серверные подготовленные операторы для горячих запросов синхронизации (psycopg2).
+    # Выключается при работе через пул соединений в режиме транзакций (pgbouncer)
+    PREPARED_STATEMENTS = os.getenv('DB_PREPARED_STATEMENTS', 'true').lower() in ('1', 'true', 'yes')
+
+    # Идентификатор тестового прогона: записи, вставленные его соединениями, попадают в реестр очистки
+    TEST_RUN_ID = os.getenv('TEST_RUN_ID')
+
+    # Сбор метрик операций, запросов и ожидания пула; выключение убирает подписки на события движков
+    METRICS_ENABLED = os.getenv('SYNC_METRICS', 'true').lower() in ('1', 'true', 'yes')
+
+    @classmethod
+    def get_engine_options(cls, test_run_id=None, driver=None):
+        """Параметры create_engine для пула соединений.
+
+        С test_run_id каждое соединение получает параметр сеанса sync.test_run.
+        """
+        options = {
+            'pool_size': cls.POOL_SIZE,
+            'max_overflow': cls.POOL_MAX_OVERFLOW,
+            'pool_timeout': cls.POOL_TIMEOUT,
+            'pool_recycle': cls.POOL_RECYCLE,
+            'pool_pre_ping': cls.POOL_PRE_PING
+        }
+        if test_run_id:
+            if driver == 'asyncpg':
+                options['connect_args'] = {'server_settings': {'sync.test_run': test_run_id}}
+            else:
+                options['connect_args'] = {'options': f'-c sync.test_run={test_run_id}'}
+        return options
+
+    @classmethod
+    def get_branches(cls):
+        """Реестр филиалов: имя базы -> параметры подключения и номер филиала.
+
+        Список задается переменной DB_BRANCHES в виде "filial1,filial2,filial3" или
+        "moscow:1,spb:2". Номер по умолчанию - позиция в списке; хост, порт и учетные
+        данные можно переопределить переменными DB_<ИМЯ>_HOST, DB_<ИМЯ>_PORT,
+        DB_<ИМЯ>_USER, DB_<ИМЯ>_PASSWORD. Без DB_BRANCHES используются filial1 и filial2.
+        """
+        branches_env = os.getenv('DB_BRANCHES')
+        if not branches_env:
+            return {
+                'filial1': {**cls.DB_FILIAL1, 'filial': 1},
+                'filial2': {**cls.DB_FILIAL2, 'filial': 2}
+            }
+
+        branches = {}
+        for position, item in enumerate(branches_env.split(','), start=1):
+            name, _, number = item.strip().partition(':')
+            prefix = f'DB_{name.upper()}_'
+            branches[name] = {
+                'host': os.getenv(prefix + 'HOST', os.getenv('DB_HOST', 'localhost')),
+                'port': os.getenv(prefix + 'PORT', os.getenv('DB_PORT', '5432')),
+                'database': os.getenv(prefix + 'DATABASE', name),
+                'user': os.getenv(prefix + 'USER', os.getenv('DB_USER', 'postgres')),
+                'password': os.getenv(prefix + 'PASSWORD', os.getenv('DB_PASSWORD', 'password')),
+                'filial': int(number) if number else position
+            }
+        return branches
+
     # Генерация URL для SQLAlchemy
     @classmethod
-    def get_db_url(cls, db_config):
+    def get_db_url(cls, db_config, driver=None):
         # Экранируем специальные символы в пароле
         password = urllib.parse.quote_plus(db_config['password'])
-        return f"postgresql://{db_config['user']}:{password}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
+        scheme = f"postgresql+{driver}" if driver else "postgresql"
+        return f"{scheme}://{db_config['user']}:{password}@{db_config['host']}:{db_config['port']}/{db_config['database']}"
 
 
 class TestConfig:
@@ -0,0 +1,220 @@
+from sqlalchemy import text
+
+# Ключевые параметры сотрудника (битовая маска совпавших полей)
+MATCH_PASSPORT = 1
+MATCH_FIO = 2
+MATCH_BIRTHDAY = 4
+MATCH_ALL = MATCH_PASSPORT | MATCH_FIO | MATCH_BIRTHDAY
+
+# Типы конфликтов: совпадение 3 из 3 ключевых параметров и 2 из 3
+CONFLICT_FULL_MATCH = 'full_match'
+CONFLICT_PARTIAL_MATCH = 'partial_match'
+
+MATCH_FIELD_NAMES = {
+    MATCH_PASSPORT: 'паспорт',
+    MATCH_FIO: 'ФИО',
+    MATCH_BIRTHDAY: 'дата рождения',
+}
+
+# Структурированный журнал конфликтов (повторный запуск безопасен):
+# - dedup_key однозначно определяет конфликт, повторы отсекает его уникальный индекс;
+# - ix_conflist_emplcode обслуживает выборку по сотруднику и проверку внешнего ключа при удалении;
+# - ix_conflist_other - поиск конфликтов со стороны сотрудника другого филиала;
+# - частичный индекс по неразрешенным конфликтам не растет вместе с историей разрешенных.
+CONFLICT_LOG_SQL = [
+    """
+    ALTER TABLE conflist
+        ADD COLUMN IF NOT EXISTS conflict_type VARCHAR(20),
+        ADD COLUMN IF NOT EXISTS other_emplcode INTEGER,
+        ADD COLUMN IF NOT EXISTS other_filial INTEGER,
+        ADD COLUMN IF NOT EXISTS matched_fields SMALLINT,
+        ADD COLUMN IF NOT EXISTS dedup_key VARCHAR(100)
+    """,
+    """
+    UPDATE conflist
+    SET dedup_key = conflict_type || ':' || emplcode || ':' || other_filial || ':' || other_emplcode
+    WHERE dedup_key IS NULL AND conflict_type IS NOT NULL
+    """,
+    "DROP INDEX IF EXISTS ux_conflist_pair",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_conflist_dedup_key ON conflist (dedup_key)",
+    "CREATE INDEX IF NOT EXISTS ix_conflist_emplcode ON conflist (emplcode)",
+    "CREATE INDEX IF NOT EXISTS ix_conflist_other ON conflist (other_filial, other_emplcode)",
+    """
+    CREATE INDEX IF NOT EXISTS ix_conflist_unresolved
+    ON conflist (conflictdate, conflictid) WHERE NOT resolved
+    """,
+]
+
+# Журнал установлен, если создан последний объект CONFLICT_LOG_SQL
+CONFLICT_LOG_INSTALLED_SQL = text("SELECT to_regclass('ix_conflist_unresolved') IS NOT NULL")
+
+# Отпечатки сотрудников другого филиала: ФИО сводится к одному хешу
+SOURCE_FINGERPRINTS_QUERY = text("""
+    SELECT emplcode, passport, md5(lower(surname || ' ' || name || ' ' || patronymic)) AS fio_key,
+           birthday, surname || ' ' || name || ' ' || patronymic AS full_name
+    FROM employee
+    WHERE filial = :filial
+""")
+
+PREPARE_FINGERPRINTS_SQL = [
+    "DROP TABLE IF EXISTS conflict_fingerprints",
+    """
+    CREATE TEMP TABLE conflict_fingerprints (
+        emplcode INTEGER,
+        passport VARCHAR(10),
+        fio_key TEXT,
+        birthday DATE,
+        full_name TEXT
+    ) ON COMMIT DROP
+    """,
+    "DROP TABLE IF EXISTS conflict_matches",
+]
+
+INSERT_FINGERPRINTS_SQL = text("""
+    INSERT INTO conflict_fingerprints (emplcode, passport, fio_key, birthday, full_name)
+    SELECT * FROM unnest(
+        CAST(:emplcode AS INTEGER[]), CAST(:passport AS VARCHAR[]), CAST(:fio_key AS TEXT[]),
+        CAST(:birthday AS DATE[]), CAST(:full_name AS TEXT[])
+    )
+""")
+
+# Пара, совпадающая по двум параметрам из трех, обязательно совпадает хотя бы по одному
+# из трех составных ключей блокировки. Каждый ключ - отдельное хеш-соединение, поэтому
+# поиск линеен по числу сотрудников вместо попарного сравнения внутри групп.
+FIND_MATCHES_SQL = text(f"""
+    CREATE TEMP TABLE conflict_matches ON COMMIT DROP AS
+    WITH local AS MATERIALIZED (
+        SELECT emplcode, passport, md5(lower(surname || ' ' || name || ' ' || patronymic)) AS fio_key,
+               birthday, surname || ' ' || name || ' ' || patronymic AS full_name
+        FROM employee
+        WHERE filial = :filial
+    ),
+    pairs AS (
+        SELECT l.emplcode, f.emplcode AS other_emplcode
+        FROM local l JOIN conflict_fingerprints f ON l.passport = f.passport AND l.fio_key = f.fio_key
+        UNION
+        SELECT l.emplcode, f.emplcode
+        FROM local l JOIN conflict_fingerprints f ON l.passport = f.passport AND l.birthday = f.birthday
+        UNION
+        SELECT l.emplcode, f.emplcode
+        FROM local l JOIN conflict_fingerprints f ON l.fio_key = f.fio_key AND l.birthday = f.birthday
+    ),
+    matches AS (
+        SELECT p.emplcode, p.other_emplcode, l.full_name, f.full_name AS other_full_name,
+               (CASE WHEN l.passport = f.passport THEN {MATCH_PASSPORT} ELSE 0 END)
+               | (CASE WHEN l.fio_key = f.fio_key THEN {MATCH_FIO} ELSE 0 END)
+               | (CASE WHEN l.birthday = f.birthday THEN {MATCH_BIRTHDAY} ELSE 0 END) AS matched_fields
+        FROM pairs p
+        JOIN local l ON l.emplcode = p.emplcode
+        JOIN conflict_fingerprints f ON f.emplcode = p.other_emplcode
+    )
+    SELECT *,
+           CASE WHEN matched_fields = {MATCH_ALL} THEN '{CONFLICT_FULL_MATCH}' ELSE '{CONFLICT_PARTIAL_MATCH}' END
+           AS conflict_type
+    FROM matches
+""")
+
+MATCH_COUNTS_SQL = text("SELECT conflict_type, COUNT(*) FROM conflict_matches GROUP BY conflict_type")
+
+LOGGED_MATCHES_SQL = text("""
+    SELECT emplcode, other_emplcode, full_name, other_full_name, matched_fields, conflict_type
+    FROM conflict_matches
+    WHERE conflict_type IN :conflict_types
+""")
+
+# Запись конфликта со своей стороны; повторы отсекает уникальный индекс dedup_key,
+# а не сравнение текста errlist
+INSERT_CONFLICTS_SQL = text("""
+    INSERT INTO conflist (
+        emplcode, errlist, conflictdate, resolved,
+        conflict_type, other_emplcode, other_filial, matched_fields, dedup_key
+    )
+    SELECT c.emplcode, c.errlist, NOW(), FALSE,
+           c.conflict_type, c.other_emplcode, :other_filial, c.matched_fields,
+           c.conflict_type || ':' || c.emplcode || ':' || :other_filial || ':' || c.other_emplcode
+    FROM unnest(
+        CAST(:emplcode AS INTEGER[]), CAST(:other_emplcode AS INTEGER[]),
+        CAST(:conflict_type AS VARCHAR[]), CAST(:matched_fields AS SMALLINT[]), CAST(:errlist AS VARCHAR[])
+    ) AS c(emplcode, other_emplcode, conflict_type, matched_fields, errlist)
+    ON CONFLICT (dedup_key) DO NOTHING
+""")
+
+# Неразрешенные конфликты, от старых к новым (частичный индекс ix_conflist_unresolved)
+OPEN_CONFLICTS_SQL = text("""
+    SELECT conflictid, emplcode, conflict_type, other_emplcode, other_filial, matched_fields, errlist, conflictdate
+    FROM conflist
+    WHERE NOT resolved
+    ORDER BY conflictdate, conflictid
+    LIMIT :limit
+""")
+
+# Решения экспертов по конфликту, как в SQL-функции resolve_conflict: сотрудник записи
+# журнала остается, меняется или удаляется сотрудник другого филиала
+RESOLUTION_MERGE = 'MERGE'
+RESOLUTION_KEEP_BOTH = 'KEEP_BOTH'
+RESOLUTION_UPDATE_DATA = 'UPDATE_DATA'
+# Порядок применения: слияние последним, чтобы сотрудник, удаленный одним решением,
+# не мешал остальным
+RESOLUTION_ACTIONS = (RESOLUTION_KEEP_BOTH, RESOLUTION_UPDATE_DATA, RESOLUTION_MERGE)
+
+# Все решения пачки помечаются одним UPDATE ... FROM unnest; уже разрешенные и
+# несуществующие конфликты не возвращаются
+MARK_RESOLVED_SQL = text("""
+    UPDATE conflist c
+    SET resolved = TRUE,
+        errlist = LEFT(c.errlist || ' - РАЗРЕШЕНО: ' || d.action, 1000)
+    FROM unnest(CAST(:conflictid AS INTEGER[]), CAST(:action AS VARCHAR[])) AS d(conflictid, action)
+    WHERE c.conflictid = d.conflictid AND NOT c.resolved
+    RETURNING c.conflictid, c.emplcode, c.other_emplcode, c.other_filial, d.action
+""")
+
+# Зеркальные записи конфликтов в базе другого филиала закрываются тем же решением
+RESOLVE_MIRRORED_SQL = text("""
+    UPDATE conflist c
+    SET resolved = TRUE,
+        errlist = LEFT(c.errlist || ' - РАЗРЕШЕНО: ' || d.action, 1000)
+    FROM unnest(
+        CAST(:emplcode AS INTEGER[]), CAST(:other_emplcode AS INTEGER[]), CAST(:action AS VARCHAR[])
+    ) AS d(emplcode, other_emplcode, action)
+    WHERE c.emplcode = d.other_emplcode AND c.other_emplcode = d.emplcode
+      AND c.other_filial = :filial AND NOT c.resolved
+""")
+
+# Изменения сотрудников другого филиала по группам решений, по одному оператору на группу.
+# Паспорта меняются так же, как в resolve_conflict; слияние удаляет дубликат вместе
+# с его историей и записями журнала конфликтов (внешние ключи на employee)
+APPLY_RESOLUTION_SQL = {
+    RESOLUTION_KEEP_BOTH: [text("""
+        UPDATE employee SET passport = SUBSTRING(passport FROM 1 FOR 7) || '_R'
+        WHERE filial = :filial AND emplcode = ANY(:emplcodes)
+    """)],
+    RESOLUTION_UPDATE_DATA: [text("""
+        UPDATE employee SET passport = 'R' || SUBSTRING(passport FROM 2 FOR 9)
+        WHERE filial = :filial AND emplcode = ANY(:emplcodes)
+    """)],
+    # История и конфликты удаляются только у сотрудников своего филиала:
+    # в общей базе код может принадлежать сотруднику другого филиала
+    RESOLUTION_MERGE: [
+        text("""
+            DELETE FROM emplhistory WHERE emplcode IN (
+                SELECT emplcode FROM employee WHERE filial = :filial AND emplcode = ANY(:emplcodes)
+            )
+        """),
+        text("""
+            DELETE FROM conflist WHERE emplcode IN (
+                SELECT emplcode FROM employee WHERE filial = :filial AND emplcode = ANY(:emplcodes)
+            )
+        """),
+        text("DELETE FROM employee WHERE filial = :filial AND emplcode = ANY(:emplcodes)"),
+    ],
+}
+
+
+def describe_conflict(full_name, other_full_name, other_emplcode, other_filial, matched_fields):
+    """Текст для поля errlist"""
+    fields = ', '.join(name for bit, name in MATCH_FIELD_NAMES.items() if matched_fields & bit)
+    matched_count = bin(matched_fields).count('1')
+    return (
+        f"Конфликт данных ({matched_count} из 3: {fields}): {full_name} и сотрудник {other_emplcode} "
+        f"филиала {other_filial} ({other_full_name})"
+    )
@@ -0,0 +1,145 @@
+from sqlalchemy import text
+from itertools import islice
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк кодируется за одно обращение драйвера к потоку и размер чтения драйвером
+COPY_BUFFER_ROWS = 5000
+COPY_READ_SIZE = 1 << 16
+
+EMPLOYEE_COLUMNS = ('emplcode', 'name', 'surname', 'patronymic', 'birthday', 'passport', 'poscode', 'filial', 'status')
+
+# Промежуточная таблица без ограничений: COPY не умеет ON CONFLICT, дубликаты отсекает слияние.
+# ord - порядок строк в загрузке
+PREPARE_EMPLOYEE_STAGING_SQL = [
+    "DROP TABLE IF EXISTS employee_staging",
+    """
+    CREATE TEMP TABLE employee_staging (
+        LIKE employee INCLUDING DEFAULTS,
+        ord BIGINT GENERATED ALWAYS AS IDENTITY
+    ) ON COMMIT DROP
+    """,
+]
+
+# Сотрудник с тем же паспортом в том же филиале или с занятым emplcode не вставляется;
+# из повторов паспорта внутри загрузки вставляется первый
+MERGE_EMPLOYEE_STAGING_SQL = text("""
+    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+    SELECT DISTINCT ON (s.passport, s.filial)
+           s.emplcode, s.name, s.surname, s.patronymic, s.birthday, s.passport, s.poscode, s.filial, s.status
+    FROM employee_staging s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM employee e
+        WHERE e.passport = s.passport AND e.filial = s.filial
+    )
+    ORDER BY s.passport, s.filial, s.ord
+    ON CONFLICT (emplcode) DO NOTHING
+""")
+
+
+def encode_copy_value(value):
+    """Значение в текстовом формате COPY: NULL - \\N, спецсимволы экранируются"""
+    if value is None:
+        return '\\N'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+class ChunkStream:
+    """Файлоподобный поток для COPY FROM STDIN над уже закодированными пачками байтов.
+
+    Пачки берутся из итератора по мере того, как драйвер читает поток, поэтому
+    в памяти находится не больше одной пачки.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = io.BytesIO()
+
+    def read(self, size=-1):
+        data = self._chunk.read(size)
+        while not data:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b''
+            self._chunk = io.BytesIO(chunk)
+            data = self._chunk.read(size)
+        return data
+
+
+def encode_copy_chunks(rows, buffer_rows=COPY_BUFFER_ROWS):
+    """Кодирование строк-кортежей в пачки текстового формата COPY по buffer_rows строк"""
+    rows = iter(rows)
+    while True:
+        encoded = ''.join(
+            '\t'.join(encode_copy_value(value) for value in row) + '\n'
+            for row in islice(rows, buffer_rows)
+        )
+        if not encoded:
+            return
+        yield encoded.encode('utf-8')
+
+
+class CopyStream(ChunkStream):
+    """Файлоподобный поток для COPY FROM STDIN: строки кодируются пачками по мере чтения"""
+
+    def __init__(self, rows, buffer_rows=COPY_BUFFER_ROWS):
+        super().__init__(encode_copy_chunks(rows, buffer_rows))
+
+
+def copy_chunks(conn, table, columns, chunks):
+    """Загрузка готовых пачек текстового формата COPY через COPY FROM STDIN в транзакции соединения.
+
+    Возвращает число загруженных строк.
+    """
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", ChunkStream(chunks), size=COPY_READ_SIZE)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def copy_rows(conn, table, columns, rows):
+    """Загрузка строк (кортежей в порядке columns) через COPY FROM STDIN в транзакции соединения.
+
+    Возвращает число загруженных строк.
+    """
+    return copy_chunks(conn, table, columns, encode_copy_chunks(rows))
+
+
+def copy_query(source_conn, target_conn, statement, params, table, columns):
+    """Перенос результата запроса источника в таблицу целевой базы без разбора строк в Python.
+
+    Источник отдает строки через COPY (запрос) TO STDOUT в буфер, цель загружает буфер
+    через COPY FROM STDIN. Столбцы запроса идут в порядке columns. Возвращает число строк.
+    """
+    compiled = statement.bindparams(**params).compile(dialect=source_conn.dialect)
+    buffer = io.BytesIO()
+    cursor = source_conn.connection.dbapi_connection.cursor()
+    try:
+        query = cursor.mogrify(compiled.string, compiled.params).decode()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT", buffer, size=COPY_READ_SIZE)
+    finally:
+        cursor.close()
+    return copy_chunks(target_conn, table, columns, [buffer.getvalue()])
+
+
+def copy_employees(conn, employees):
+    """Загрузка сотрудников (словарей с полями EMPLOYEE_COLUMNS) через промежуточную таблицу.
+
+    Возвращает (загружено в промежуточную таблицу, вставлено в employee).
+    """
+    for statement in PREPARE_EMPLOYEE_STAGING_SQL:
+        conn.execute(text(statement))
+    rows = (tuple(employee[column] for column in EMPLOYEE_COLUMNS) for employee in employees)
+    copied = copy_rows(conn, 'employee_staging', EMPLOYEE_COLUMNS, rows)
+    inserted = conn.execute(MERGE_EMPLOYEE_STAGING_SQL).rowcount
+    return copied, inserted
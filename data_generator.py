@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""Векторный генератор синтетических филиалов для нагрузочного тестирования.
+
+Атрибуты сотрудника - детерминированные функции (seed, номер человека): каждое поле
+получается хешем splitmix64 от номера, поэтому пачку любого диапазона можно построить
+независимо, а дубликаты и частичные совпадения филиала-получателя вычисляются заново
+по номерам людей источника без хранения всего источника в памяти. Строки форматируются
+векторно в текстовый формат COPY и потоком уходят в базу через copy_loader.copy_chunks.
+Тот же генератор заполняет базы набора бенчмарков bench_suite.py.
+"""
+import argparse
+import logging
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import text
+
+from conflict_engine import CONFLICT_LOG_INSTALLED_SQL
+from copy_loader import copy_chunks
+from history_tracking import CARRY_HISTORY_SQL, FINISH_CARRYING_SQL
+from key_allocator import EmplcodeAllocator
+
+logger = logging.getLogger(__name__)
+
+# Табельные номера сгенерированных сотрудников резервируются в key_allocator базы,
+# поэтому не пересекаются ни с существующими кодами, ни с выданными синхронизацией позже.
+# Коды должностей занимают свой диапазон
+GENERATOR_POSCODE_BASE = 800000
+GENERATOR_POSCODE_SPAN = 100000
+
+# Паспорт - буква G и девять цифр биекции номера человека по модулю 10^9: множитель
+# взаимно прост с 10, поэтому разные номера дают разные паспорта. Настоящие и тестовые
+# паспорта состоят из цифр, поэтому по букве сгенерированные данные и удаляются
+GENERATOR_PASSPORT_PREFIX = 'G'
+GENERATOR_PASSPORT_PATTERN = f'{GENERATOR_PASSPORT_PREFIX}%'
+PASSPORT_SPACE = 10 ** 9
+PASSPORT_MULTIPLIER = 738197507
+# Номера людей для измененных паспортов частичных совпадений
+PERTURBED_PASSPORT_OFFSET = PASSPORT_SPACE // 2
+
+GENERATOR_CHUNK_ROWS = 100000
+
+# Дата отсчета возрастов и стажа: набор не зависит от дня запуска
+REFERENCE_DATE = '2025-01-01'
+DAYS_PER_YEAR = 365.25
+
+EMPLOYEE_COLUMNS = ('emplcode', 'name', 'surname', 'patronymic', 'birthday', 'passport', 'poscode', 'filial', 'status')
+POSITION_COLUMNS = ('poscode', 'posname', 'parentpos', 'filial')
+HISTORY_COLUMNS = ('emplcode', 'changedate', 'surname', 'passport', 'poscode', 'action')
+CONFLICT_COLUMNS = ('emplcode', 'errlist', 'resolved', 'conflict_type')
+
+# Мужские и женские формы лежат в общем словаре подряд: индекс женской формы = индекс мужской + длина
+MALE_NAMES = (
+    'Александр', 'Алексей', 'Андрей', 'Дмитрий', 'Сергей', 'Иван', 'Максим', 'Михаил', 'Николай', 'Павел',
+    'Владимир', 'Евгений', 'Игорь', 'Кирилл', 'Олег', 'Роман', 'Юрий', 'Виктор', 'Артем', 'Георгий',
+)
+FEMALE_NAMES = (
+    'Елена', 'Ольга', 'Наталья', 'Анна', 'Ирина', 'Татьяна', 'Мария', 'Светлана', 'Екатерина', 'Юлия',
+    'Марина', 'Анастасия', 'Дарья', 'Ксения', 'Виктория', 'Полина', 'Людмила', 'Алина', 'Вера', 'Галина',
+)
+SURNAMES = (
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков', 'Федоров',
+    'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев',
+    'Орлов', 'Андреев', 'Макаров', 'Никитин', 'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев', 'Григорьев',
+)
+PATRONYMICS = (
+    ('Александрович', 'Александровна'), ('Алексеевич', 'Алексеевна'), ('Андреевич', 'Андреевна'),
+    ('Дмитриевич', 'Дмитриевна'), ('Сергеевич', 'Сергеевна'), ('Иванович', 'Ивановна'),
+    ('Михайлович', 'Михайловна'), ('Николаевич', 'Николаевна'), ('Владимирович', 'Владимировна'),
+    ('Викторович', 'Викторовна'), ('Юрьевич', 'Юрьевна'), ('Евгеньевич', 'Евгеньевна'),
+    ('Олегович', 'Олеговна'), ('Павлович', 'Павловна'), ('Игоревич', 'Игоревна'),
+)
+# Названия должностей по уровням дерева; уровни глубже последнего получают последнее название
+POSITION_TITLES = ('Директор филиала', 'Заместитель директора', 'Начальник отдела', 'Руководитель группы',
+                   'Ведущий специалист', 'Специалист')
+
+# Номера полей для хеша: у каждого поля свой независимый поток
+(FIELD_GENDER, FIELD_NAME, FIELD_SURNAME, FIELD_PATRONYMIC, FIELD_AGE, FIELD_AGE_PAIR, FIELD_POSITION,
+ FIELD_OVERLAP, FIELD_STATUS, FIELD_PERTURB, FIELD_PERTURB_VALUE, FIELD_HIRE, FIELD_TRANSFERS,
+ FIELD_CONFLICT) = range(14)
+
+# Профиль пары филиалов:
+# - employees - сотрудников источника;
+# - duplicate_rate - доля людей источника, работающих и в получателе с теми же паспортом, ФИО и датой рождения;
+# - partial_match_rate - доля людей источника, совпадающих в получателе по 2 из 3 ключей;
+# - target_only_rate - собственные сотрудники получателя относительно employees;
+# - dismissal_rate - доля уволенных в каждом филиале;
+# - positions, position_fanout - размер и ветвление дерева должностей;
+# - transfers_per_employee - среднее число переводов в истории (кроме записи о приеме);
+# - resolved_conflict_rate - доля сотрудников каждого филиала с уже разрешенным конфликтом в conflist.
+GeneratorProfile = namedtuple(
+    'GeneratorProfile',
+    ['employees', 'duplicate_rate', 'partial_match_rate', 'target_only_rate', 'dismissal_rate',
+     'positions', 'position_fanout', 'transfers_per_employee', 'seed', 'resolved_conflict_rate'],
+    defaults=[0.3, 0.05, 0.2, 0.1, 2000, 8, 1.5, 1, 0.01]
+)
+
+_GOLDEN = 0x9E3779B97F4A7C15
+_MIX1 = 0xBF58476D1CE4E5B9
+_MIX2 = 0x94D049BB133111EB
+
+
+def _hash(numbers, seed, field):
+    """splitmix64 от (seed, поле, номер): независимые равномерные uint64 на каждый номер"""
+    salt = np.uint64((_GOLDEN * ((seed << 8) + field + 1)) & 0xFFFFFFFFFFFFFFFF)
+    z = numbers.astype(np.uint64) * np.uint64(_GOLDEN) + salt
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(_MIX1)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(_MIX2)
+    return z ^ (z >> np.uint64(31))
+
+
+def _uniform(numbers, seed, field):
+    """Равномерные числа [0, 1)"""
+    return (_hash(numbers, seed, field) >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+def _choice(numbers, seed, field, size):
+    """Индексы словаря размера size с убывающей по Ципфу частотой: первые слова встречаются чаще"""
+    weights = 1.0 / np.arange(1, size + 1)
+    cumulative = np.cumsum(weights) / weights.sum()
+    return np.minimum(np.searchsorted(cumulative, _uniform(numbers, seed, field), side='right'), size - 1)
+
+
+def _normal(numbers, seed, field, pair_field):
+    """Стандартное нормальное распределение (преобразование Бокса - Мюллера)"""
+    u1 = 1.0 - _uniform(numbers, seed, field)
+    u2 = _uniform(numbers, seed, pair_field)
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+def passports(numbers):
+    """Паспорта людей с номерами numbers"""
+    digits = (numbers.astype(np.uint64) * np.uint64(PASSPORT_MULTIPLIER)) % np.uint64(PASSPORT_SPACE)
+    return np.char.add(GENERATOR_PASSPORT_PREFIX, np.char.zfill(digits.astype('U9'), 9))
+
+
+def _dates(days):
+    """Даты как смещения в днях от REFERENCE_DATE"""
+    return np.datetime64(REFERENCE_DATE, 'D') + days.astype('timedelta64[D]')
+
+
+def _position_levels(profile):
+    """Уровень каждой должности в дереве с ветвлением position_fanout (корень - уровень 0)"""
+    levels = np.zeros(profile.positions, dtype=np.int64)
+    first, width, level = 1, profile.position_fanout, 1
+    while first < profile.positions:
+        levels[first:first + width] = level
+        first, width, level = first + width, width * profile.position_fanout, level + 1
+    return levels
+
+
+def position_columns(profile, filial):
+    """Дерево должностей: родитель должности k - (k - 1) // position_fanout, у корня родителя нет"""
+    if profile.positions > GENERATOR_POSCODE_SPAN:
+        raise ValueError(f"Должностей больше {GENERATOR_POSCODE_SPAN}: {profile.positions}")
+    numbers = np.arange(profile.positions, dtype=np.int64)
+    levels = _position_levels(profile)
+    titles = np.array(POSITION_TITLES)[np.minimum(levels, len(POSITION_TITLES) - 1)]
+    parents = (GENERATOR_POSCODE_BASE + (numbers - 1) // profile.position_fanout).astype('U')
+    parents[0] = '\\N'
+    return {
+        'poscode': GENERATOR_POSCODE_BASE + numbers,
+        'posname': np.char.add(np.char.add(titles, ' №'), numbers.astype('U')),
+        'parentpos': parents,
+        'filial': np.full(profile.positions, filial),
+    }
+
+
+def _position_weights(profile):
+    """Вероятности должностей: на нижних уровнях дерева сотрудников больше"""
+    weights = (_position_levels(profile) + 1.0) ** 2
+    return np.cumsum(weights) / weights.sum()
+
+
+def person_columns(numbers, profile, filial, position_cdf):
+    """Атрибуты людей с номерами numbers; табельные номера заполняет вызывающий"""
+    seed = profile.seed
+    female = _uniform(numbers, seed, FIELD_GENDER) < 0.5
+    offset = female.astype(np.int64)
+
+    names = np.array(MALE_NAMES + FEMALE_NAMES)
+    surnames = np.array(SURNAMES + tuple(surname + 'а' for surname in SURNAMES))
+    patronymics = np.array([male for male, _ in PATRONYMICS] + [female for _, female in PATRONYMICS])
+
+    age_days = np.clip(40 + 10 * _normal(numbers, seed, FIELD_AGE, FIELD_AGE_PAIR), 18, 65) * DAYS_PER_YEAR
+    position = np.minimum(np.searchsorted(position_cdf, _uniform(numbers, seed, FIELD_POSITION), side='right'),
+                          len(position_cdf) - 1)
+
+    return {
+        'name': names[_choice(numbers, seed, FIELD_NAME, len(MALE_NAMES)) + offset * len(MALE_NAMES)],
+        'surname': surnames[_choice(numbers, seed, FIELD_SURNAME, len(SURNAMES)) + offset * len(SURNAMES)],
+        'patronymic': patronymics[_choice(numbers, seed, FIELD_PATRONYMIC, len(PATRONYMICS))
+                                  + offset * len(PATRONYMICS)],
+        'birthday': _dates(-age_days.astype(np.int64)),
+        'passport': passports(numbers),
+        'poscode': GENERATOR_POSCODE_BASE + position,
+        'filial': np.full(len(numbers), filial),
+        'status': np.where(is_dismissed(numbers, profile, filial), 'Fired', 'Active'),
+    }
+
+
+def is_duplicate(numbers, profile):
+    """Люди источника, работающие в получателе с теми же паспортом, ФИО и датой рождения"""
+    return _uniform(numbers, profile.seed, FIELD_OVERLAP) < profile.duplicate_rate
+
+
+def is_partial_match(numbers, profile):
+    """Люди источника, совпадающие в получателе по 2 из 3 ключей"""
+    overlap = _uniform(numbers, profile.seed, FIELD_OVERLAP)
+    return (overlap >= profile.duplicate_rate) & (overlap < profile.duplicate_rate + profile.partial_match_rate)
+
+
+def is_dismissed(numbers, profile, filial):
+    """Люди, уволенные в филиале filial"""
+    return _uniform(numbers + (filial << 40), profile.seed, FIELD_STATUS) < profile.dismissal_rate
+
+
+def _perturb(columns, numbers, profile):
+    """Частичное совпадение: меняется ровно один из ключей - паспорт, фамилия или дата рождения"""
+    seed = profile.seed
+    key = (_uniform(numbers, seed, FIELD_PERTURB) * 3).astype(np.int64)
+    shift = 1 + (_uniform(numbers, seed, FIELD_PERTURB_VALUE) * 3650).astype(np.int64)
+
+    passport = key == 0
+    columns['passport'][passport] = passports(numbers[passport] + PERTURBED_PASSPORT_OFFSET)
+
+    surname = key == 1
+    surnames = columns['surname'][surname]
+    female = np.char.endswith(surnames, 'а')
+    # Другая фамилия того же рода: сдвиг по словарю на 1..len-1
+    index = np.searchsorted(np.array(sorted(SURNAMES)), np.where(female, np.char.rstrip(surnames, 'а'), surnames))
+    others = np.array(sorted(SURNAMES))[(index + shift[surname] % (len(SURNAMES) - 1) + 1) % len(SURNAMES)]
+    columns['surname'][surname] = np.where(female, np.char.add(others, 'а'), others)
+
+    birthday = key == 2
+    columns['birthday'][birthday] = columns['birthday'][birthday] + shift[birthday].astype('timedelta64[D]')
+    return key
+
+
+def source_employee_chunks(profile, filial, base_code, chunk_rows=GENERATOR_CHUNK_ROWS):
+    """Пачки столбцов сотрудников источника: люди 0..employees-1, emplcode = base_code + номер"""
+    position_cdf = _position_weights(profile)
+    for start in range(0, profile.employees, chunk_rows):
+        numbers = np.arange(start, min(start + chunk_rows, profile.employees), dtype=np.int64)
+        columns = person_columns(numbers, profile, filial, position_cdf)
+        columns['emplcode'] = base_code + numbers
+        yield columns
+
+
+def _target_only_count(profile):
+    return int(round(profile.employees * profile.target_only_rate))
+
+
+def target_employee_count(profile, chunk_rows=GENERATOR_CHUNK_ROWS):
+    """Число сотрудников получателя: совпадения с источником и собственные сотрудники"""
+    overlap_rate = profile.duplicate_rate + profile.partial_match_rate
+    overlapping = 0
+    for start in range(0, profile.employees, chunk_rows):
+        numbers = np.arange(start, min(start + chunk_rows, profile.employees), dtype=np.int64)
+        overlapping += int(np.count_nonzero(_uniform(numbers, profile.seed, FIELD_OVERLAP) < overlap_rate))
+    return overlapping + _target_only_count(profile)
+
+
+def target_employee_chunks(profile, filial, base_code, chunk_rows=GENERATOR_CHUNK_ROWS):
+    """Пачки столбцов сотрудников получателя.
+
+    Сначала люди источника, попавшие в дубликаты или частичные совпадения (у частичных
+    один ключ изменен), затем собственные сотрудники получателя - люди с номерами
+    от employees. Табельные номера идут подряд от base_code.
+    """
+    position_cdf = _position_weights(profile)
+    overlap_rate = profile.duplicate_rate + profile.partial_match_rate
+    next_code = base_code
+
+    for start in range(0, profile.employees, chunk_rows):
+        numbers = np.arange(start, min(start + chunk_rows, profile.employees), dtype=np.int64)
+        overlap = _uniform(numbers, profile.seed, FIELD_OVERLAP)
+        numbers = numbers[overlap < overlap_rate]
+        if not len(numbers):
+            continue
+        columns = person_columns(numbers, profile, filial, position_cdf)
+        partial = overlap[overlap < overlap_rate] >= profile.duplicate_rate
+        if partial.any():
+            perturbed = {name: values[partial] for name, values in columns.items()}
+            _perturb(perturbed, numbers[partial], profile)
+            for name, values in perturbed.items():
+                columns[name][partial] = values
+        columns['emplcode'] = next_code + np.arange(len(numbers))
+        next_code += len(numbers)
+        yield columns
+
+    own = _target_only_count(profile)
+    for start in range(0, own, chunk_rows):
+        numbers = profile.employees + np.arange(start, min(start + chunk_rows, own), dtype=np.int64)
+        columns = person_columns(numbers, profile, filial, position_cdf)
+        columns['emplcode'] = next_code + np.arange(len(numbers))
+        next_code += len(numbers)
+        yield columns
+
+
+def history_columns(employees, profile, position_count):
+    """История для пачки сотрудников: запись о приеме и в среднем transfers_per_employee переводов.
+
+    Прием - в последние 15 лет, но не раньше 18 лет; переводы - по возрастающим датам
+    после приема на случайные должности.
+    """
+    seed = profile.seed
+    codes = employees['emplcode']
+    hire_days = -(_uniform(codes, seed, FIELD_HIRE) * 15 * DAYS_PER_YEAR).astype(np.int64)
+    adult = (employees['birthday'] - np.datetime64(REFERENCE_DATE, 'D')).astype(np.int64) + int(18 * DAYS_PER_YEAR)
+    hire_days = np.maximum(hire_days, np.minimum(adult, 0))
+
+    transfers = np.floor(_uniform(codes, seed, FIELD_TRANSFERS) * (2 * profile.transfers_per_employee + 1))
+    records = 1 + transfers.astype(np.int64)
+    owner = np.repeat(np.arange(len(codes)), records)
+    # Порядковый номер записи внутри сотрудника: 0 - прием, дальше переводы
+    ordinal = np.arange(len(owner)) - np.repeat(np.cumsum(records) - records, records)
+
+    step = (-hire_days[owner]) // records[owner]
+    change_days = hire_days[owner] + ordinal * step
+    record_numbers = codes[owner] * 16 + ordinal
+    poscode = np.where(
+        ordinal == 0, employees['poscode'][owner],
+        GENERATOR_POSCODE_BASE + (_hash(record_numbers, seed, FIELD_POSITION) % np.uint64(position_count)).astype(np.int64)
+    )
+    return {
+        'emplcode': codes[owner],
+        'changedate': _dates(change_days),
+        'surname': employees['surname'][owner],
+        'passport': employees['passport'][owner],
+        'poscode': poscode,
+        'action': np.where(ordinal == 0, 'Прием', 'Перевод'),
+    }
+
+
+def conflict_columns(employees, profile):
+    """Разрешенные конфликты для доли resolved_conflict_rate сотрудников пачки"""
+    codes = employees['emplcode'][_uniform(employees['emplcode'], profile.seed, FIELD_CONFLICT)
+                                  < profile.resolved_conflict_rate]
+    return {
+        'emplcode': codes,
+        'errlist': np.full(len(codes), 'Синтетический разрешенный конфликт'),
+        'resolved': np.full(len(codes), 't'),
+        'conflict_type': np.full(len(codes), 'partial_match'),
+    }
+
+
+def _text(values):
+    """Строковое представление столбца.
+
+    Даты и коды с узким диапазоном значений (должности, филиал) переводятся в строки
+    один раз на значение диапазона и раскладываются индексированием.
+    """
+    if values.dtype.kind not in 'iM' or values.dtype.itemsize != 8 or not len(values):
+        return values.astype('U')
+    numbers = values.view(np.int64)
+    low, high = int(numbers.min()), int(numbers.max())
+    if high - low >= len(values) // 2:
+        return values.astype('U')
+    table = np.arange(low, high + 1, dtype=np.int64).view(values.dtype).astype('U')
+    return table[numbers - low]
+
+
+def encode_columns(columns, names):
+    """Кодирование столбцов в одну пачку текстового формата COPY.
+
+    Столбцы приводятся к строкам векторно, строки собираются склейкой списков: это
+    быстрее поэлементного np.char.add. Значения словарей и чисел не содержат табуляций,
+    переводов строк и обратных косых, поэтому экранирование не требуется; NULL уже
+    записан как \\N.
+    """
+    values = [_text(columns[name]).tolist() for name in names]
+    return ''.join(['\t'.join(row) + '\n' for row in zip(*values)]).encode('utf-8')
+
+
+def _copy_branch(conn, employee_chunks, profile, filial):
+    """Загрузка должностей, сотрудников, истории и разрешенных конфликтов филиала.
+
+    История и конфликты копируются после сотрудников, на которых ссылаются.
+
+    Сгенерированный филиал - исходное состояние, а не изменения, поэтому в журнал изменений
+    он не пишется (как и строки, применяемые синхронизацией), а история приема берется
+    из генератора, а не из триггера.
+    """
+    conn.execute(text("SET LOCAL sync.applying = 'on'"))
+    conn.execute(CARRY_HISTORY_SQL)
+    counts = {'positions': copy_chunks(conn, 'positions', POSITION_COLUMNS,
+                                       [encode_columns(position_columns(profile, filial), POSITION_COLUMNS)])}
+    history = []
+    conflicts = []
+
+    def employees():
+        for columns in employee_chunks:
+            history.append(encode_columns(history_columns(columns, profile, profile.positions), HISTORY_COLUMNS))
+            conflicts.append(encode_columns(conflict_columns(columns, profile), CONFLICT_COLUMNS))
+            yield encode_columns(columns, EMPLOYEE_COLUMNS)
+
+    counts['employee'] = copy_chunks(conn, 'employee', EMPLOYEE_COLUMNS, employees())
+    counts['emplhistory'] = copy_chunks(conn, 'emplhistory', HISTORY_COLUMNS, history)
+    counts['conflist'] = copy_chunks(conn, 'conflist', CONFLICT_COLUMNS, conflicts)
+    conn.execute(FINISH_CARRYING_SQL)
+    conn.execute(text("SET LOCAL sync.applying = 'off'"))
+    conn.execute(text("ANALYZE employee"))
+    conn.execute(text("ANALYZE emplhistory"))
+    return counts
+
+
+def load_branch_pair(source_conn, target_conn, profile, source_filial, target_filial):
+    """Генерация и загрузка пары филиалов через COPY в транзакциях переданных соединений.
+
+    Табельные номера каждого филиала резервируются одним диапазоном в key_allocator его базы
+    (отдельной короткой транзакцией). Журнал конфликтов должен быть обновлен миграцией
+    0002_conflict_log. Возвращает число строк по ролям и таблицам.
+    """
+    for conn in (source_conn, target_conn):
+        if not conn.execute(CONFLICT_LOG_INSTALLED_SQL).scalar():
+            raise RuntimeError(
+                f"Журнал конфликтов не обновлен в {conn.engine.url.database}: примените миграции (python migrations.py)"
+            )
+    source_codes = EmplcodeAllocator(source_conn.engine).reserve_range(profile.employees)
+    target_codes = EmplcodeAllocator(target_conn.engine).reserve_range(target_employee_count(profile))
+    counts = {
+        'source': _copy_branch(source_conn, source_employee_chunks(profile, source_filial, source_codes.start),
+                               profile, source_filial),
+        'target': _copy_branch(target_conn, target_employee_chunks(profile, target_filial, target_codes.start),
+                               profile, target_filial),
+    }
+    logger.info(f"Сгенерирована пара филиалов {profile}: {counts}")
+    return counts
+
+
+# Сгенерированные сотрудники - по букве паспорта, в том числе перенесенные синхронизацией
+# в другой филиал; зависимые записи удаляются раньше сотрудников
+GENERATED_EMPLOYEES = "SELECT emplcode FROM employee WHERE passport LIKE :pattern"
+
+PURGE_GENERATED_SQL = [
+    f"DELETE FROM conflist WHERE emplcode IN ({GENERATED_EMPLOYEES})",
+    f"DELETE FROM emplhistory WHERE emplcode IN ({GENERATED_EMPLOYEES})",
+    "DELETE FROM employee WHERE passport LIKE :pattern",
+    "DELETE FROM positions WHERE poscode >= :pos_base AND poscode < :pos_end AND NOT EXISTS "
+    "(SELECT 1 FROM employee e WHERE e.poscode = positions.poscode)",
+]
+
+
+CHANGELOG_EXISTS_SQL = text("SELECT to_regclass('employee_changelog') IS NOT NULL")
+
+# Изменения сгенерированных сотрудников (например, увольнения при синхронизации) попадают в журнал
+PURGE_GENERATED_CHANGELOG_SQL = text(f"DELETE FROM employee_changelog WHERE emplcode IN ({GENERATED_EMPLOYEES})")
+
+
+def purge_generated(conn):
+    """Удаление сгенерированных данных из базы соединения по букве паспорта. Возвращает число строк"""
+    params = {
+        'pattern': GENERATOR_PASSPORT_PATTERN,
+        'pos_base': GENERATOR_POSCODE_BASE, 'pos_end': GENERATOR_POSCODE_BASE + GENERATOR_POSCODE_SPAN,
+    }
+    removed = 0
+    if conn.execute(CHANGELOG_EXISTS_SQL).scalar():
+        removed += conn.execute(PURGE_GENERATED_CHANGELOG_SQL, params).rowcount
+    removed += sum(conn.execute(text(statement), params).rowcount for statement in PURGE_GENERATED_SQL)
+    return removed
+
+
+def generate_buffers(profile, source_filial=1, target_filial=2):
+    """Только генерация пачек COPY без базы: число строк и байтов по таблицам.
+
+    Табельные номера без базы не резервируются и идут подряд от единицы.
+    """
+    stats = {}
+    for role, chunks, filial in (
+        ('source', source_employee_chunks(profile, source_filial, 1), source_filial),
+        ('target', target_employee_chunks(profile, target_filial, 1), target_filial),
+    ):
+        employee_rows = history_rows = size = 0
+        for columns in chunks:
+            history = history_columns(columns, profile, profile.positions)
+            size += len(encode_columns(columns, EMPLOYEE_COLUMNS)) + len(encode_columns(history, HISTORY_COLUMNS))
+            employee_rows += len(columns['emplcode'])
+            history_rows += len(history['emplcode'])
+        stats[role] = {'employee': employee_rows, 'emplhistory': history_rows, 'bytes': size}
+    return stats
+
+
+def main():
+    from database import DatabaseManager
+
+    defaults = GeneratorProfile._field_defaults
+    parser = argparse.ArgumentParser(description='Генерация синтетической пары филиалов для нагрузочного тестирования')
+    parser.add_argument('employees', type=int, nargs='?', default=1000000, help='сотрудников филиала-источника')
+    parser.add_argument('--duplicate-rate', type=float, default=defaults['duplicate_rate'])
+    parser.add_argument('--partial-rate', type=float, default=defaults['partial_match_rate'])
+    parser.add_argument('--target-only-rate', type=float, default=defaults['target_only_rate'])
+    parser.add_argument('--dismissal-rate', type=float, default=defaults['dismissal_rate'])
+    parser.add_argument('--positions', type=int, default=defaults['positions'])
+    parser.add_argument('--transfers', type=float, default=defaults['transfers_per_employee'])
+    parser.add_argument('--seed', type=int, default=defaults['seed'])
+    parser.add_argument('--source', default='filial1')
+    parser.add_argument('--target', default='filial2')
+    parser.add_argument('--dry-run', action='store_true', help='только сгенерировать пачки COPY без загрузки')
+    parser.add_argument('--purge', action='store_true', help='только удалить сгенерированные данные')
+    args = parser.parse_args()
+
+    profile = GeneratorProfile(args.employees, args.duplicate_rate, args.partial_rate, args.target_only_rate,
+                               args.dismissal_rate, args.positions, defaults['position_fanout'], args.transfers,
+                               args.seed)
+    started = time.perf_counter()
+    if args.dry_run:
+        print(f"Сгенерировано без загрузки: {generate_buffers(profile)} за {time.perf_counter() - started:.2f} с")
+        return 0
+
+    db = DatabaseManager()
+    try:
+        for database_name in (args.source, args.target):
+            with db.engines[database_name].begin() as conn:
+                removed = purge_generated(conn)
+            if removed:
+                print(f"{database_name}: удалено сгенерированных строк: {removed}")
+        if args.purge:
+            return 0
+
+        started = time.perf_counter()
+        with db.engines[args.source].begin() as source_conn, db.engines[args.target].begin() as target_conn:
+            counts = load_branch_pair(source_conn, target_conn, profile,
+                                      db.branches[args.source]['filial'], db.branches[args.target]['filial'])
+        elapsed = time.perf_counter() - started
+        rows = sum(sum(tables.values()) for tables in counts.values())
+        print(f"Загружено {rows} строк за {elapsed:.2f} с ({rows / elapsed:.0f} строк/с): {counts}")
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
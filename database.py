@@ -1,106 +1,586 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 from sqlalchemy.orm import sessionmaker
+from contextlib import contextmanager
 from config import Config
+from key_allocator import EmplcodeAllocator
+from change_tracking import (
+    get_watermark, set_watermark, SAFE_UPPER_TXID_SQL, CHANGE_TRACKING_INSTALLED_SQL, SET_ORIGIN_SQL
+)
+from two_phase import (
+    TPC_COMMIT, DECISION_LOG_INSTALLED_SQL, new_group_id, participant_xid, decide, forget, recover_in_doubt
+)
+from history_tracking import (
+    CARRY_HISTORY_SQL, FINISH_CARRYING_SQL, NEW_EMPLOYEE_PASSPORTS_SQL, SOURCE_HISTORY_SQL, HISTORY_COLUMNS, HISTORY_BATCH_SIZE,
+    PREPARE_HISTORY_SQL, APPLY_HISTORY_SQL, HISTORY_TRACKING_INSTALLED_SQL,
+    carry_employee_history, APPLY_HISTORY_DELTAS_SQL, carry_employee_history_deltas
+)
+from conflict_engine import (
+    CONFLICT_FULL_MATCH, CONFLICT_PARTIAL_MATCH, SOURCE_FINGERPRINTS_QUERY, PREPARE_FINGERPRINTS_SQL,
+    INSERT_FINGERPRINTS_SQL, FIND_MATCHES_SQL, MATCH_COUNTS_SQL, LOGGED_MATCHES_SQL, INSERT_CONFLICTS_SQL,
+    OPEN_CONFLICTS_SQL, CONFLICT_LOG_INSTALLED_SQL, RESOLUTION_ACTIONS, MARK_RESOLVED_SQL, RESOLVE_MIRRORED_SQL,
+    APPLY_RESOLUTION_SQL, describe_conflict
+)
+from copy_loader import copy_rows, copy_query, copy_employees
+from diff_engine import DIFF_ADD, DIFF_UPDATE, DIFF_CONFLICT, DIFF_TARGET_ONLY, compare_branches
+from cleanup_registry import CLEANUP_BATCH_SIZE, REGISTRY_INSTALLED_SQL, cleanup_run
+from sync_scheduler import SyncScheduler, plan_pairwise, plan_hub_and_spoke
+from metrics import OUTCOME_SKIPPED, OUTCOME_ERROR, TimedQueuePool, get_registry
+from retry_executor import RetryExecutor
+from query_catalog import QueryCatalog, function_call, function_params
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import threading
+import atexit
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Результаты пакетной синхронизации по каждому паспорту
+SYNC_INSERTED = 'synced'
+SYNC_EXISTS = 'exists'
+SYNC_NOT_FOUND = 'not_found'
+# Пачка с паспортом не выполнена за все попытки повторов
+SYNC_FAILED = 'failed'
+
+# Размер пачки при потоковом чтении и вставке
+SYNC_BATCH_SIZE = 1000
+
+EMPLOYEE_SYNC_COLUMNS = ('name', 'surname', 'patronymic', 'birthday', 'passport', 'poscode', 'status')
+
+# Запросы синхронизации, общие для синхронного и асинхронного менеджеров
+TARGET_EXISTS_SQL = text("SELECT COUNT(*) FROM employee WHERE passport = :passport AND filial = :filial")
+
+SOURCE_ACTIVE_EMPLOYEE_SQL = text("""
+    SELECT name, surname, patronymic, birthday, passport, poscode, status
+    FROM employee 
+    WHERE passport = :passport AND filial = :filial AND status = 'Active'
+""")
+
+INSERT_EMPLOYEE_SQL = text("""
+    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+    VALUES (:emplcode, :name, :surname, :patronymic, :birthday, :passport, :poscode, :filial, :status)
+""")
+
+SOURCE_STATUS_SQL = text("SELECT status FROM employee WHERE passport = :passport AND filial = :filial")
+
+UPDATE_STATUS_SQL = text("UPDATE employee SET status = :status WHERE passport = :passport AND filial = :filial")
+
+# Каталог горячих запросов поштучной синхронизации: операторы компилируются один раз,
+# с psycopg2 готовятся на сервере один раз на соединение
+SYNC_QUERIES = QueryCatalog(prepare=Config.PREPARED_STATEMENTS)
+SYNC_QUERIES.register('target_exists', TARGET_EXISTS_SQL)
+SYNC_QUERIES.register('source_active_employee', SOURCE_ACTIVE_EMPLOYEE_SQL)
+SYNC_QUERIES.register('insert_employee', INSERT_EMPLOYEE_SQL)
+SYNC_QUERIES.register('source_status', SOURCE_STATUS_SQL)
+SYNC_QUERIES.register('update_status', UPDATE_STATUS_SQL)
+
+PING_SQL = text("SELECT 1")
+
+APPLY_CANDIDATE_STATUSES_SQL = text("""
+    UPDATE employee e
+    SET status = c.status
+    FROM sync_candidates c
+    WHERE e.passport = c.passport
+    AND e.filial = :filial
+    AND e.status IS DISTINCT FROM c.status
+""")
+
+SOURCE_CANDIDATES_QUERY = """
+    SELECT name, surname, patronymic, birthday, passport, poscode, status
+    FROM employee
+    WHERE filial = :filial AND status = 'Active'
+"""
+
+# Изменения, внесенные синхронизацией, журналируются в целевой базе с базой-источником (SET_ORIGIN_SQL).
+# Таблица кандидатов пересоздается: внутри единицы работы транзакция не завершается между вызовами
+PREPARE_CANDIDATES_SQL = [
+    "SET LOCAL sync.applying = 'on'",
+    "DROP TABLE IF EXISTS sync_candidates",
+    """
+    CREATE TEMP TABLE sync_candidates (
+        ord SERIAL,
+        name VARCHAR(50), surname VARCHAR(50), patronymic VARCHAR(50),
+        birthday DATE, passport VARCHAR(10) PRIMARY KEY,
+        poscode INTEGER, status VARCHAR(20)
+    ) ON COMMIT DROP
+    """,
+]
+
+# Синхронный менеджер загружает кандидатов через COPY в промежуточную таблицу без ограничений
+# и переносит их в sync_candidates одним INSERT, повторы паспорта отсекаются как при unnest
+PREPARE_CANDIDATES_STAGING_SQL = [
+    "DROP TABLE IF EXISTS sync_candidates_staging",
+    """
+    CREATE TEMP TABLE sync_candidates_staging (
+        ord SERIAL,
+        name VARCHAR(50), surname VARCHAR(50), patronymic VARCHAR(50),
+        birthday DATE, passport VARCHAR(10),
+        poscode INTEGER, status VARCHAR(20)
+    ) ON COMMIT DROP
+    """,
+]
+
+MERGE_CANDIDATES_STAGING_SQL = text("""
+    INSERT INTO sync_candidates (name, surname, patronymic, birthday, passport, poscode, status)
+    SELECT name, surname, patronymic, birthday, passport, poscode, status
+    FROM sync_candidates_staging
+    ORDER BY ord
+    ON CONFLICT (passport) DO NOTHING
+""")
+
+FINISH_APPLYING_SQL = text("SET LOCAL sync.applying = 'off'")
+
+INSERT_CANDIDATES_SQL = text("""
+    INSERT INTO sync_candidates (name, surname, patronymic, birthday, passport, poscode, status)
+    SELECT * FROM unnest(
+        CAST(:name AS VARCHAR[]), CAST(:surname AS VARCHAR[]), CAST(:patronymic AS VARCHAR[]),
+        CAST(:birthday AS DATE[]), CAST(:passport AS VARCHAR[]), CAST(:poscode AS INTEGER[]),
+        CAST(:status AS VARCHAR[])
+    ) ON CONFLICT (passport) DO NOTHING
+""")
+
+# Одно анти-соединение вместо проверки каждого паспорта
+EXISTING_CANDIDATES_SQL = text("""
+    SELECT c.passport FROM sync_candidates c
+    WHERE EXISTS (
+        SELECT 1 FROM employee e
+        WHERE e.passport = c.passport AND e.filial = :filial
+    )
+""")
+
+# Кандидаты, которые уже были в целевом филиале до вставки (коды вне выданного диапазона),
+# пачками по паспорту
+EXISTING_CANDIDATES_PAGE_SQL = text("""
+    SELECT c.passport FROM sync_candidates c
+    JOIN employee e ON e.passport = c.passport AND e.filial = :filial
+    WHERE e.emplcode NOT BETWEEN :first_code AND :last_code
+    AND c.passport > :after
+    ORDER BY c.passport
+    LIMIT :limit
+""")
+
+PENDING_CANDIDATES_SQL = text("""
+    SELECT COUNT(*) FROM sync_candidates c
+    WHERE c.status = 'Active' AND NOT EXISTS (
+        SELECT 1 FROM employee e
+        WHERE e.passport = c.passport AND e.filial = :filial
+    )
+""")
+
+INSERT_MISSING_CANDIDATES_QUERY = """
+    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+    SELECT :base_code + ROW_NUMBER() OVER (ORDER BY c.ord),
+           c.name, c.surname, c.patronymic, c.birthday, c.passport, c.poscode, :filial, c.status
+    FROM sync_candidates c
+    WHERE c.status = 'Active' AND NOT EXISTS (
+        SELECT 1 FROM employee e
+        WHERE e.passport = c.passport AND e.filial = :filial
+    )
+"""
+
+INSERT_MISSING_CANDIDATES_SQL = text(INSERT_MISSING_CANDIDATES_QUERY + " RETURNING passport")
+
+# Без RETURNING: драйвер не получает паспорта вставленных строк, нужен только счетчик
+APPLY_MISSING_CANDIDATES_SQL = text(INSERT_MISSING_CANDIDATES_QUERY)
+
+SOURCE_STATUSES_QUERY = """
+    SELECT passport, status
+    FROM employee e
+    WHERE e.filial = :filial
+"""
+
+PREPARE_STATUSES_SQL = [
+    "SET LOCAL sync.applying = 'on'",
+    "DROP TABLE IF EXISTS sync_statuses",
+    """
+    CREATE TEMP TABLE sync_statuses (
+        passport VARCHAR(10) PRIMARY KEY,
+        status VARCHAR(20)
+    ) ON COMMIT DROP
+    """,
+]
+
+INSERT_STATUSES_SQL = text("""
+    INSERT INTO sync_statuses (passport, status)
+    SELECT * FROM unnest(CAST(:passport AS VARCHAR[]), CAST(:status AS VARCHAR[]))
+    ON CONFLICT (passport) DO NOTHING
+""")
+
+# Один UPDATE ... FROM на все направление
+APPLY_STATUSES_SQL = text("""
+    UPDATE employee e
+    SET status = s.status
+    FROM sync_statuses s
+    WHERE e.passport = s.passport
+    AND e.filial = :filial
+    AND e.status IS DISTINCT FROM s.status
+    RETURNING e.passport
+""")
+
+UNMATCHED_STATUSES_SQL = text("""
+    SELECT s.passport FROM sync_statuses s
+    WHERE NOT EXISTS (
+        SELECT 1 FROM employee e
+        WHERE e.passport = s.passport AND e.filial = :filial
+    )
+""")
+
+
+def stream_partitions(conn, statement, params=None, batch_size=SYNC_BATCH_SIZE):
+    """Потоковое чтение результата пачками через серверный курсор.
+
+    Опции потокового чтения передаются только этому запросу: execution_options
+    соединения в SQLAlchemy 2.0 меняют само соединение. Размер пачки передается
+    в partitions() явно, без него результат отдается одной пачкой.
+    """
+    result = conn.execute(
+        statement, params or {}, execution_options={'stream_results': True, 'yield_per': batch_size}
+    )
+    try:
+        yield from result.partitions(batch_size)
+    finally:
+        result.close()
+
+
+def column_batches(partitions, columns):
+    """Пачки строк в виде столбцов для загрузки через unnest"""
+    for partition in partitions:
+        yield {column: [getattr(row, column) for row in partition] for column in columns}
+
+
+class UnitOfWork:
+    """Единица работы: одно соединение на базу на весь проход синхронизации.
+
+    Операции менеджера внутри единицы работы выполняются в точках сохранения
+    на закрепленных соединениях, фиксация выполняется один раз в конце.
+    Переданные извне соединения используются как есть: единица работы открывает
+    на них точку сохранения и не закрывает их.
+
+    С twophase транзакции баз фиксируются согласованно: все участники подготавливаются
+    (PREPARE TRANSACTION), решение записывается в журнал координатора, затем каждый
+    участник фиксируется - один цикл подготовки и фиксации на базу за всю единицу работы.
+    """
+
+    def __init__(self, manager, connections=None, twophase=False):
+        self.manager = manager
+        self.connections = {}
+        self._injected = dict(connections or {})
+        self._transactions = {}
+        self.group_id = new_group_id() if twophase else None
+
+    def connection(self, database_name):
+        """Закрепленное соединение с открытой транзакцией"""
+        if database_name not in self.connections:
+            if database_name in self._injected:
+                conn = self._injected[database_name]
+                self._transactions[database_name] = conn.begin_nested()
+            elif self.group_id:
+                conn = self.manager.engines[database_name].connect()
+                self._transactions[database_name] = conn.begin_twophase(participant_xid(self.group_id, database_name))
+            else:
+                conn = self.manager.engines[database_name].connect()
+                self._transactions[database_name] = conn.begin()
+            self.connections[database_name] = conn
+        return self.connections[database_name]
+
+    def commit(self):
+        # Одна база не требует согласования: фиксация в одну фазу
+        if self.group_id and len(self._transactions) > 1:
+            self._commit_twophase()
+            return
+        for transaction in self._transactions.values():
+            transaction.commit()
+
+    def _commit_twophase(self):
+        """Подготовка всех участников, запись решения и фиксация.
+
+        Ошибка до записи решения откатывает всех участников (через rollback единицы работы).
+        После записи решения о фиксации сбой фиксации участника не откатывает остальных:
+        остальные фиксируются, а RuntimeError называет gid неподтвержденных участников -
+        их подготовленные транзакции зафиксирует восстановление.
+        """
+        for transaction in self._transactions.values():
+            transaction.prepare()
+        coordinator = self.manager.engines[self.manager.coordinator_db]
+        if decide(coordinator, self.group_id, TPC_COMMIT) != TPC_COMMIT:
+            raise RuntimeError(f"Группа {self.group_id} откатана восстановлением до записи решения")
+
+        in_doubt = []
+        for database_name, transaction in self._transactions.items():
+            try:
+                transaction.commit()
+            except Exception as e:
+                in_doubt.append(participant_xid(self.group_id, database_name))
+                logger.error(f"Фиксация {database_name} в группе {self.group_id} не выполнена, "
+                             f"транзакцию завершит восстановление: {e}")
+        if in_doubt:
+            # Решение о фиксации остается в журнале: по нему восстановление зафиксирует участников
+            raise RuntimeError(
+                f"Группа {self.group_id} зафиксирована не полностью, подготовленные транзакции {', '.join(in_doubt)} "
+                f"завершит восстановление (python recover_transactions.py)"
+            )
+        forget(coordinator, [self.group_id])
+
+    def rollback(self):
+        for transaction in self._transactions.values():
+            if transaction.is_active:
+                transaction.rollback()
+
+    def close(self):
+        for database_name, conn in self.connections.items():
+            if database_name not in self._injected:
+                conn.close()
+        self.connections.clear()
+        self._transactions.clear()
+
 
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, branches=None, test_run_id=None, metrics=None):
+        self.branches = branches if branches is not None else Config.get_branches()
+        # Вставки соединений тестового прогона регистрируются для точечной очистки
+        self.test_run_id = test_run_id or Config.TEST_RUN_ID
+        self.metrics = metrics if metrics is not None else get_registry()
+        self.retry = RetryExecutor(self.metrics)
         self.engines = {}
         self.sessions = {}
+        self.allocators = {}
+        self._change_tracking_ready = set()
+        self._conflict_log_ready = set()
+        self._decision_log_ready = False
+        self._local = threading.local()
         self._setup_databases()
 
     def _setup_databases(self):
-        """Настройка подключений к обеим базам"""
-        databases = {
-            'filial1': Config.get_db_url(Config.DB_FILIAL1),
-            'filial2': Config.get_db_url(Config.DB_FILIAL2)
-        }
-
-        for name, url in databases.items():
+        """Настройка подключений ко всем базам реестра филиалов"""
+        for name, branch in self.branches.items():
+            url = Config.get_db_url(branch)
             try:
-                engine = create_engine(url)
+                options = Config.get_engine_options(self.test_run_id)
+                if self.metrics.enabled:
+                    options['poolclass'] = TimedQueuePool
+                engine = create_engine(url, **options)
+                self.metrics.instrument_engine(engine, name)
 
-                # Тестируем подключение
+                # Тестируем подключение; триггеры истории и реестр тестовых записей
+                # устанавливает только миграция
                 with engine.connect() as conn:
-                    conn.execute(text("SELECT 1"))
+                    conn.execute(PING_SQL)
+                    if not conn.execute(HISTORY_TRACKING_INSTALLED_SQL).scalar():
+                        logger.warning(
+                            f"Триггеры истории не установлены в {name}: примените миграции (python migrations.py)"
+                        )
+                    if self.test_run_id and not conn.execute(REGISTRY_INSTALLED_SQL).scalar():
+                        logger.warning(
+                            f"Реестр тестовых записей не установлен в {name}: вставки прогона не регистрируются "
+                            f"до применения миграций (python migrations.py)"
+                        )
 
                 self.engines[name] = engine
                 self.sessions[name] = sessionmaker(bind=engine)
+                self.allocators[name] = EmplcodeAllocator(engine, block_size=Config.EMPLCODE_BLOCK_SIZE)
                 logger.info(f"Успешное подключение к {name}")
 
             except Exception as e:
                 logger.error(f"Ошибка подключения к {name}: {e}")
                 raise
 
+    @property
+    def coordinator_db(self):
+        """База с журналом решений согласованной фиксации"""
+        return next(iter(self.engines))
+
+    def _require_decision_log(self):
+        """Проверка, что журнал решений координатора создан миграцией 0007_tpc_decisions (migrations.py)"""
+        if self._decision_log_ready:
+            return
+        with self.engines[self.coordinator_db].connect() as conn:
+            installed = conn.execute(DECISION_LOG_INSTALLED_SQL).scalar()
+        if not installed:
+            raise RuntimeError(
+                f"Журнал решений согласованной фиксации не создан в {self.coordinator_db}: "
+                f"примените миграции (python migrations.py)"
+            )
+        self._decision_log_ready = True
+
+    def recover_in_doubt(self, grace=None):
+        """Завершение подготовленных транзакций, оставленных упавшим координатором.
+
+        Транзакции моложе grace секунд (по умолчанию Config.TPC_RECOVERY_GRACE) не трогаются:
+        их может завершать работающий координатор. Возвращает число зафиксированных
+        и откатанных транзакций. Менеджер не вызывает восстановление при создании:
+        его выполняет sync_all_branches перед проходом и оператор (python recover_transactions.py).
+        """
+        self._require_decision_log()
+        grace = Config.TPC_RECOVERY_GRACE if grace is None else grace
+        recovered = recover_in_doubt(self.engines, self.engines[self.coordinator_db], grace)
+        if any(recovered.values()):
+            logger.warning(f"Восстановлены подготовленные транзакции: {recovered}")
+        return recovered
+
+    def _filial_number(self, database_name):
+        """Номер филиала, которому принадлежит база"""
+        if database_name not in self.branches:
+            raise ValueError(f"База данных {database_name} не настроена")
+        return self.branches[database_name]['filial']
+
+    @contextmanager
+    def unit_of_work(self, connections=None, rollback_only=False, twophase=False):
+        """Единица работы: все операции внутри блока переиспользуют по одному соединению на базу.
+
+        connections - уже открытые соединения {база: Connection}, которые должны использовать
+        операции менеджера. С rollback_only изменения откатываются при выходе из блока
+        (изоляция тестов). С twophase изменения всех баз фиксируются согласованно
+        подготовленными транзакциями. Вложенный вызов присоединяется к внешней единице работы.
+        """
+        if getattr(self._local, 'uow', None) is not None:
+            yield self._local.uow
+            return
+        if twophase and connections:
+            raise ValueError("Согласованная фиксация невозможна на переданных извне соединениях")
+        if twophase:
+            self._require_decision_log()
+
+        uow = UnitOfWork(self, connections, twophase=twophase)
+        self._local.uow = uow
+        try:
+            yield uow
+            if rollback_only:
+                uow.rollback()
+            else:
+                uow.commit()
+        except Exception:
+            uow.rollback()
+            raise
+        finally:
+            self._local.uow = None
+            uow.close()
+
     def get_session(self, database_name):
         """Получить сессию для указанной базы"""
         if database_name not in self.sessions:
             raise ValueError(f"База данных {database_name} не настроена")
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            # Внутри единицы работы сессия работает в точке сохранения закрепленного соединения
+            return self.sessions[database_name](
+                bind=uow.connection(database_name), join_transaction_mode='create_savepoint'
+            )
         return self.sessions[database_name]()
 
+    @contextmanager
+    def connection_scope(self, database_name):
+        """Соединение с транзакцией: фиксация при выходе из блока, откат при ошибке"""
+        uow = getattr(self._local, 'uow', None)
+        if uow is not None:
+            conn = uow.connection(database_name)
+            with conn.begin_nested():
+                yield conn
+            return
+
+        with self.engines[database_name].begin() as conn:
+            yield conn
+
+    def _with_retries(self, func, *args, operation='', database=''):
+        """Вызов func с повторами после временных ошибок базы.
+
+        Внутри единицы работы вызов выполняется один раз: ошибка сериализации или потеря
+        соединения прерывает всю внешнюю транзакцию, повторять нужно единицу работы целиком.
+        """
+        if getattr(self._local, 'uow', None) is not None:
+            return func(*args)
+        return self.retry.call(func, *args, operation=operation, database=database)
+
     def execute_function(self, database_name, function_name, *args):
         """Выполнить функцию в базе данных"""
-        session = self.get_session(database_name)
-        try:
-            if args:
-                result = session.execute(text(f"SELECT {function_name}({','.join(['%s'] * len(args))})"), args)
-            else:
-                result = session.execute(text(f"SELECT {function_name}()"))
+        with self.metrics.operation('execute_function', database_name) as op:
+            session = self.get_session(database_name)
+            try:
+                result = session.execute(function_call(function_name, len(args)), function_params(args))
 
-            return result.fetchall()
-        finally:
-            session.close()
+                rows = result.fetchall()
+                op.rows = len(rows)
+                return rows
+            finally:
+                session.close()
+
+    def stream_query(self, database_name, statement, params=None, batch_size=SYNC_BATCH_SIZE):
+        """Потоковое чтение запроса пачками строк через серверный курсор.
+
+        Генератор: соединение и транзакция удерживаются, пока потребитель читает пачки,
+        в памяти одновременно находится не больше одной пачки.
+        """
+        if database_name not in self.engines:
+            raise ValueError(f"База данных {database_name} не настроена")
+        if isinstance(statement, str):
+            statement = text(statement)
+        with self.connection_scope(database_name) as conn:
+            yield from stream_partitions(conn, statement, params, batch_size)
 
     def safe_synchronize_employee(self, source_db, target_db, passport):
-        """Безопасная синхронизация сотрудника по паспорту - только если его нет в целевой базе"""
+        """Безопасная синхронизация сотрудника по паспорту - только если его нет в целевой базе.
+
+        Временные ошибки базы (конкуренция, потеря соединения) повторяются с задержкой,
+        после исчерпания попыток и при постоянной ошибке возвращается False.
+        """
+        with self.metrics.operation('safe_synchronize_employee', target_db) as op:
+            try:
+                return self._with_retries(
+                    self._synchronize_employee_once, source_db, target_db, passport, op,
+                    operation='safe_synchronize_employee', database=target_db
+                )
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации сотрудника {passport}: {e}")
+                op.outcome = OUTCOME_ERROR
+                return False
+
+    def _synchronize_employee_once(self, source_db, target_db, passport, op):
+        """Одна попытка синхронизации сотрудника; ошибка откатывает попытку и пробрасывается"""
         source_session = self.get_session(source_db)
         target_session = self.get_session(target_db)
 
         try:
             # Определяем целевой филиал для более точной проверки
-            target_filial = 2 if target_db == 'filial2' else 1
+            target_filial = self._filial_number(target_db)
 
             # Проверяем, есть ли уже сотрудник в целевой базе с таким паспортом И филиалом
-            target_exists = target_session.execute(
-                text("SELECT COUNT(*) FROM employee WHERE passport = :passport AND filial = :filial"),
+            target_conn = target_session.connection()
+            target_exists = SYNC_QUERIES.execute(
+                target_conn, 'target_exists',
                 {'passport': passport, 'filial': target_filial}
             ).scalar()
 
+            source_filial = self._filial_number(source_db)
             if target_exists > 0:
-                logger.info(f"Сотрудник с паспортом {passport} уже существует в {target_db} (филиал {target_filial})")
+                # Сотрудник уже есть: переносятся только недостающие записи его истории
+                carried = carry_employee_history_deltas(source_session, target_session, passport,
+                                                        source_filial, target_filial)
+                target_session.commit()
+                logger.info(
+                    f"Сотрудник с паспортом {passport} уже существует в {target_db} (филиал {target_filial}), "
+                    f"перенесено записей истории: {carried}"
+                )
+                op.outcome = OUTCOME_SKIPPED
                 return False
 
             # Получаем данные сотрудника из source базы
-            source_filial = 1 if source_db == 'filial1' else 2
-            employee_data = source_session.execute(
-                text("""
-                    SELECT name, surname, patronymic, birthday, passport, poscode, status
-                    FROM employee 
-                    WHERE passport = :passport AND filial = :filial AND status = 'Active'
-                """),
+            employee_data = SYNC_QUERIES.execute(
+                source_session.connection(), 'source_active_employee',
                 {'passport': passport, 'filial': source_filial}
             ).fetchone()
 
             if not employee_data:
                 logger.warning(
                     f"Активный сотрудник с паспортом {passport} не найден в {source_db} (филиал {source_filial})")
+                op.outcome = OUTCOME_SKIPPED
                 return False
 
-            # Генерируем новый emplcode для целевой базы
-            max_code_result = target_session.execute(
-                text("SELECT COALESCE(MAX(emplcode), 0) FROM employee")
-            )
-            new_emplcode = max_code_result.scalar() + 1
-
-            # Вставляем сотрудника в целевую базу
-            target_session.execute(
-                text("""
-                    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
-                    VALUES (:emplcode, :name, :surname, :patronymic, :birthday, :passport, :poscode, :filial, :status)
-                """),
+            # Берем новый emplcode из зарезервированного блока целевой базы
+            new_emplcode = self.allocators[target_db].next_code()
+
+            # Вставляем сотрудника в целевую базу: вместо записи о приеме переносится его история
+            target_conn.execute(CARRY_HISTORY_SQL)
+            SYNC_QUERIES.execute(
+                target_conn, 'insert_employee',
                 {
                     'emplcode': new_emplcode,
                     'name': employee_data.name,
@@ -113,104 +593,713 @@ class DatabaseManager:
                     'status': employee_data.status
                 }
             )
+            carry_employee_history(source_session, target_session, passport, source_filial, new_emplcode)
+            target_session.execute(FINISH_CARRYING_SQL)
 
             target_session.commit()
+            op.rows = 1
             logger.info(f"Сотрудник {passport} синхронизирован из {source_db} в {target_db} с кодом {new_emplcode}")
             return True
 
-        except Exception as e:
+        except Exception:
             target_session.rollback()
-            logger.error(f"Ошибка синхронизации сотрудника {passport}: {e}")
-            return False
+            raise
         finally:
             source_session.close()
             target_session.close()
 
+    def _load_sync_candidates(self, source_conn, target_conn, source_statement, source_params, batch_size):
+        """Потоковое чтение сотрудников источника во временную таблицу sync_candidates целевой базы.
+
+        Пачки источника без промежуточных списков уходят в один COPY FROM STDIN.
+        """
+        target_conn.execute(text(';'.join(PREPARE_CANDIDATES_SQL + PREPARE_CANDIDATES_STAGING_SQL)))
+
+        partitions = stream_partitions(source_conn, source_statement, source_params, batch_size)
+        rows = (
+            tuple(getattr(row, column) for column in EMPLOYEE_SYNC_COLUMNS)
+            for partition in partitions for row in partition
+        )
+        copy_rows(target_conn, 'sync_candidates_staging', EMPLOYEE_SYNC_COLUMNS, rows)
+        target_conn.execute(MERGE_CANDIDATES_STAGING_SQL)
+
+    def _insert_missing_candidates(self, target_conn, target_db):
+        """Вставка активных кандидатов, которых нет в целевом филиале.
+
+        Возвращает (существующие, вставленные, диапазон выданных кодов).
+        """
+        target_filial = self._filial_number(target_db)
+
+        existing = target_conn.execute(EXISTING_CANDIDATES_SQL, {'filial': target_filial}).scalars().all()
+
+        pending_count = target_conn.execute(PENDING_CANDIDATES_SQL, {'filial': target_filial}).scalar()
+        codes = self.allocators[target_db].reserve_range(pending_count)
+
+        inserted = target_conn.execute(INSERT_MISSING_CANDIDATES_SQL, {'base_code': codes.start - 1, 'filial': target_filial}).scalars().all()
+
+        return existing, inserted, codes
+
+    def _apply_missing_candidates(self, target_conn, target_db):
+        """Вставка активных кандидатов, которых нет в целевом филиале.
+
+        Возвращает (число вставленных, диапазон выданных кодов).
+
+        В отличие от _insert_missing_candidates не собирает списки паспортов, поэтому
+        память не растет вместе с размером филиала.
+        """
+        target_filial = self._filial_number(target_db)
+
+        pending_count = target_conn.execute(PENDING_CANDIDATES_SQL, {'filial': target_filial}).scalar()
+        if not pending_count:
+            return 0, range(0)
+        codes = self.allocators[target_db].reserve_range(pending_count)
+
+        inserted = target_conn.execute(
+            APPLY_MISSING_CANDIDATES_SQL, {'base_code': codes.start - 1, 'filial': target_filial}
+        ).rowcount
+        return inserted, codes
+
+    def _existing_candidates(self, target_conn, target_filial, codes, batch_size=HISTORY_BATCH_SIZE):
+        """Паспорта кандидатов, которые уже были в целевом филиале, пачками по batch_size"""
+        after = ''
+        while True:
+            passports = target_conn.execute(EXISTING_CANDIDATES_PAGE_SQL, {
+                'filial': target_filial, 'first_code': codes.start, 'last_code': codes.stop - 1,
+                'after': after, 'limit': batch_size
+            }).scalars().all()
+            yield from passports
+            if len(passports) < batch_size:
+                return
+            after = passports[-1]
+
+    def _history_passport_batches(self, target_conn, target_filial, codes, existing, batch_size):
+        """Пачки паспортов для выгрузки истории: новые сотрудники по диапазону кодов, затем существующие"""
+        for first_code in range(codes.start, codes.stop, batch_size):
+            yield target_conn.execute(NEW_EMPLOYEE_PASSPORTS_SQL, {
+                'filial': target_filial, 'first_code': first_code,
+                'last_code': min(first_code + batch_size, codes.stop) - 1
+            }).scalars().all()
+        existing = iter(existing)
+        while True:
+            passports = list(islice(existing, batch_size))
+            if not passports:
+                return
+            yield passports
+
+    def _carry_history(self, source_conn, target_conn, source_db, target_db, codes, existing=(),
+                       batch_size=HISTORY_BATCH_SIZE):
+        """Перенос истории источника сотрудникам целевой базы.
+
+        Сотрудники, только что вставленные с кодами из codes, получают всю историю источника,
+        сотрудники из existing (паспорта), которые уже были в целевом филиале, - только
+        недостающие записи о переводах, сменах фамилии, увольнениях и восстановлениях.
+        Паспорта читаются пачками, история каждой пачки выгружается из источника через
+        COPY TO STDOUT и загружается во временную таблицу через COPY FROM STDIN, а в emplhistory
+        переносится одной вставкой на каждую группу с сохранением порядка записей каждого сотрудника.
+        Возвращает число перенесенных записей.
+        """
+        source_filial = self._filial_number(source_db)
+        target_filial = self._filial_number(target_db)
+
+        loaded = False
+        for passports in self._history_passport_batches(target_conn, target_filial, codes, existing, batch_size):
+            if not passports:
+                continue
+            if not loaded:
+                target_conn.execute(text(';'.join(PREPARE_HISTORY_SQL)))
+                loaded = True
+            copy_query(source_conn, target_conn, SOURCE_HISTORY_SQL,
+                       {'filial': source_filial, 'passports': passports}, 'sync_history', HISTORY_COLUMNS)
+        if not loaded:
+            return 0
+
+        params = {'filial': target_filial, 'first_code': codes.start, 'last_code': codes.stop - 1}
+        carried = target_conn.execute(APPLY_HISTORY_SQL, params).rowcount if codes else 0
+        return carried + target_conn.execute(APPLY_HISTORY_DELTAS_SQL, params).rowcount
+
+    def bulk_load_employees(self, database_name, employees):
+        """Массовая загрузка сотрудников через COPY FROM STDIN и слияние в employee.
+
+        employees - итерируемый набор словарей с полями employee, читается потоком.
+        Сотрудники, чей паспорт уже есть в их филиале или чей emplcode занят, пропускаются.
+        Возвращает число вставленных сотрудников.
+        """
+        try:
+            with self.connection_scope(database_name) as conn:
+                copied, inserted = copy_employees(conn, employees)
+        except Exception as e:
+            logger.error(f"Ошибка массовой загрузки сотрудников в {database_name}: {e}")
+            raise
+
+        logger.info(f"Массовая загрузка в {database_name}: загружено {copied}, вставлено {inserted}")
+        return inserted
+
+    def bulk_synchronize_employees(self, source_db, target_db, passports=None, batch_size=SYNC_BATCH_SIZE):
+        """Пакетная синхронизация новых сотрудников из source в target.
+
+        Все активные сотрудники источника читаются одним потоковым запросом, загружаются
+        во временную таблицу целевой базы пачками, а отсутствующие в целевом филиале
+        вставляются одним INSERT ... SELECT с анти-соединением.
+        Возвращает словарь {паспорт: SYNC_INSERTED | SYNC_EXISTS | SYNC_NOT_FOUND}.
+        """
+        source_filial = self._filial_number(source_db)
+        target_filial = self._filial_number(target_db)
+        outcomes = {}
+
+        source_query = SOURCE_CANDIDATES_QUERY
+        source_params = {'filial': source_filial}
+        if passports is not None:
+            passports = list(passports)
+            outcomes = {passport: SYNC_NOT_FOUND for passport in passports}
+            if not passports:
+                return outcomes
+            source_query += " AND passport IN :passports"
+            source_params['passports'] = passports
+
+        source_statement = text(source_query)
+        if passports is not None:
+            source_statement = source_statement.bindparams(bindparam('passports', expanding=True))
+
+        with self.metrics.operation('bulk_synchronize_employees', target_db) as op:
+            try:
+                with self.connection_scope(source_db) as source_conn, self.connection_scope(target_db) as target_conn:
+                    self._load_sync_candidates(source_conn, target_conn, source_statement, source_params, batch_size)
+                    target_conn.execute(SET_ORIGIN_SQL, {'origin': source_db})
+                    target_conn.execute(CARRY_HISTORY_SQL)
+                    existing, inserted, codes = self._insert_missing_candidates(target_conn, target_db)
+                    self._carry_history(source_conn, target_conn, source_db, target_db, codes, existing)
+                    target_conn.execute(FINISH_CARRYING_SQL)
+                    target_conn.execute(FINISH_APPLYING_SQL)
+            except Exception as e:
+                logger.error(f"Ошибка пакетной синхронизации из {source_db} в {target_db}: {e}")
+                raise
+            op.rows = len(inserted)
+
+        outcomes.update({passport: SYNC_EXISTS for passport in existing})
+        outcomes.update({passport: SYNC_INSERTED for passport in inserted})
+
+        logger.info(
+            f"Пакетная синхронизация {source_db} -> {target_db}: добавлено {len(inserted)}, "
+            f"уже существуют {len(existing)}"
+        )
+        return outcomes
+
+    def resilient_synchronize_employees(self, source_db, target_db, passports, batch_size=SYNC_BATCH_SIZE):
+        """Пакетная синхронизация паспортов отдельными транзакциями по batch_size с повторами.
+
+        Пачка, прерванная временной ошибкой, повторяется: после ошибки конкуренции - по
+        половинам, а следующие пачки уменьшаются; успешные пачки повторно не выполняются.
+        Возвращает словарь как bulk_synchronize_employees, паспорта пачек, не выполненных
+        за все попытки, получают SYNC_FAILED.
+        """
+        if getattr(self._local, 'uow', None) is not None:
+            return self.bulk_synchronize_employees(source_db, target_db, passports, batch_size)
+
+        outcomes, failed = self.retry.run_batches(
+            passports,
+            lambda batch: self.bulk_synchronize_employees(source_db, target_db, batch, batch_size),
+            batch_size, operation='bulk_synchronize_employees', database=target_db
+        )
+        outcomes.update({passport: SYNC_FAILED for passport in failed})
+        if failed:
+            logger.error(f"Синхронизация {source_db} -> {target_db}: не выполнено {len(failed)} паспортов")
+        return outcomes
+
+    def _require_change_tracking(self, database_name):
+        """Проверка, что журнал изменений установлен миграцией (migrations.py).
+
+        Журнал не устанавливается на ходу: DDL триггеров ждал бы блокировок employee,
+        удерживаемых транзакцией вызывающего, а изменения до установки в журнал не попали бы.
+        """
+        if database_name in self._change_tracking_ready:
+            return
+        with self.engines[database_name].connect() as conn:
+            installed = conn.execute(CHANGE_TRACKING_INSTALLED_SQL).scalar()
+        if not installed:
+            raise RuntimeError(
+                f"Журнал изменений не установлен в {database_name}: примените миграции (python migrations.py)"
+            )
+        self._change_tracking_ready.add(database_name)
+
+    def _require_test_registry(self, database_name):
+        """Проверка, что реестр тестовых записей установлен миграцией 0006_test_registry.
+
+        Реестр не устанавливается на ходу: пересоздание триггера на employee ждало бы
+        блокировок работающих с таблицей транзакций.
+        """
+        with self.engines[database_name].connect() as conn:
+            installed = conn.execute(REGISTRY_INSTALLED_SQL).scalar()
+        if not installed:
+            raise RuntimeError(
+                f"Реестр тестовых записей не установлен в {database_name}: примените миграции (python migrations.py)"
+            )
+
+    def sync_incremental(self, source_db, target_db, batch_size=SYNC_BATCH_SIZE):
+        """Инкрементальная синхронизация source -> target по журналу изменений.
+
+        Читаются только сотрудники источника, измененные после водяного знака направления:
+        новые активные сотрудники добавляются, статусы существующих обновляются.
+        Первый запуск выполняет полный проход. Водяной знак сдвигается в той же
+        транзакции целевой базы, что и примененные изменения.
+        Возвращает словарь со счетчиками и новым водяным знаком.
+        """
+        self._require_change_tracking(source_db)
+        self._require_change_tracking(target_db)
+        source_filial = self._filial_number(source_db)
+        target_filial = self._filial_number(target_db)
+
+        with self.metrics.operation('sync_incremental', target_db) as op:
+            try:
+                with self.connection_scope(source_db) as source_conn, self.connection_scope(target_db) as target_conn:
+                    low_txid = get_watermark(target_conn, source_db, target_db)
+                    upper_txid = source_conn.execute(SAFE_UPPER_TXID_SQL).scalar()
+
+                    source_query = """
+                        SELECT name, surname, patronymic, birthday, passport, poscode, status
+                        FROM employee e
+                        WHERE e.filial = :filial
+                    """
+                    source_params = {'filial': source_filial}
+                    if low_txid is not None:
+                        # Изменения, пришедшие в источник из целевой базы, обратно не отправляются
+                        source_query += """
+                            AND e.emplcode IN (
+                                SELECT emplcode FROM employee_changelog
+                                WHERE txid >= :low_txid AND txid < :upper_txid
+                                AND origin IS DISTINCT FROM :target_db
+                            )
+                        """
+                        source_params.update({'low_txid': low_txid, 'upper_txid': upper_txid, 'target_db': target_db})
+
+                    self._load_sync_candidates(source_conn, target_conn, text(source_query), source_params, batch_size)
+                    target_conn.execute(SET_ORIGIN_SQL, {'origin': source_db})
+                    # Новые сотрудники получают историю источника, существующие - недостающие
+                    # записи о событиях источника, включая изменения статусов: триггер их не пишет
+                    target_conn.execute(CARRY_HISTORY_SQL)
+                    inserted, codes = self._apply_missing_candidates(target_conn, target_db)
+                    updated = target_conn.execute(APPLY_CANDIDATE_STATUSES_SQL, {'filial': target_filial}).rowcount
+                    existing = self._existing_candidates(target_conn, target_filial, codes)
+                    self._carry_history(source_conn, target_conn, source_db, target_db, codes, existing)
+                    target_conn.execute(FINISH_CARRYING_SQL)
+
+                    set_watermark(target_conn, source_db, target_db, upper_txid)
+                    target_conn.execute(FINISH_APPLYING_SQL)
+            except Exception as e:
+                logger.error(f"Ошибка инкрементальной синхронизации из {source_db} в {target_db}: {e}")
+                raise
+            op.rows = inserted + updated
+
+        logger.info(
+            f"Инкрементальная синхронизация {source_db} -> {target_db}: добавлено {inserted}, "
+            f"обновлено статусов {updated}, водяной знак {upper_txid}"
+        )
+        return {
+            'inserted': inserted,
+            'updated': updated,
+            'full_scan': low_txid is None,
+            'watermark': upper_txid
+        }
+
+    def sync_all_branches(self, hub=None, operation=None, max_workers=None, branch_limit=None):
+        """Синхронизация всех филиалов реестра параллельным планировщиком.
+
+        Без hub синхронизируются все упорядоченные пары филиалов, с hub - схема
+        "звезда" через центральный филиал. По умолчанию каждое направление
+        выполняется sync_incremental. Перед проходом завершаются подготовленные транзакции,
+        оставленные упавшим координатором. Возвращает {(source, target): SyncTaskResult}.
+        """
+        # Подготовленные транзакции держат блокировки строк, которые нужны проходу
+        self.recover_in_doubt()
+        branch_names = list(self.engines)
+        tasks = plan_hub_and_spoke(hub, branch_names) if hub else plan_pairwise(branch_names)
+        scheduler = SyncScheduler(self, operation=operation, max_workers=max_workers, branch_limit=branch_limit)
+        return scheduler.run(tasks)
+
     def safe_synchronize_dismissal(self, source_db, target_db, passport):
-        """Безопасная синхронизация увольнения"""
+        """Безопасная синхронизация увольнения.
+
+        Временные ошибки базы повторяются с задержкой, после исчерпания попыток
+        и при постоянной ошибке возвращается False.
+        """
+        with self.metrics.operation('safe_synchronize_dismissal', target_db) as op:
+            try:
+                return self._with_retries(
+                    self._synchronize_dismissal_once, source_db, target_db, passport, op,
+                    operation='safe_synchronize_dismissal', database=target_db
+                )
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации увольнения для {passport}: {e}")
+                op.outcome = OUTCOME_ERROR
+                return False
+
+    def _synchronize_dismissal_once(self, source_db, target_db, passport, op):
+        """Одна попытка синхронизации увольнения; ошибка откатывает попытку и пробрасывается"""
         source_session = self.get_session(source_db)
         target_session = self.get_session(target_db)
 
         try:
-            # Получаем статус из source базы
-            status_result = source_session.execute(
-                text("SELECT status FROM employee WHERE passport = :passport"),
-                {'passport': passport}
+            # Получаем статус сотрудника филиала-источника
+            status_result = SYNC_QUERIES.execute(
+                source_session.connection(), 'source_status',
+                {'passport': passport, 'filial': self._filial_number(source_db)}
             )
 
             source_status = status_result.scalar()
 
             if not source_status:
                 logger.warning(f"Сотрудник с паспортом {passport} не найден в {source_db}")
+                op.outcome = OUTCOME_SKIPPED
                 return False
 
-            # Обновляем статус в целевой базе
-            result = target_session.execute(
-                text("UPDATE employee SET status = :status WHERE passport = :passport"),
-                {'status': source_status, 'passport': passport}
+            # Обновляем статус сотрудника целевого филиала: запись об увольнении
+            # переносится из истории источника, а не пишется триггером повторно
+            target_filial = self._filial_number(target_db)
+            target_conn = target_session.connection()
+            target_conn.execute(CARRY_HISTORY_SQL)
+            result = SYNC_QUERIES.execute(
+                target_conn, 'update_status',
+                {'status': source_status, 'passport': passport, 'filial': target_filial}
             )
 
             updated_count = result.rowcount
+            if updated_count > 0:
+                carry_employee_history_deltas(source_session, target_session, passport,
+                                              self._filial_number(source_db), target_filial)
+            target_conn.execute(FINISH_CARRYING_SQL)
             target_session.commit()
+            op.rows = updated_count
 
             if updated_count > 0:
                 logger.info(f"Статус сотрудника {passport} обновлен в {target_db}: {source_status}")
                 return True
             else:
                 logger.warning(f"Сотрудник с паспортом {passport} не найден в {target_db} для обновления статуса")
+                op.outcome = OUTCOME_SKIPPED
                 return False
 
-        except Exception as e:
+        except Exception:
             target_session.rollback()
-            logger.error(f"Ошибка синхронизации увольнения для {passport}: {e}")
-            return False
+            raise
         finally:
             source_session.close()
             target_session.close()
 
-    def cleanup_test_data(self):
-        """Очистка тестовых данных в обеих базах"""
-        for db_name in ['filial1', 'filial2']:
-            session = self.get_session(db_name)
+    def bulk_synchronize_dismissals(self, source_db, target_db, since=None, batch_size=SYNC_BATCH_SIZE):
+        """Пакетная синхронизация статусов сотрудников из source в target.
+
+        Статусы сотрудников филиала-источника (с since - только измененных после этого
+        момента по журналу изменений) потоком загружаются во временную таблицу целевой
+        базы и применяются одним UPDATE ... FROM.
+        Возвращает словарь: 'updated' - число измененных строк, 'updated_passports',
+        'unmatched' - паспорта, которых нет в целевом филиале.
+        """
+        source_filial = self._filial_number(source_db)
+        target_filial = self._filial_number(target_db)
+
+        source_query = SOURCE_STATUSES_QUERY
+        source_params = {'filial': source_filial}
+        if since is not None:
+            self._require_change_tracking(source_db)
+            source_query += """
+                AND e.emplcode IN (
+                    SELECT emplcode FROM employee_changelog
+                    WHERE changedate >= :since AND origin IS DISTINCT FROM :target_db
+                )
+            """
+            source_params.update({'since': since, 'target_db': target_db})
+
+        with self.metrics.operation('bulk_synchronize_dismissals', target_db) as op:
             try:
-                # Сначала удаляем данные из зависимых таблиц по emplcode
-                session.execute(text("""
-                    DELETE FROM conflist 
-                    WHERE emplcode >= 5000 
-                    OR errlist LIKE '%TEST%'
-                """))
-
-                session.execute(text("""
-                    DELETE FROM emplhistory 
-                    WHERE emplcode >= 5000 
-                """))
-
-                # Затем удаляем сотрудников
-                session.execute(text("""
-                    DELETE FROM employee 
-                    WHERE emplcode >= 5000 
-                    OR passport LIKE '600%600%0'
-                """))
-
-                session.commit()
-                logger.info(f"Тестовые данные очищены в {db_name}")
-
-                # Проверяем, что данные действительно удалены
-                remaining_count = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE emplcode >= 5000 OR passport LIKE '600%600%0'")
-                ).scalar()
-
-                if remaining_count > 0:
-                    logger.warning(f"В {db_name} осталось {remaining_count} тестовых записей")
+                with self.connection_scope(source_db) as source_conn, self.connection_scope(target_db) as target_conn:
+                    target_conn.execute(text(';'.join(PREPARE_STATUSES_SQL)))
+                    target_conn.execute(SET_ORIGIN_SQL, {'origin': source_db})
+
+                    partitions = stream_partitions(source_conn, text(source_query), source_params, batch_size)
+                    for columns in column_batches(partitions, ('passport', 'status')):
+                        target_conn.execute(INSERT_STATUSES_SQL, columns)
 
+                    # Записи об увольнениях переносятся из истории источника
+                    target_conn.execute(CARRY_HISTORY_SQL)
+                    updated = target_conn.execute(APPLY_STATUSES_SQL, {'filial': target_filial}).scalars().all()
+                    self._carry_history(source_conn, target_conn, source_db, target_db, range(0), updated)
+                    target_conn.execute(FINISH_CARRYING_SQL)
+                    unmatched = target_conn.execute(UNMATCHED_STATUSES_SQL, {'filial': target_filial}).scalars().all()
+                    target_conn.execute(FINISH_APPLYING_SQL)
             except Exception as e:
-                session.rollback()
-                logger.error(f"Ошибка при очистке данных в {db_name}: {e}")
-                # Не прерываем выполнение, просто логируем ошибку
-            finally:
-                session.close()
+                logger.error(f"Ошибка пакетной синхронизации статусов из {source_db} в {target_db}: {e}")
+                raise
+            op.rows = len(updated)
+
+        logger.info(
+            f"Пакетная синхронизация статусов {source_db} -> {target_db}: обновлено {len(updated)}, "
+            f"не найдено в целевом филиале {len(unmatched)}"
+        )
+        return {
+            'updated': len(updated),
+            'updated_passports': updated,
+            'unmatched': unmatched
+        }
+
+    def _require_conflict_log(self, database_name):
+        """Проверка, что журнал конфликтов обновлен миграцией 0002_conflict_log (migrations.py).
+
+        Журнал не обновляется на ходу: ALTER TABLE conflist ждал бы блокировок,
+        удерживаемых открытой транзакцией вызывающего.
+        """
+        if database_name in self._conflict_log_ready:
+            return
+        with self.engines[database_name].connect() as conn:
+            installed = conn.execute(CONFLICT_LOG_INSTALLED_SQL).scalar()
+        if not installed:
+            raise RuntimeError(
+                f"Журнал конфликтов не обновлен в {database_name}: примените миграции (python migrations.py)"
+            )
+        self._conflict_log_ready.add(database_name)
+
+    def _log_conflicts(self, conn, matches, other_filial):
+        """Запись найденных пар в журнал конфликтов одной пачкой"""
+        if not matches:
+            return 0
+        return conn.execute(INSERT_CONFLICTS_SQL, {
+            'emplcode': [match['emplcode'] for match in matches],
+            'other_emplcode': [match['other_emplcode'] for match in matches],
+            'conflict_type': [match['conflict_type'] for match in matches],
+            'matched_fields': [match['matched_fields'] for match in matches],
+            'errlist': [
+                describe_conflict(match['full_name'], match['other_full_name'], match['other_emplcode'],
+                                  other_filial, match['matched_fields'])
+                for match in matches
+            ],
+            'other_filial': other_filial
+        }).rowcount
+
+    def detect_conflicts(self, source_db, target_db, include_full_matches=False, batch_size=SYNC_BATCH_SIZE):
+        """Поиск конфликтов между сотрудниками двух филиалов.
+
+        Отпечатки сотрудников source (паспорт, хеш ФИО, дата рождения) потоком загружаются во
+        временную таблицу target, пары с совпадением 2 из 3 и 3 из 3 параметров находятся
+        хеш-соединениями по трем составным ключам блокировки. Конфликт записывается в журнал
+        обеих баз со ссылкой на сотрудника другого филиала. Полные совпадения - это один
+        и тот же сотрудник, в журнал они попадают только с include_full_matches.
+        Возвращает словарь со счетчиками совпадений и записанных конфликтов.
+        """
+        source_filial = self._filial_number(source_db)
+        target_filial = self._filial_number(target_db)
+        self._require_conflict_log(source_db)
+        self._require_conflict_log(target_db)
+
+        logged_types = [CONFLICT_PARTIAL_MATCH]
+        if include_full_matches:
+            logged_types.append(CONFLICT_FULL_MATCH)
+
+        try:
+            with self.connection_scope(source_db) as source_conn, self.connection_scope(target_db) as target_conn:
+                target_conn.execute(text(';'.join(PREPARE_FINGERPRINTS_SQL)))
+
+                partitions = stream_partitions(source_conn, SOURCE_FINGERPRINTS_QUERY, {'filial': source_filial}, batch_size)
+                for columns in column_batches(partitions, ('emplcode', 'passport', 'fio_key', 'birthday', 'full_name')):
+                    target_conn.execute(INSERT_FINGERPRINTS_SQL, columns)
+
+                target_conn.execute(FIND_MATCHES_SQL, {'filial': target_filial})
+                counts = dict(target_conn.execute(MATCH_COUNTS_SQL).fetchall())
+
+                matches = stream_partitions(
+                    target_conn, LOGGED_MATCHES_SQL.bindparams(bindparam('conflict_types', expanding=True)),
+                    {'conflict_types': logged_types}, batch_size
+                )
+                logged = 0
+                for rows in matches:
+                    partition = [row._mapping for row in rows]
+                    logged += self._log_conflicts(target_conn, partition, source_filial)
+                    # Зеркальная запись в базе источника: своя сторона пары и ссылка на target
+                    logged += self._log_conflicts(source_conn, [{
+                        'emplcode': match['other_emplcode'],
+                        'other_emplcode': match['emplcode'],
+                        'full_name': match['other_full_name'],
+                        'other_full_name': match['full_name'],
+                        'matched_fields': match['matched_fields'],
+                        'conflict_type': match['conflict_type']
+                    } for match in partition], target_filial)
+        except Exception as e:
+            logger.error(f"Ошибка поиска конфликтов между {source_db} и {target_db}: {e}")
+            raise
+
+        result = {
+            'full_matches': counts.get(CONFLICT_FULL_MATCH, 0),
+            'partial_matches': counts.get(CONFLICT_PARTIAL_MATCH, 0),
+            'logged': logged
+        }
+        logger.info(f"Поиск конфликтов {source_db} <-> {target_db}: {result}")
+        return result
+
+    def diff_branches(self, source_db, target_db):
+        """Сверка сотрудников source с их копиями в target по хешам корзин.
+
+        Отпечатки строк считаются на сервере, между базами передаются только хеши корзин
+        и строки корзин с расхождениями. Возвращает паспорта по видам расхождений
+        (add, update, conflict, target_only) и статистику обхода в ключе stats.
+        """
+        try:
+            with self.connection_scope(source_db) as source_conn, self.connection_scope(target_db) as target_conn:
+                delta = compare_branches(
+                    source_conn, target_conn, self._filial_number(source_db), self._filial_number(target_db)
+                )
+        except Exception as e:
+            logger.error(f"Ошибка сверки {source_db} и {target_db}: {e}")
+            raise
+
+        logger.info(
+            f"Сверка {source_db} -> {target_db}: добавить {len(delta[DIFF_ADD])}, "
+            f"обновить {len(delta[DIFF_UPDATE])}, конфликтов {len(delta[DIFF_CONFLICT])}, "
+            f"только в {target_db} {len(delta[DIFF_TARGET_ONLY])}; "
+            f"передано {delta['stats']['transferred_bytes']} байт"
+        )
+        return delta
+
+    def get_open_conflicts(self, database_name, limit=100):
+        """Неразрешенные конфликты базы, от старых к новым"""
+        self._require_conflict_log(database_name)
+        with self.connection_scope(database_name) as conn:
+            return conn.execute(OPEN_CONFLICTS_SQL, {'limit': limit}).fetchall()
+
+    def _database_for_filial(self, filial):
+        """Имя базы филиала по его номеру"""
+        for database_name, branch in self.branches.items():
+            if branch['filial'] == filial:
+                return database_name
+        raise ValueError(f"Филиал {filial} не настроен")
+
+    def resolve_conflicts(self, database_name, decisions):
+        """Применение решений экспертов по конфликтам журнала базы database_name.
+
+        decisions - пары (conflictid, действие), действие - MERGE, KEEP_BOTH или UPDATE_DATA;
+        при повторе conflictid действует последнее решение. Конфликты помечаются разрешенными
+        одним оператором, затем в базе каждого другого филиала одной транзакцией закрываются
+        зеркальные записи и по одному оператору на группу действий меняются сотрудники
+        другого филиала. Возвращает словарь: 'resolved' - число разрешенных конфликтов,
+        'actions' - число по действиям, 'propagated' - измененные и удаленные строки других филиалов,
+        'unmatched' - conflictid, которых нет среди неразрешенных.
+        """
+        decisions = dict(decisions)
+        unknown = set(decisions.values()) - set(RESOLUTION_ACTIONS)
+        if unknown:
+            raise ValueError(f"Неизвестные действия разрешения конфликтов: {sorted(unknown)}")
+        self._require_conflict_log(database_name)
+
+        with self.metrics.operation('resolve_conflicts', database_name) as op:
+            try:
+                with self.connection_scope(database_name) as conn:
+                    resolved = conn.execute(MARK_RESOLVED_SQL, {
+                        'conflictid': list(decisions), 'action': list(decisions.values())
+                    }).fetchall()
+
+                    # Решение распространяется только на конфликты со ссылкой на другой филиал
+                    by_filial = {}
+                    for row in resolved:
+                        if row.other_emplcode is not None:
+                            by_filial.setdefault(row.other_filial, []).append(row)
+
+                    propagated = 0
+                    for other_filial, rows in by_filial.items():
+                        propagated += self._propagate_resolutions(
+                            self._database_for_filial(other_filial), self._filial_number(database_name), rows
+                        )
+            except Exception as e:
+                logger.error(f"Ошибка разрешения конфликтов в {database_name}: {e}")
+                raise
+            op.rows = len(resolved)
+
+        actions = {action: 0 for action in RESOLUTION_ACTIONS}
+        for row in resolved:
+            actions[row.action] += 1
+        resolved_ids = {row.conflictid for row in resolved}
+        result = {
+            'resolved': len(resolved),
+            'actions': actions,
+            'propagated': propagated,
+            'unmatched': [conflictid for conflictid in decisions if conflictid not in resolved_ids]
+        }
+        logger.info(f"Разрешение конфликтов в {database_name}: {result}")
+        return result
+
+    def _propagate_resolutions(self, other_db, filial, rows):
+        """Применение решений к сотрудникам базы другого филиала одной транзакцией.
+
+        rows - разрешенные конфликты филиала filial со ссылками на сотрудников other_db.
+        Возвращает число измененных и удаленных строк, включая историю и конфликты
+        удаленных сотрудников.
+        """
+        other_filial = self._filial_number(other_db)
+        self._require_conflict_log(other_db)
+        with self.connection_scope(other_db) as conn:
+            conn.execute(RESOLVE_MIRRORED_SQL, {
+                'emplcode': [row.emplcode for row in rows],
+                'other_emplcode': [row.other_emplcode for row in rows],
+                'action': [row.action for row in rows],
+                'filial': filial
+            })
+            changed = 0
+            for action in RESOLUTION_ACTIONS:
+                emplcodes = sorted({row.other_emplcode for row in rows if row.action == action})
+                if not emplcodes:
+                    continue
+                for statement in APPLY_RESOLUTION_SQL[action]:
+                    changed += conn.execute(statement, {'filial': other_filial, 'emplcodes': emplcodes}).rowcount
+        return changed
+
+    def cleanup_test_data(self, run_id=None, batch_size=CLEANUP_BATCH_SIZE):
+        """Очистка записей тестового прогона во всех базах одновременно.
+
+        Удаляются только сотрудники из реестра прогона (по умолчанию текущего) и их
+        история и конфликты, пачками по batch_size в коротких транзакциях, поэтому время
+        очистки зависит от объема тестовых данных, а не от размера таблиц.
+        Возвращает {база: число удаленных сотрудников или None при ошибке}.
+        """
+        run_id = run_id or self.test_run_id
+        if not run_id:
+            logger.warning("Идентификатор тестового прогона не задан, очистка пропущена")
+            return {}
+
+        def cleanup(db_name):
+            with self.metrics.operation('cleanup_test_data', db_name) as op:
+                try:
+                    self._require_test_registry(db_name)
+                    op.rows = removed = cleanup_run(self.engines[db_name], run_id, batch_size)
+                    logger.info(f"Тестовые данные прогона {run_id} очищены в {db_name}: {removed} сотрудников")
+                    return removed
+                except Exception as e:
+                    logger.error(f"Ошибка при очистке данных в {db_name}: {e}")
+                    op.outcome = OUTCOME_ERROR
+                    # Не прерываем выполнение, просто логируем ошибку
+                    return None
+
+        with ThreadPoolExecutor(max_workers=len(self.engines)) as pool:
+            return dict(zip(self.engines, pool.map(cleanup, self.engines)))
 
     def close(self):
         """Закрыть все соединения"""
         for engine in self.engines.values():
-            engine.dispose()
\ No newline at end of file
+            engine.dispose()
+
+
+_shared_manager = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_manager():
+    """Общий для процесса менеджер: подключение и проверка баз выполняются один раз"""
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is None:
+            _shared_manager = DatabaseManager()
+        return _shared_manager
+
+
+@atexit.register
+def close_shared_manager():
+    """Закрыть общий менеджер и его пулы соединений"""
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is not None:
+            _shared_manager.close()
+            _shared_manager = None
\ No newline at end of file
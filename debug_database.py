@@ -1,51 +1,149 @@
+#!/usr/bin/env python3
 from database import DatabaseManager
 from sqlalchemy import text
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import logging
+import time
 
+logger = logging.getLogger(__name__)
 
-def check_database_state():
-    """Проверка состояния базы данных"""
+# Режимы подсчета: точный (один агрегирующий проход по employee), оценка по статистике
+# планировщика (без чтения таблиц) и автоматический выбор по размеру employee
+MODE_EXACT = 'exact'
+MODE_ESTIMATE = 'estimate'
+MODE_AUTO = 'auto'
+
+# До этого числа строк employee (по оценке pg_class) автоматический режим считает точно
+DIAGNOSTICS_EXACT_LIMIT = 200000
+
+# Диагностика не должна нагружать базу дольше этого времени
+DIAGNOSTICS_STATEMENT_TIMEOUT = '5s'
+
+DIAGNOSTICS_TABLES = ('employee', 'emplhistory', 'conflist', 'employee_changelog', 'test_run_registry')
+
+# Оценки размера таблиц из каталога; отсутствующие таблицы просто не попадают в результат
+TABLE_ESTIMATES_SQL = text("""
+    SELECT c.relname, GREATEST(c.reltuples, 0)::bigint AS estimate
+    FROM pg_class c
+    WHERE c.relname = ANY(:tables) AND c.relkind = 'r' AND c.relnamespace = 'public'::regnamespace
+""")
+
+# Все точные счетчики employee за один проход; открытые конфликты читаются по частичному индексу
+EXACT_COUNTERS_SQL = """
+    WITH by_filial AS (
+        SELECT filial,
+               COUNT(*) AS employees,
+               COUNT(*) FILTER (WHERE status = 'Active') AS active,
+               COUNT(*) FILTER (WHERE status = 'Fired') AS fired
+        FROM employee
+        GROUP BY filial
+    )
+    SELECT (SELECT COALESCE(json_object_agg(filial, json_build_object(
+                'employees', employees, 'active', active, 'fired', fired)), '{{}}') FROM by_filial) AS filials,
+           (SELECT COUNT(*) FROM conflist WHERE NOT resolved) AS open_conflicts,
+           {test_rows} AS test_rows
+"""
+
+# Распределение по филиалам из статистики планировщика: доли частых значений столбца filial
+ESTIMATED_FILIALS_SQL = text("""
+    SELECT v.filial, (v.freq * c.reltuples)::bigint AS employees
+    FROM pg_stats s
+    JOIN pg_class c ON c.relname = s.tablename AND c.relnamespace = 'public'::regnamespace
+    CROSS JOIN LATERAL unnest(s.most_common_vals::text::int[], s.most_common_freqs) AS v(filial, freq)
+    WHERE s.schemaname = 'public' AND s.tablename = 'employee' AND s.attname = 'filial'
+""")
+
+
+def _collect(engine, mode):
+    """Счетчики одной базы: оценки каталога и один агрегирующий запрос"""
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL statement_timeout = '{DIAGNOSTICS_STATEMENT_TIMEOUT}'"))
+        estimates = dict(conn.execute(TABLE_ESTIMATES_SQL, {'tables': list(DIAGNOSTICS_TABLES)}).fetchall())
+
+        if mode == MODE_AUTO:
+            mode = MODE_EXACT if estimates.get('employee', 0) <= DIAGNOSTICS_EXACT_LIMIT else MODE_ESTIMATE
+
+        if mode == MODE_EXACT:
+            test_rows = "(SELECT COUNT(*) FROM test_run_registry)" if 'test_run_registry' in estimates else "NULL"
+            row = conn.execute(text(EXACT_COUNTERS_SQL.format(test_rows=test_rows))).fetchone()
+            filials = {int(filial): counters for filial, counters in row.filials.items()}
+            open_conflicts, test_rows = row.open_conflicts, row.test_rows
+        else:
+            filials = {
+                filial: {'employees': employees}
+                for filial, employees in conn.execute(ESTIMATED_FILIALS_SQL).fetchall()
+            }
+            open_conflicts = test_rows = None
+
+    return {
+        'mode': mode,
+        'employees': sum(counters['employees'] for counters in filials.values()),
+        'filials': filials,
+        'open_conflicts': open_conflicts,
+        'test_rows': test_rows,
+        'table_estimates': estimates,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def collect_diagnostics(db, mode=MODE_AUTO):
+    """Диагностика всех баз реестра одновременно. Возвращает {база: счетчики или {'error': ...}}"""
+    def collect(db_name):
+        try:
+            return _collect(db.engines[db_name], mode)
+        except Exception as e:
+            logger.error(f"Ошибка диагностики {db_name}: {e}")
+            return {'error': str(e)}
+
+    with ThreadPoolExecutor(max_workers=len(db.engines)) as pool:
+        return dict(zip(db.engines, pool.map(collect, db.engines)))
+
+
+def format_diagnostics(diagnostics):
+    """Текстовый отчет"""
+    lines = ["=== ДИАГНОСТИКА БАЗ ДАННЫХ ==="]
+    for db_name, state in diagnostics.items():
+        lines.append(f"\n{db_name.upper()}:")
+        if 'error' in state:
+            lines.append(f"  Ошибка: {state['error']}")
+            continue
+        approx = '~' if state['mode'] == MODE_ESTIMATE else ''
+        lines.append(f"  Всего сотрудников: {approx}{state['employees']}")
+        for filial, counters in sorted(state['filials'].items()):
+            details = ''
+            if 'active' in counters:
+                details = f" (активных {counters['active']}, уволенных {counters['fired']})"
+            lines.append(f"  Филиал {filial}: {approx}{counters['employees']}{details}")
+        if state['open_conflicts'] is not None:
+            lines.append(f"  Открытых конфликтов: {state['open_conflicts']}")
+        if state['test_rows'] is not None:
+            lines.append(f"  Тестовых записей: {state['test_rows']}")
+        lines.append(f"  Режим: {state['mode']}, {state['elapsed_ms']} мс")
+    return '\n'.join(lines)
+
+
+def check_database_state(mode=MODE_AUTO, as_json=False):
+    """Проверка состояния баз данных"""
     db = DatabaseManager()
 
     try:
-        print("=== ДИАГНОСТИКА БАЗ ДАННЫХ ===")
-
-        for db_name in ['filial1', 'filial2']:
-            session = db.get_session(db_name)
-            try:
-                # Общее количество сотрудников
-                total_count = session.execute(text("SELECT COUNT(*) FROM employee")).scalar()
-
-                # Количество по филиалам
-                filial_1_count = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE filial = 1")
-                ).scalar()
-                filial_2_count = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE filial = 2")
-                ).scalar()
-
-                # Тестовые данные
-                test_count = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE passport LIKE '600%600%0'")
-                ).scalar()
-
-                print(f"\n{db_name.upper()}:")
-                print(f"  Всего сотрудников: {total_count}")
-                print(f"  Филиал 1: {filial_1_count}")
-                print(f"  Филиал 2: {filial_2_count}")
-                print(f"  Тестовых записей: {test_count}")
-
-                if test_count > 0:
-                    test_employees = session.execute(
-                        text("SELECT emplcode, passport, filial FROM employee WHERE passport LIKE '600%600%0'")
-                    ).fetchall()
-                    print(f"  Тестовые сотрудники: {test_employees}")
-
-            finally:
-                session.close()
+        diagnostics = collect_diagnostics(db, mode)
+        if as_json:
+            print(json.dumps(diagnostics, ensure_ascii=False, sort_keys=True))
+        else:
+            print(format_diagnostics(diagnostics))
+        return diagnostics
 
     finally:
         db.close()
 
 
 if __name__ == "__main__":
-    check_database_state()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Диагностика состояния баз филиалов')
+    parser.add_argument('--json', action='store_true', help='вывод в JSON для мониторинга')
+    parser.add_argument('--mode', choices=[MODE_AUTO, MODE_EXACT, MODE_ESTIMATE], default=MODE_AUTO)
+    args = parser.parse_args()
+    check_database_state(args.mode, args.json)
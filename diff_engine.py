@@ -0,0 +1,143 @@
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Корзины - префиксы md5(паспорт) в шестнадцатеричной записи. Первый уровень - префиксы
+# длины DIFF_ROOT_DEPTH (256 корзин), каждый следующий уровень делит корзину на 16.
+# Корзина, в которой не больше DIFF_LEAF_ROWS строк, сравнивается построчно.
+DIFF_ROOT_DEPTH = 2
+DIFF_LEAF_ROWS = 16
+DIFF_MAX_DEPTH = 32
+
+# Виды расхождений source -> target
+DIFF_ADD = 'add'
+DIFF_UPDATE = 'update'
+DIFF_CONFLICT = 'conflict'
+DIFF_TARGET_ONLY = 'target_only'
+
+# Отпечатки считаются на сервере один раз за сравнение:
+# - identity_hash - идентификационные поля (ФИО и дата рождения), их расхождение - конфликт;
+# - row_hash - 64 бита md5 всех сравниваемых полей, сумма по корзине не зависит от порядка строк.
+# Корзина в сортировке "C", чтобы диапазон префикса читался по индексу при любой локали базы.
+# У каждой стороны своя таблица: внутри единицы работы обе стороны могут оказаться одним соединением.
+PREPARE_DIFF_FINGERPRINTS_SQL = [
+    "DROP TABLE IF EXISTS {table}",
+    """
+    CREATE TEMP TABLE {table} (
+        bucket TEXT COLLATE "C",
+        passport VARCHAR(10),
+        identity_hash TEXT,
+        poscode INTEGER,
+        status VARCHAR(20),
+        row_hash BIGINT
+    ) ON COMMIT DROP
+    """,
+    """
+    INSERT INTO {table}
+    SELECT md5(passport), passport,
+           md5(concat_ws('|', surname, name, patronymic, birthday)),
+           poscode, status,
+           ('x' || substr(md5(concat_ws('|', passport, surname, name, patronymic, birthday, poscode, status)), 1, 16))
+               ::bit(64)::bigint
+    FROM employee
+    WHERE filial = :filial
+    """,
+    "CREATE INDEX ON {table} (bucket)",
+    "ANALYZE {table}",
+]
+
+# Хеши дочерних корзин внутри корзин-родителей; строки родителя - диапазон [префикс, префикс || 'g')
+BUCKET_HASHES_SQL = """
+    SELECT substr(f.bucket, 1, :depth) AS prefix, COUNT(*) AS row_count, SUM(f.row_hash) AS bucket_hash
+    FROM unnest(CAST(:prefixes AS TEXT[])) AS p(prefix)
+    JOIN {table} f ON f.bucket >= p.prefix COLLATE "C" AND f.bucket < (p.prefix || 'g') COLLATE "C"
+    GROUP BY 1
+"""
+
+LEAF_ROWS_SQL = """
+    SELECT f.passport, f.identity_hash, f.row_hash
+    FROM unnest(CAST(:prefixes AS TEXT[])) AS p(prefix)
+    JOIN {table} f ON f.bucket >= p.prefix COLLATE "C" AND f.bucket < (p.prefix || 'g') COLLATE "C"
+"""
+
+SOURCE_FINGERPRINTS_TABLE = 'diff_fingerprints_source'
+TARGET_FINGERPRINTS_TABLE = 'diff_fingerprints_target'
+
+
+def _wire_size(rows):
+    """Приблизительный объем строк результата в текстовом протоколе"""
+    return sum(len(str(value)) for row in rows for value in row)
+
+
+def _bucket_hashes(conn, table, prefixes, depth, stats):
+    rows = conn.execute(text(BUCKET_HASHES_SQL.format(table=table)), {'prefixes': prefixes, 'depth': depth}).fetchall()
+    stats['buckets'] += len(rows)
+    stats['transferred_bytes'] += _wire_size(rows)
+    return {row.prefix: (row.row_count, row.bucket_hash) for row in rows}
+
+
+def _leaf_rows(conn, table, prefixes, stats):
+    rows = conn.execute(text(LEAF_ROWS_SQL.format(table=table)), {'prefixes': prefixes}).fetchall()
+    stats['rows'] += len(rows)
+    stats['transferred_bytes'] += _wire_size(rows)
+    return {row.passport: row for row in rows}
+
+
+def _classify(source_rows, target_rows, delta):
+    """Построчное сравнение листовых корзин"""
+    for passport, source_row in source_rows.items():
+        target_row = target_rows.get(passport)
+        if target_row is None:
+            delta[DIFF_ADD].append(passport)
+        elif source_row.identity_hash != target_row.identity_hash:
+            delta[DIFF_CONFLICT].append(passport)
+        elif source_row.row_hash != target_row.row_hash:
+            delta[DIFF_UPDATE].append(passport)
+    delta[DIFF_TARGET_ONLY].extend(passport for passport in target_rows if passport not in source_rows)
+
+
+def compare_branches(source_conn, target_conn, source_filial, target_filial):
+    """Сравнение сотрудников филиала source_filial в source и target_filial в target.
+
+    Сравниваются суммы хешей корзин; в корзину спускаемся, только если ее хеши расходятся,
+    поэтому объем переданных данных зависит от числа расхождений, а не от размера таблиц.
+    Возвращает словарь со списками паспортов по видам расхождений и статистикой обхода.
+    """
+    for statement in PREPARE_DIFF_FINGERPRINTS_SQL:
+        source_conn.execute(text(statement.format(table=SOURCE_FINGERPRINTS_TABLE)), {'filial': source_filial})
+        target_conn.execute(text(statement.format(table=TARGET_FINGERPRINTS_TABLE)), {'filial': target_filial})
+
+    delta = {DIFF_ADD: [], DIFF_UPDATE: [], DIFF_CONFLICT: [], DIFF_TARGET_ONLY: []}
+    stats = {'levels': 0, 'buckets': 0, 'rows': 0, 'transferred_bytes': 0}
+
+    prefixes, depth = [''], DIFF_ROOT_DEPTH
+    while prefixes:
+        stats['levels'] += 1
+        source_buckets = _bucket_hashes(source_conn, SOURCE_FINGERPRINTS_TABLE, prefixes, depth, stats)
+        target_buckets = _bucket_hashes(target_conn, TARGET_FINGERPRINTS_TABLE, prefixes, depth, stats)
+
+        leaves, drill = [], []
+        for prefix in sorted(source_buckets.keys() | target_buckets.keys()):
+            source_bucket = source_buckets.get(prefix, (0, None))
+            target_bucket = target_buckets.get(prefix, (0, None))
+            if source_bucket == target_bucket:
+                continue
+            if max(source_bucket[0], target_bucket[0]) <= DIFF_LEAF_ROWS or depth >= DIFF_MAX_DEPTH:
+                leaves.append(prefix)
+            else:
+                drill.append(prefix)
+
+        if leaves:
+            _classify(
+                _leaf_rows(source_conn, SOURCE_FINGERPRINTS_TABLE, leaves, stats),
+                _leaf_rows(target_conn, TARGET_FINGERPRINTS_TABLE, leaves, stats),
+                delta
+            )
+
+        prefixes, depth = drill, depth + 1
+
+    for passports in delta.values():
+        passports.sort()
+    delta['stats'] = stats
+    return delta
@@ -0,0 +1,226 @@
+from sqlalchemy import text
+
+# Действия истории, которые пишут триггеры
+HISTORY_HIRE = 'Прием'
+HISTORY_TRANSFER = 'Перевод'
+HISTORY_RENAME = 'Смена фамилии'
+HISTORY_DISMISSAL = 'Увольнение'
+HISTORY_REHIRE = 'Восстановление'
+
+# Триггеры уровня оператора пишут историю одним INSERT ... SELECT из таблиц переходов:
+# массовое изменение должностей дает одну вставку на весь оператор, а не по строке.
+# Одно изменение сотрудника - одна запись: увольнение и восстановление важнее перевода,
+# перевод важнее смены фамилии. Смена статуса, которая не увольняет и не восстанавливает
+# сотрудника (например, Active -> OnLeave), событием истории не является и не пишется.
+# Синхронизация, переносящая историю сотрудника из другого
+# филиала (sync.history = carried), отключает запись, чтобы событие не попало в историю дважды.
+HISTORY_FUNCTION_SQL = f"""
+    CREATE OR REPLACE FUNCTION record_employee_history()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF current_setting('sync.history', true) IS NOT DISTINCT FROM 'carried' THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+            SELECT emplcode, CURRENT_DATE, surname, passport, poscode, '{HISTORY_HIRE}'
+            FROM new_rows
+            ORDER BY emplcode;
+        ELSE
+            INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+            SELECT n.emplcode, CURRENT_DATE, n.surname, n.passport, n.poscode,
+                   CASE
+                       WHEN n.status = 'Fired' AND o.status IS DISTINCT FROM 'Fired' THEN '{HISTORY_DISMISSAL}'
+                       WHEN o.status = 'Fired' AND n.status IS DISTINCT FROM 'Fired' THEN '{HISTORY_REHIRE}'
+                       WHEN n.poscode <> o.poscode THEN '{HISTORY_TRANSFER}'
+                       WHEN n.surname <> o.surname THEN '{HISTORY_RENAME}'
+                   END
+            FROM new_rows n
+            JOIN old_rows o ON o.emplcode = n.emplcode
+            WHERE n.poscode <> o.poscode
+               OR n.surname <> o.surname
+               OR (n.status IS NOT DISTINCT FROM 'Fired') <> (o.status IS NOT DISTINCT FROM 'Fired')
+            ORDER BY n.emplcode;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+HISTORY_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS employee_history_insert ON employee",
+    """
+    CREATE TRIGGER employee_history_insert
+    AFTER INSERT ON employee
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_employee_history()
+    """,
+    "DROP TRIGGER IF EXISTS employee_history_update ON employee",
+    """
+    CREATE TRIGGER employee_history_update
+    AFTER UPDATE ON employee
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION record_employee_history()
+    """,
+]
+
+# Миграция схемы: функция и триггеры истории
+HISTORY_TRACKING_SQL = [HISTORY_FUNCTION_SQL] + HISTORY_TRIGGERS_SQL
+
+# Миграция схемы: пересоздание функции истории в базах, где 0003_employee_history
+# уже применена с записью любой смены статуса как смены фамилии
+HISTORY_STATUS_SQL = [HISTORY_FUNCTION_SQL]
+
+HISTORY_TRACKING_INSTALLED_SQL = text(
+    "SELECT COUNT(*) = 2 FROM pg_trigger WHERE tgname IN ('employee_history_insert', 'employee_history_update')"
+)
+
+# Перенос истории из другого филиала: до вставки сотрудников и изменения статусов в employee
+# отключает запись триггером, после переноса включает ее снова (SET LOCAL действует до конца транзакции)
+CARRY_HISTORY_SQL = text("SET LOCAL sync.history = 'carried'")
+FINISH_CARRYING_SQL = text("SET LOCAL sync.history = ''")
+
+# Новые сотрудники целевого филиала - непрерывный диапазон выданных кодов
+NEW_EMPLOYEE_PASSPORTS_SQL = text("""
+    SELECT passport FROM employee
+    WHERE filial = :filial AND emplcode BETWEEN :first_code AND :last_code
+""")
+
+# История сотрудников источника; порядок записей восстанавливается при вставке.
+# Выборка идет от массива паспортов: без свежей статистики после массовой загрузки
+# планировщик иначе выбирает полный проход по индексу emplhistory на каждый пакет.
+SOURCE_HISTORY_SQL = text("""
+    SELECT e.passport, h.changedate, h.surname, h.poscode, h.action, h.historyid
+    FROM unnest(CAST(:passports AS VARCHAR[])) AS p(passport)
+    JOIN employee e ON e.passport = p.passport AND e.filial = :filial
+    JOIN emplhistory h ON h.emplcode = e.emplcode
+""")
+
+# Паспортов в одном запросе истории к источнику: каждый запрос стоит примерно
+# одного прохода по employee, поэтому пачки крупнее пачек синхронизации
+HISTORY_BATCH_SIZE = 10000
+
+HISTORY_COLUMNS = ('passport', 'changedate', 'surname', 'poscode', 'action', 'source_historyid')
+
+PREPARE_HISTORY_SQL = [
+    "DROP TABLE IF EXISTS sync_history",
+    """
+    CREATE TEMP TABLE sync_history (
+        passport VARCHAR(10), changedate DATE, surname VARCHAR(50),
+        poscode INTEGER, action VARCHAR(50), source_historyid INTEGER
+    ) ON COMMIT DROP
+    """,
+]
+
+# Загрузка истории во временную таблицу массивами по колонкам HISTORY_COLUMNS
+# для драйверов без COPY (асинхронный менеджер на asyncpg)
+INSERT_HISTORY_SQL = text("""
+    INSERT INTO sync_history (passport, changedate, surname, poscode, action, source_historyid)
+    SELECT * FROM unnest(CAST(:passport AS VARCHAR[]), CAST(:changedate AS DATE[]), CAST(:surname AS VARCHAR[]),
+                         CAST(:poscode AS INTEGER[]), CAST(:action AS VARCHAR[]), CAST(:source_historyid AS INTEGER[]))
+""")
+
+# Одна вставка на весь перенос: historyid выдаются в порядке сортировки,
+# поэтому порядок записей каждого сотрудника совпадает с порядком в источнике
+APPLY_HISTORY_SQL = text("""
+    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+    SELECT e.emplcode, s.changedate, s.surname, s.passport, s.poscode, s.action
+    FROM sync_history s
+    JOIN employee e ON e.passport = s.passport AND e.filial = :filial
+    WHERE e.emplcode BETWEEN :first_code AND :last_code
+    ORDER BY e.emplcode, s.changedate, s.source_historyid
+""")
+
+# Недостающие записи истории сотрудников, которые уже есть в целевом филиале: переводы,
+# смены фамилии, увольнения и восстановления источника. Запись определяется паспортом,
+# датой события и самим событием, поэтому повторный и встречный перенос ее не дублируют.
+# Прием не переносится - у сотрудника целевого филиала есть собственный.
+# Новые сотрудники (диапазон кодов :first_code - :last_code) получают историю через APPLY_HISTORY_SQL
+APPLY_HISTORY_DELTAS_SQL = text(f"""
+    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+    SELECT e.emplcode, s.changedate, s.surname, s.passport, s.poscode, s.action
+    FROM sync_history s
+    JOIN employee e ON e.passport = s.passport AND e.filial = :filial
+    WHERE e.emplcode NOT BETWEEN :first_code AND :last_code
+    AND s.action <> '{HISTORY_HIRE}'
+    AND NOT EXISTS (
+        SELECT 1 FROM emplhistory h
+        WHERE h.emplcode = e.emplcode AND h.changedate = s.changedate AND h.action = s.action
+        AND h.poscode IS NOT DISTINCT FROM s.poscode AND h.surname IS NOT DISTINCT FROM s.surname
+    )
+    ORDER BY e.emplcode, s.changedate, s.source_historyid
+""")
+
+# Перенос истории одного сотрудника без временной таблицы
+INSERT_EMPLOYEE_HISTORY_SQL = text("""
+    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+    SELECT :emplcode, h.changedate, h.surname, :passport, h.poscode, h.action
+    FROM unnest(CAST(:changedate AS DATE[]), CAST(:surname AS VARCHAR[]), CAST(:poscode AS INTEGER[]),
+                CAST(:action AS VARCHAR[])) WITH ORDINALITY AS h(changedate, surname, poscode, action, ord)
+    ORDER BY h.ord
+""")
+
+# Недостающие записи истории одного существующего сотрудника, по тем же правилам,
+# что и APPLY_HISTORY_DELTAS_SQL
+INSERT_EMPLOYEE_HISTORY_DELTAS_SQL = text(f"""
+    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
+    SELECT e.emplcode, h.changedate, h.surname, e.passport, h.poscode, h.action
+    FROM unnest(CAST(:changedate AS DATE[]), CAST(:surname AS VARCHAR[]), CAST(:poscode AS INTEGER[]),
+                CAST(:action AS VARCHAR[])) WITH ORDINALITY AS h(changedate, surname, poscode, action, ord)
+    JOIN employee e ON e.passport = :passport AND e.filial = :filial
+    WHERE h.action <> '{HISTORY_HIRE}'
+    AND NOT EXISTS (
+        SELECT 1 FROM emplhistory t
+        WHERE t.emplcode = e.emplcode AND t.changedate = h.changedate AND t.action = h.action
+        AND t.poscode IS NOT DISTINCT FROM h.poscode AND t.surname IS NOT DISTINCT FROM h.surname
+    )
+    ORDER BY h.ord
+""")
+
+EMPLOYEE_HISTORY_SQL = text("""
+    SELECT h.changedate, h.surname, h.poscode, h.action
+    FROM emplhistory h
+    JOIN employee e ON e.emplcode = h.emplcode
+    WHERE e.passport = :passport AND e.filial = :filial
+    ORDER BY h.changedate, h.historyid
+""")
+
+
+def history_arrays(rows):
+    """Записи истории в виде массивов по колонкам для вставки через unnest"""
+    return {
+        'changedate': [row.changedate for row in rows],
+        'surname': [row.surname for row in rows],
+        'poscode': [row.poscode for row in rows],
+        'action': [row.action for row in rows],
+    }
+
+
+def carry_employee_history(source_conn, target_conn, passport, source_filial, emplcode):
+    """Перенос истории одного сотрудника источника новому сотруднику целевой базы.
+
+    Возвращает число перенесенных записей.
+    """
+    rows = source_conn.execute(EMPLOYEE_HISTORY_SQL, {'passport': passport, 'filial': source_filial}).fetchall()
+    if not rows:
+        return 0
+    return target_conn.execute(INSERT_EMPLOYEE_HISTORY_SQL, {
+        'emplcode': emplcode,
+        'passport': passport,
+        **history_arrays(rows),
+    }).rowcount
+
+
+def carry_employee_history_deltas(source_conn, target_conn, passport, source_filial, target_filial):
+    """Перенос недостающих записей истории сотрудника, который уже есть в целевом филиале.
+
+    Возвращает число перенесенных записей.
+    """
+    rows = source_conn.execute(EMPLOYEE_HISTORY_SQL, {'passport': passport, 'filial': source_filial}).fetchall()
+    if not rows:
+        return 0
+    return target_conn.execute(INSERT_EMPLOYEE_HISTORY_DELTAS_SQL, {
+        'passport': passport,
+        'filial': target_filial,
+        **history_arrays(rows),
+    }).rowcount
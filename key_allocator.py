@@ -0,0 +1,128 @@
+from sqlalchemy import text
+import threading
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Сколько кодов резервируется в базе за одно обращение
+DEFAULT_BLOCK_SIZE = 100
+
+# Миграция таблицы аллокатора: повторяет модель KeyAllocator
+KEY_ALLOCATOR_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS key_allocator (
+        scope VARCHAR(50) PRIMARY KEY,
+        next_code INTEGER NOT NULL
+    )
+    """,
+]
+
+KEY_ALLOCATOR_INSTALLED_SQL = text("SELECT to_regclass('key_allocator') IS NOT NULL")
+
+# Резервирование диапазона одним атомарным оператором: строка аллокатора блокируется
+# на время UPDATE, поэтому параллельные воркеры получают непересекающиеся диапазоны.
+# MAX(emplcode) берется по индексу первичного ключа один раз на блок, чтобы не выдать
+# коды, уже занятые записями, вставленными в обход аллокатора.
+RESERVE_SQL = text("""
+    INSERT INTO key_allocator (scope, next_code)
+    VALUES (:scope, (SELECT COALESCE(MAX(emplcode), 0) + 1 FROM employee) + :count)
+    ON CONFLICT (scope) DO UPDATE
+    SET next_code = GREATEST(
+        key_allocator.next_code,
+        (SELECT COALESCE(MAX(emplcode), 0) + 1 FROM employee)
+    ) + :count
+    RETURNING next_code - :count
+""")
+
+
+def _missing_table_error(engine):
+    return RuntimeError(
+        f"Таблица key_allocator не создана в {engine.url.database}: примените миграции (python migrations.py)"
+    )
+
+
+class EmplcodeAllocator:
+    """Выдача табельных номеров блоками, зарезервированными в таблице key_allocator"""
+
+    def __init__(self, engine, scope='employee', block_size=DEFAULT_BLOCK_SIZE):
+        self.engine = engine
+        self.scope = scope
+        self.block_size = block_size
+        self._next_code = 0
+        self._block_end = 0
+        self._table_ready = False
+        self._lock = threading.Lock()
+
+    def _reserve(self, count):
+        """Резервирование count кодов в базе отдельной короткой транзакцией.
+
+        Таблица аллокатора создается миграцией (migrations.py), на ходу DDL не выполняется.
+        """
+        with self.engine.begin() as conn:
+            if not self._table_ready:
+                if not conn.execute(KEY_ALLOCATOR_INSTALLED_SQL).scalar():
+                    raise _missing_table_error(self.engine)
+                self._table_ready = True
+            start = conn.execute(RESERVE_SQL, {'scope': self.scope, 'count': count}).scalar()
+        logger.debug(f"Зарезервированы коды {start}..{start + count - 1} ({self.scope})")
+        return start
+
+    def reserve_range(self, count):
+        """Получить непрерывный диапазон из count новых кодов"""
+        if count <= 0:
+            return range(0)
+        with self._lock:
+            start = self._reserve(count)
+        return range(start, start + count)
+
+    def next_code(self):
+        """Следующий код из блока в памяти; новый блок резервируется по мере исчерпания"""
+        with self._lock:
+            if self._next_code >= self._block_end:
+                self._next_code = self._reserve(self.block_size)
+                self._block_end = self._next_code + self.block_size
+            code = self._next_code
+            self._next_code += 1
+            return code
+
+
+class AsyncEmplcodeAllocator:
+    """Асинхронный вариант EmplcodeAllocator для AsyncEngine"""
+
+    def __init__(self, engine, scope='employee', block_size=DEFAULT_BLOCK_SIZE):
+        self.engine = engine
+        self.scope = scope
+        self.block_size = block_size
+        self._next_code = 0
+        self._block_end = 0
+        self._table_ready = False
+        self._lock = asyncio.Lock()
+
+    async def _reserve(self, count):
+        async with self.engine.begin() as conn:
+            if not self._table_ready:
+                if not (await conn.execute(KEY_ALLOCATOR_INSTALLED_SQL)).scalar():
+                    raise _missing_table_error(self.engine)
+                self._table_ready = True
+            start = (await conn.execute(RESERVE_SQL, {'scope': self.scope, 'count': count})).scalar()
+        logger.debug(f"Зарезервированы коды {start}..{start + count - 1} ({self.scope})")
+        return start
+
+    async def reserve_range(self, count):
+        """Получить непрерывный диапазон из count новых кодов"""
+        if count <= 0:
+            return range(0)
+        async with self._lock:
+            start = await self._reserve(count)
+        return range(start, start + count)
+
+    async def next_code(self):
+        """Следующий код из блока в памяти; новый блок резервируется по мере исчерпания"""
+        async with self._lock:
+            if self._next_code >= self._block_end:
+                self._next_code = await self._reserve(self.block_size)
+                self._block_end = self._next_code + self.block_size
+            code = self._next_code
+            self._next_code += 1
+            return code
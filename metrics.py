@@ -0,0 +1,284 @@
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import Config
+import bisect
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм длительности, секунды
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Исход операции: выполнена, пропущена (метод вернул False) или завершилась ошибкой
+OUTCOME_OK = 'ok'
+OUTCOME_SKIPPED = 'skipped'
+OUTCOME_ERROR = 'error'
+
+OPERATION_SECONDS = 'sync_operation_seconds'
+OPERATION_ROWS = 'sync_operation_rows_total'
+OPERATION_ROUND_TRIPS = 'sync_operation_round_trips_total'
+ROUND_TRIPS = 'db_round_trips_total'
+POOL_WAIT_SECONDS = 'db_pool_wait_seconds'
+POOL_CONNECTS = 'db_pool_connects_total'
+RETRIES = 'sync_retries_total'
+RETRIES_EXHAUSTED = 'sync_retries_exhausted_total'
+BATCH_SPLITS = 'sync_batch_splits_total'
+
+METRIC_HELP = {
+    OPERATION_SECONDS: 'Длительность операций менеджера',
+    OPERATION_ROWS: 'Строки, обработанные операциями менеджера',
+    OPERATION_ROUND_TRIPS: 'Запросы к базе, выполненные операциями менеджера',
+    ROUND_TRIPS: 'Все запросы к базе',
+    POOL_WAIT_SECONDS: 'Ожидание соединения из пула',
+    POOL_CONNECTS: 'Новые соединения пула',
+    RETRIES: 'Повторы операций после временных ошибок базы (по SQLSTATE)',
+    RETRIES_EXHAUSTED: 'Операции и пачки, не выполненные за все попытки',
+    BATCH_SPLITS: 'Пачки, разделенные пополам после ошибки конкуренции',
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_pool_requests = threading.local()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, запоминающий момент запроса соединения.
+
+    Событие checkout срабатывает в том же потоке и считает по этому моменту ожидание в пуле.
+    """
+
+    def connect(self):
+        _pool_requests.started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _pool_requests.started = None
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Operation:
+    """Замер одной операции: строки, запросы к базе и исход"""
+    __slots__ = ('name', 'database', 'rows', 'round_trips', 'outcome', 'started')
+
+    def __init__(self, name, database):
+        self.name = name
+        self.database = database
+        self.rows = 0
+        self.round_trips = 0
+        self.outcome = OUTCOME_OK
+        self.started = time.perf_counter()
+
+
+# Общий объект для выключенного реестра: записи в него никуда не попадают
+NULL_OPERATION = Operation('', '')
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы процесса с выводом в текстовом формате Prometheus.
+
+    Выключенный реестр (enabled=False) не подписывается на события движков и не замеряет
+    операции: остается одна проверка флага на вызов.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._local = threading.local()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def current(self):
+        """Операция, выполняющаяся в текущем потоке (или NULL_OPERATION)"""
+        return getattr(self._local, 'operation', None) or NULL_OPERATION
+
+    @contextmanager
+    def operation(self, name, database=''):
+        """Замер операции: длительность, строки (op.rows), запросы к базе и исход (op.outcome).
+
+        Исключение, вышедшее из блока, помечает операцию ошибкой. Запросы вложенной
+        операции учитываются и во внешней.
+        """
+        if not self.enabled:
+            yield NULL_OPERATION
+            return
+
+        op = Operation(name, database)
+        parent = getattr(self._local, 'operation', None)
+        self._local.operation = op
+        try:
+            yield op
+        except Exception:
+            op.outcome = OUTCOME_ERROR
+            raise
+        finally:
+            self._local.operation = parent
+            if parent is not None:
+                parent.round_trips += op.round_trips
+            self.observe(OPERATION_SECONDS, time.perf_counter() - op.started,
+                         operation=name, database=database, outcome=op.outcome)
+            if op.rows:
+                self.inc(OPERATION_ROWS, op.rows, operation=name, database=database)
+            if op.round_trips:
+                self.inc(OPERATION_ROUND_TRIPS, op.round_trips, operation=name, database=database)
+
+    def instrument_engine(self, engine, database):
+        """Подписка на события движка: запросы к базе, ожидание и новые соединения пула.
+
+        Ожидание в пуле измеряется, если движок создан с poolclass=TimedQueuePool.
+        Запросы через курсор DBAPI в обход SQLAlchemy (COPY) не учитываются.
+        """
+        if not self.enabled:
+            return
+
+        def count_round_trip(conn, cursor, statement, parameters, context, executemany):
+            if not self.enabled:
+                return
+            self.inc(ROUND_TRIPS, database=database)
+            op = getattr(self._local, 'operation', None)
+            if op is not None:
+                op.round_trips += 1
+
+        def record_checkout(dbapi_connection, connection_record, connection_proxy):
+            started = getattr(_pool_requests, 'started', None)
+            if self.enabled and started is not None:
+                self.observe(POOL_WAIT_SECONDS, time.perf_counter() - started, database=database)
+
+        def count_connect(dbapi_connection, connection_record):
+            if self.enabled:
+                self.inc(POOL_CONNECTS, database=database)
+
+        event.listen(engine, 'before_cursor_execute', count_round_trip)
+        event.listen(engine, 'checkout', record_checkout)
+        event.listen(engine, 'connect', count_connect)
+
+    def snapshot(self):
+        """Копия значений: {'counters': {(имя, метки): значение}, 'histograms': {(имя, метки): (count, sum)}}"""
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'histograms': {key: (h.count, h.sum) for key, h in self._histograms.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self):
+        """Текстовый формат экспозиции Prometheus"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+
+        lines = []
+        described = set()
+
+        def describe(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in METRIC_HELP:
+                    lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+_registry = MetricsRegistry(enabled=Config.METRICS_ENABLED)
+
+
+def get_registry():
+    """Общий реестр метрик процесса"""
+    return _registry
+
+
+def start_http_exporter(port, registry=None, host=''):
+    """Отдача метрик по HTTP (GET /metrics) в фоновом потоке. Возвращает сервер для shutdown()"""
+    registry = registry or _registry
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Метрики доступны на порту {server.server_address[1]}: /metrics")
+    return server
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+from sqlalchemy import text
+from conflict_engine import CONFLICT_LOG_SQL, OPEN_CONFLICTS_SQL
+from history_tracking import HISTORY_TRACKING_SQL, HISTORY_STATUS_SQL
+from change_tracking import CHANGE_TRACKING_SQL, CHANGELOG_ORIGIN_SQL
+from key_allocator import KEY_ALLOCATOR_SQL
+from cleanup_registry import TEST_REGISTRY_SQL
+from two_phase import TPC_DECISIONS_SQL
+from database import DatabaseManager, TARGET_EXISTS_SQL, SOURCE_ACTIVE_EMPLOYEE_SQL, SOURCE_STATUS_SQL, UPDATE_STATUS_SQL
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Миграции схемы в порядке применения. Каждая миграция идемпотентна (IF NOT EXISTS),
+# поэтому повторный запуск безопасен даже без записи в schema_migrations.
+SYNC_INDEXES_SQL = [
+    # Поиск сотрудника по паспорту в филиале: проверка существования, чтение источника,
+    # обновление статуса; индекс обслуживает и поиск только по паспорту
+    "CREATE INDEX IF NOT EXISTS ix_employee_passport_filial ON employee (passport, filial)",
+    # Выборки по статусу в филиале: активные кандидаты, уволенные сотрудники
+    "CREATE INDEX IF NOT EXISTS ix_employee_filial_status ON employee (filial, status)",
+    # Внешние ключи: удаление сотрудников и должностей проверяет ссылающиеся строки
+    "CREATE INDEX IF NOT EXISTS ix_employee_poscode ON employee (poscode)",
+    "CREATE INDEX IF NOT EXISTS ix_emplhistory_emplcode ON emplhistory (emplcode)",
+    "CREATE INDEX IF NOT EXISTS ix_emplhistory_poscode ON emplhistory (poscode)",
+]
+
+MIGRATIONS = [
+    ('0001_sync_indexes', SYNC_INDEXES_SQL),
+    ('0002_conflict_log', CONFLICT_LOG_SQL),
+    ('0003_employee_history', HISTORY_TRACKING_SQL),
+    ('0004_change_tracking', CHANGE_TRACKING_SQL),
+    ('0005_key_allocator', KEY_ALLOCATOR_SQL),
+    ('0006_test_registry', TEST_REGISTRY_SQL),
+    ('0007_tpc_decisions', TPC_DECISIONS_SQL),
+    ('0008_changelog_origin', CHANGELOG_ORIGIN_SQL),
+    ('0009_employee_history_status', HISTORY_STATUS_SQL),
+]
+
+CREATE_MIGRATIONS_TABLE_SQL = text("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        migration_id VARCHAR(100) PRIMARY KEY,
+        applied_at TIMESTAMP DEFAULT NOW()
+    )
+""")
+
+# Параллельные запуски миграций на одной базе выполняются по очереди
+MIGRATION_LOCK_SQL = text("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+
+# Горячие запросы синхронизации и очистки с типичными параметрами для проверки планов
+HOT_QUERIES = {
+    'target_exists': (TARGET_EXISTS_SQL.text, {'passport': '0000000000', 'filial': 1}),
+    'source_active_employee': (SOURCE_ACTIVE_EMPLOYEE_SQL.text, {'passport': '0000000000', 'filial': 1}),
+    'source_status': (SOURCE_STATUS_SQL.text, {'passport': '0000000000', 'filial': 1}),
+    'update_status': (UPDATE_STATUS_SQL.text, {'status': 'Fired', 'passport': '0000000000', 'filial': 1}),
+    'fired_employees': (
+        "SELECT emplcode, passport FROM employee WHERE filial = :filial AND status = 'Fired'",
+        {'filial': 1}
+    ),
+    'employee_history': (
+        "SELECT COUNT(*) FROM emplhistory WHERE emplcode = :emplcode",
+        {'emplcode': 1}
+    ),
+    'cleanup_history': (
+        "DELETE FROM emplhistory WHERE emplcode >= :emplcode",
+        {'emplcode': 2000000000}
+    ),
+    'cleanup_conflicts': (
+        "DELETE FROM conflist WHERE emplcode >= :emplcode",
+        {'emplcode': 2000000000}
+    ),
+    'open_conflicts': (OPEN_CONFLICTS_SQL.text, {'limit': 100}),
+}
+
+
+def apply_migrations(engine):
+    """Применение непримененных миграций. Возвращает список примененных идентификаторов"""
+    applied = []
+    with engine.begin() as conn:
+        conn.execute(MIGRATION_LOCK_SQL)
+        conn.execute(CREATE_MIGRATIONS_TABLE_SQL)
+        done = set(conn.execute(text("SELECT migration_id FROM schema_migrations")).scalars())
+
+        for migration_id, statements in MIGRATIONS:
+            if migration_id in done:
+                continue
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_migrations (migration_id) VALUES (:migration_id)"),
+                {'migration_id': migration_id}
+            )
+            applied.append(migration_id)
+            logger.info(f"Миграция {migration_id} применена в {engine.url.database}")
+    return applied
+
+
+def _seq_scans(plan_node):
+    """Таблицы, которые план читает последовательным сканированием"""
+    found = []
+    if plan_node.get('Node Type') == 'Seq Scan':
+        found.append(plan_node.get('Relation Name'))
+    for child in plan_node.get('Plans', []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def explain_hot_queries(engine):
+    """Планы горячих запросов. Возвращает {имя запроса: [таблицы с последовательным сканированием]}.
+
+    Изменяющие запросы выполняются через EXPLAIN без ANALYZE и ничего не меняют.
+    """
+    result = {}
+    with engine.connect() as conn:
+        for name, (query, params) in HOT_QUERIES.items():
+            plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query}"), params).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            result[name] = _seq_scans(plan[0]['Plan'])
+    return result
+
+
+def check_hot_queries(engine):
+    """Проверка, что ни один горячий запрос не читает таблицу последовательно.
+
+    Имеет смысл на базе с объемом данных, близким к рабочему: на маленьких таблицах
+    планировщик законно выбирает последовательное сканирование.
+    """
+    seq_scans = {name: tables for name, tables in explain_hot_queries(engine).items() if tables}
+    if seq_scans:
+        details = ', '.join(f"{name}: {', '.join(tables)}" for name, tables in seq_scans.items())
+        raise RuntimeError(f"Последовательное сканирование в горячих запросах ({engine.url.database}): {details}")
+    logger.info(f"Все горячие запросы в {engine.url.database} используют индексы")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    db = DatabaseManager()
+    try:
+        for name, engine in db.engines.items():
+            applied = apply_migrations(engine)
+            print(f"{name}: применено миграций {len(applied)} {applied}")
+            for query_name, tables in explain_hot_queries(engine).items():
+                status = f"последовательное сканирование {', '.join(tables)}" if tables else "индекс"
+                print(f"  {query_name}: {status}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Date, Boolean, ForeignKey, TIMESTAMP, Text
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Date, Boolean, ForeignKey, TIMESTAMP, Text, Index
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 Base = declarative_base()
 
@@ -32,6 +32,12 @@ class Employee(Base):
     history = relationship("EmplHistory", back_populates="employee")
     conflicts = relationship("Conflist", back_populates="employee")
 
+    __table_args__ = (
+        Index('ix_employee_passport_filial', 'passport', 'filial'),
+        Index('ix_employee_filial_status', 'filial', 'status'),
+        Index('ix_employee_poscode', 'poscode'),
+    )
+
 
 class EmplHistory(Base):
     __tablename__ = 'emplhistory'
@@ -46,6 +52,11 @@ class EmplHistory(Base):
 
     employee = relationship("Employee", back_populates="history")
 
+    __table_args__ = (
+        Index('ix_emplhistory_emplcode', 'emplcode'),
+        Index('ix_emplhistory_poscode', 'poscode'),
+    )
+
 
 class Conflist(Base):
     __tablename__ = 'conflist'
@@ -55,5 +66,63 @@ class Conflist(Base):
     errlist = Column(String(1000), nullable=False)
     conflictdate = Column(TIMESTAMP, default=func.now())
     resolved = Column(Boolean, default=False)
+    conflict_type = Column(String(20), nullable=True)
+    other_emplcode = Column(Integer, nullable=True)
+    other_filial = Column(Integer, nullable=True)
+    matched_fields = Column(SmallInteger, nullable=True)
+    dedup_key = Column(String(100), nullable=True)
+
+    employee = relationship("Employee", back_populates="conflicts")
+
+    __table_args__ = (
+        Index('ux_conflist_dedup_key', 'dedup_key', unique=True),
+        Index('ix_conflist_emplcode', 'emplcode'),
+        Index('ix_conflist_other', 'other_filial', 'other_emplcode'),
+        Index('ix_conflist_unresolved', 'conflictdate', 'conflictid', postgresql_where=text('NOT resolved')),
+    )
+
+
+class KeyAllocator(Base):
+    __tablename__ = 'key_allocator'
+
+    scope = Column(String(50), primary_key=True)
+    next_code = Column(Integer, nullable=False)
+
+
+class EmployeeChangelog(Base):
+    __tablename__ = 'employee_changelog'
+
+    changeid = Column(BigInteger, primary_key=True)
+    txid = Column(BigInteger, nullable=False, server_default=func.txid_current())
+    emplcode = Column(Integer, nullable=False)
+    operation = Column(String(1), nullable=False)
+    changedate = Column(TIMESTAMP, server_default=func.now())
+    origin = Column(String(50), nullable=True)
+
+    __table_args__ = (
+        Index('ix_employee_changelog_txid', 'txid'),
+    )
+
+
+class SyncWatermark(Base):
+    __tablename__ = 'sync_watermark'
+
+    source_db = Column(String(50), primary_key=True)
+    target_db = Column(String(50), primary_key=True)
+    last_txid = Column(BigInteger, nullable=False)
+    synced_at = Column(TIMESTAMP, server_default=func.now(), onupdate=func.now())
+
+
+class RegisteredTestRow(Base):
+    __tablename__ = 'test_run_registry'
+
+    run_id = Column(String(64), primary_key=True)
+    emplcode = Column(Integer, primary_key=True)
+
+
+class TwoPhaseDecision(Base):
+    __tablename__ = 'sync_tpc_decisions'
 
-    employee = relationship("Employee", back_populates="conflicts")
\ No newline at end of file
+    group_id = Column(String(100), primary_key=True)
+    outcome = Column(String(10), nullable=False)
+    decided_at = Column(TIMESTAMP, server_default=func.now())
@@ -0,0 +1,88 @@
+from sqlalchemy import text
+from functools import lru_cache
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Имена серверных подготовленных операторов каталога
+PREPARED_PREFIX = 'sync_q_'
+
+# Параметр :имя, но не приведение типа ::тип
+BIND_PATTERN = re.compile(r'(?<![:\w]):(\w+)')
+
+# Имя функции для execute_function: идентификатор, возможно со схемой
+FUNCTION_NAME_PATTERN = re.compile(r'^[A-Za-z_]\w*(\.[A-Za-z_]\w*)?$')
+
+
+class CatalogQuery:
+    """Оператор каталога: text() для SQLAlchemy и его позиционная форма для PREPARE/EXECUTE"""
+    __slots__ = ('name', 'statement', 'params', 'prepared_name', 'prepare_sql', 'execute_sql')
+
+    def __init__(self, name, statement):
+        self.name = name
+        self.statement = text(statement) if isinstance(statement, str) else statement
+        params = []
+
+        def positional(match):
+            if match.group(1) not in params:
+                params.append(match.group(1))
+            return f'${params.index(match.group(1)) + 1}'
+
+        body = BIND_PATTERN.sub(positional, self.statement.text)
+        self.params = tuple(params)
+        self.prepared_name = PREPARED_PREFIX + name
+        self.prepare_sql = f'PREPARE {self.prepared_name} AS {body}'
+        arguments = f"({', '.join(['%s'] * len(params))})" if params else ''
+        self.execute_sql = f'EXECUTE {self.prepared_name}{arguments}'
+
+
+class QueryCatalog:
+    """Каталог горячих запросов: каждый оператор создается и компилируется один раз.
+
+    С prepare и драйвером psycopg2 оператор готовится на сервере (PREPARE) один раз на
+    соединение DBAPI и дальше выполняется через EXECUTE без повторного разбора и
+    планирования. Подготовленные операторы соединения запоминаются в его info: словарь
+    живет, пока живет соединение DBAPI, и пропадает вместе с ним при переподключении.
+    Для asyncpg SQLAlchemy сам кеширует подготовленные операторы, поэтому каталог
+    выполняет text() как обычно.
+    """
+
+    def __init__(self, prepare=True):
+        self.prepare = prepare
+        self._queries = {}
+
+    def register(self, name, statement):
+        """Добавление оператора (строка SQL или text()) под именем name"""
+        self._queries[name] = CatalogQuery(name, statement)
+        return self._queries[name].statement
+
+    def statement(self, name):
+        return self._queries[name].statement
+
+    def execute(self, conn, name, params=None):
+        """Выполнение оператора каталога на соединении SQLAlchemy"""
+        query = self._queries[name]
+        params = params or {}
+        if not self.prepare or conn.dialect.driver != 'psycopg2':
+            return conn.execute(query.statement, params)
+
+        prepared = conn.connection.info.setdefault('prepared_statements', set())
+        if query.prepared_name not in prepared:
+            # PREPARE не отменяется откатом транзакции, поэтому запоминается сразу
+            conn.exec_driver_sql(query.prepare_sql)
+            prepared.add(query.prepared_name)
+        return conn.exec_driver_sql(query.execute_sql, tuple(params[param] for param in query.params))
+
+
+@lru_cache(maxsize=256)
+def function_call(function_name, arity):
+    """SELECT функции с arity именованными параметрами :p0, :p1, ...; оператор кешируется по имени и числу аргументов"""
+    if not FUNCTION_NAME_PATTERN.match(function_name):
+        raise ValueError(f"Недопустимое имя функции: {function_name}")
+    return text(f"SELECT {function_name}({', '.join(f':p{i}' for i in range(arity))})")
+
+
+def function_params(args):
+    """Параметры для оператора function_call"""
+    return {f'p{i}': arg for i, arg in enumerate(args)}
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+from database import DatabaseManager
+from config import Config
+import argparse
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def recover_transactions(grace=None):
+    """Завершение подготовленных транзакций, оставленных упавшим координатором согласованной фиксации"""
+    db = DatabaseManager()
+
+    try:
+        recovered = db.recover_in_doubt(grace)
+        logger.info(
+            f"✅ Зафиксировано транзакций: {recovered['committed']}, откатано: {recovered['rolled_back']}"
+        )
+        return recovered
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Восстановление подготовленных транзакций согласованной фиксации')
+    parser.add_argument('--grace', type=int, default=None,
+                        help=f'возраст транзакции в секундах, после которого она считается оставленной '
+                             f'(по умолчанию {Config.TPC_RECOVERY_GRACE})')
+    args = parser.parse_args()
+    print("=== ВОССТАНОВЛЕНИЕ ПОДГОТОВЛЕННЫХ ТРАНЗАКЦИЙ ===")
+    recover_transactions(args.grace)
@@ -0,0 +1,147 @@
+from collections import deque, namedtuple
+from config import Config
+from metrics import RETRIES, RETRIES_EXHAUSTED, BATCH_SPLITS
+import random
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Виды временных ошибок: конкуренция за строки и блокировки (повтор меньшей пачкой)
+# и потеря соединения (повтор той же пачки на новом соединении)
+RETRY_CONTENTION = 'contention'
+RETRY_CONNECTION = 'connection'
+
+# SQLSTATE ошибок конкуренции: serialization_failure, deadlock_detected, lock_not_available
+# (lock_timeout и NOWAIT). Отмена по statement_timeout (57014) не повторяется: она
+# означает слишком тяжелый запрос, а не конфликт.
+CONTENTION_SQLSTATES = {'40001', '40P01', '55P03'}
+
+# Класс 08 - ошибки соединения; остановка и перезапуск сервера, исчерпание соединений
+CONNECTION_SQLSTATES = {'57P01', '57P02', '57P03', '53300'}
+
+RetryPolicy = namedtuple('RetryPolicy', ['attempts', 'base_delay', 'max_delay'])
+
+
+def default_policy():
+    """Политика повторов из конфигурации"""
+    return RetryPolicy(Config.SYNC_RETRY_ATTEMPTS, Config.SYNC_RETRY_BASE_DELAY, Config.SYNC_RETRY_MAX_DELAY)
+
+
+def error_sqlstate(error):
+    """SQLSTATE ошибки драйвера (psycopg2 - pgcode, asyncpg - sqlstate), в том числе обернутой SQLAlchemy"""
+    original = getattr(error, 'orig', None) or error
+    return getattr(original, 'pgcode', None) or getattr(original, 'sqlstate', None)
+
+
+def classify_error(error):
+    """Вид временной ошибки (RETRY_CONTENTION, RETRY_CONNECTION) или None для постоянной"""
+    sqlstate = error_sqlstate(error)
+    if sqlstate in CONTENTION_SQLSTATES:
+        return RETRY_CONTENTION
+    if sqlstate in CONNECTION_SQLSTATES or (sqlstate or '').startswith('08'):
+        return RETRY_CONNECTION
+    if getattr(error, 'connection_invalidated', False):
+        return RETRY_CONNECTION
+    return None
+
+
+def backoff_delay(policy, attempt):
+    """Задержка перед повтором: экспоненциальная граница и равномерный разброс от нуля до нее,
+    чтобы конкурирующие процессы не повторяли одновременно"""
+    return random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** attempt))
+
+
+class RetryExecutor:
+    """Выполнение операций с повторами после временных ошибок базы.
+
+    Постоянные ошибки пробрасываются сразу. Повторы, разделения пачек и исчерпанные
+    попытки считаются в реестре метрик с метками операции, базы и SQLSTATE.
+    """
+
+    def __init__(self, metrics, policy=None, sleep=time.sleep):
+        self.metrics = metrics
+        self.policy = policy or default_policy()
+        self.sleep = sleep
+
+    def _count(self, name, operation, database, error=None):
+        if not self.metrics.enabled:
+            return
+        if error is None:
+            self.metrics.inc(name, operation=operation, database=database)
+        else:
+            self.metrics.inc(name, operation=operation, database=database, sqlstate=error_sqlstate(error) or '')
+
+    def call(self, func, *args, operation='', database='', **kwargs):
+        """Вызов func с повтором после временных ошибок; последняя ошибка пробрасывается"""
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                attempt += 1
+                if kind is None:
+                    raise
+                if attempt >= self.policy.attempts:
+                    self._count(RETRIES_EXHAUSTED, operation, database, e)
+                    raise
+                self._count(RETRIES, operation, database, e)
+                delay = backoff_delay(self.policy, attempt)
+                logger.warning(f"{operation} в {database}: временная ошибка ({kind}, попытка {attempt}), "
+                               f"повтор через {delay:.3f} с: {e}")
+                self.sleep(delay)
+
+    def run_batches(self, items, apply_batch, batch_size, operation='', database=''):
+        """Применение apply_batch к items пачками с повтором только неудавшихся пачек.
+
+        apply_batch(batch) выполняет пачку одной транзакцией и возвращает словарь результатов.
+        После ошибки конкуренции пачка делится пополам, а размер следующих пачек уменьшается
+        вдвое; каждая успешная пачка удваивает его обратно до batch_size. После потери
+        соединения пачка повторяется целиком. Возвращает (объединенные результаты,
+        элементы пачек, не выполненных за все попытки). Постоянные ошибки пробрасываются.
+        """
+        items = list(items)
+        results = {}
+        failed = []
+        size = batch_size
+        position = 0
+        # Неудавшиеся части пачек с номером попытки, выполняются раньше новых пачек
+        retries = deque()
+
+        while position < len(items) or retries:
+            if retries:
+                batch, attempt = retries.popleft()
+            else:
+                batch, attempt = items[position:position + size], 0
+                position += len(batch)
+
+            try:
+                results.update(apply_batch(batch))
+                size = min(batch_size, size * 2)
+                continue
+            except Exception as e:
+                kind = classify_error(e)
+                if kind is None:
+                    raise
+                error = e
+
+            attempt += 1
+            if attempt >= self.policy.attempts:
+                self._count(RETRIES_EXHAUSTED, operation, database, error)
+                logger.error(f"{operation} в {database}: пачка из {len(batch)} не выполнена "
+                             f"за {attempt} попыток: {error}")
+                failed.extend(batch)
+                continue
+
+            self._count(RETRIES, operation, database, error)
+            if kind == RETRY_CONTENTION and len(batch) > 1:
+                size = max(1, size // 2)
+                middle = len(batch) // 2
+                retries.extendleft([(batch[middle:], attempt), (batch[:middle], attempt)])
+                self._count(BATCH_SPLITS, operation, database)
+            else:
+                retries.appendleft((batch, attempt))
+            self.sleep(backoff_delay(self.policy, attempt))
+
+        return results, failed
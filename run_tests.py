@@ -1,9 +1,14 @@
 #!/usr/bin/env python3
 import pytest
+import argparse
 import logging
+import subprocess
 import sys
 import os
+import time
 from datetime import datetime
+from sqlalchemy import create_engine, text
+from config import Config
 
 
 def setup_logging():
@@ -18,22 +23,150 @@ def setup_logging():
     )
 
 
+def worker_database(branch, worker_id):
+    """Имя базы воркера, клонированной из базы филиала"""
+    return f"{branch['database']}_w{worker_id}"
+
+
+def create_worker_databases(branches, workers):
+    """Клонирование баз филиалов для каждого воркера через CREATE DATABASE ... TEMPLATE.
+
+    Клонирование копирует схему, справочники и триггеры без пересоздания; к базе-шаблону
+    в этот момент не должно быть подключений.
+    """
+    first = next(iter(branches.values()))
+    admin_engine = create_engine(
+        Config.get_db_url({**first, 'database': 'postgres'}), isolation_level='AUTOCOMMIT'
+    )
+    try:
+        with admin_engine.connect() as conn:
+            for branch in branches.values():
+                for worker_id in range(workers):
+                    database = worker_database(branch, worker_id)
+                    conn.execute(text(f'DROP DATABASE IF EXISTS "{database}"'))
+                    conn.execute(text(f'CREATE DATABASE "{database}" TEMPLATE "{branch["database"]}"'))
+    finally:
+        admin_engine.dispose()
+
+
+def drop_worker_databases(branches, workers):
+    """Удаление баз воркеров"""
+    first = next(iter(branches.values()))
+    admin_engine = create_engine(
+        Config.get_db_url({**first, 'database': 'postgres'}), isolation_level='AUTOCOMMIT'
+    )
+    try:
+        with admin_engine.connect() as conn:
+            for branch in branches.values():
+                for worker_id in range(workers):
+                    conn.execute(text(f'DROP DATABASE IF EXISTS "{worker_database(branch, worker_id)}"'))
+    finally:
+        admin_engine.dispose()
+
+
+def worker_environment(branches, worker_id, run_id):
+    """Окружение воркера: реестр филиалов с теми же именами, но на базах воркера"""
+    env = dict(os.environ)
+    env['DB_BRANCHES'] = ','.join(f"{name}:{branch['filial']}" for name, branch in branches.items())
+    for name, branch in branches.items():
+        prefix = f'DB_{name.upper()}_'
+        env[prefix + 'DATABASE'] = worker_database(branch, worker_id)
+        for key in ('host', 'port', 'user', 'password'):
+            env[prefix + key.upper()] = str(branch[key])
+    env['TEST_WORKER_ID'] = str(worker_id)
+    env['TEST_RUN_ID'] = f'{run_id}-w{worker_id}'
+    return env
+
+
+def collect_tests(paths):
+    """Идентификаторы тестов в порядке сбора pytest"""
+    output = subprocess.run(
+        [sys.executable, '-m', 'pytest', '--collect-only', '-q', *paths],
+        capture_output=True, text=True, check=True
+    ).stdout
+    return [line for line in output.splitlines() if '::' in line]
+
+
+def run_workers(branches, chunks, run_id):
+    """Запуск воркеров pytest одновременно. Возвращает (коды выхода, время по воркерам, общее время)"""
+    started = time.perf_counter()
+    processes = []
+    for worker_id, node_ids in enumerate(chunks):
+        processes.append((time.perf_counter(), subprocess.Popen(
+            [sys.executable, '-m', 'pytest', '-q', '--tb=short', '-p', 'no:cacheprovider', *node_ids],
+            env=worker_environment(branches, worker_id, run_id)
+        )))
+
+    exit_codes, elapsed = [], []
+    for worker_started, process in processes:
+        exit_codes.append(process.wait())
+        elapsed.append(time.perf_counter() - worker_started)
+    return exit_codes, elapsed, time.perf_counter() - started
+
+
+def run_parallel(paths, workers, compare, keep):
+    """Параллельный запуск: тесты распределяются по воркерам, у каждого воркера свои базы филиалов"""
+    logger = logging.getLogger(__name__)
+    branches = Config.get_branches()
+    run_id = f'parallel-{os.getpid()}-{int(time.time())}'
+
+    node_ids = collect_tests(paths)
+    # Круговое распределение: тесты одного модуля, обычно близкие по длительности, расходятся по воркерам
+    chunks = [node_ids[worker_id::workers] for worker_id in range(workers)]
+    chunks = [chunk for chunk in chunks if chunk]
+    logger.info(f"Тестов: {len(node_ids)}, воркеров: {len(chunks)}")
+
+    create_worker_databases(branches, len(chunks))
+    try:
+        serial_time = None
+        if compare:
+            # Последовательный прогон тех же тестов одним воркером для оценки ускорения
+            serial_codes, _, serial_time = run_workers(branches, [node_ids], f'{run_id}-serial')
+            if any(serial_codes):
+                logger.error(f"Последовательный прогон завершился с ошибками: {serial_codes}")
+
+        exit_codes, elapsed, wall_time = run_workers(branches, chunks, run_id)
+    finally:
+        if not keep:
+            drop_worker_databases(branches, len(chunks))
+
+    for worker_id, (code, worker_time) in enumerate(zip(exit_codes, elapsed)):
+        logger.info(f"Воркер {worker_id}: {len(chunks[worker_id])} тестов, {worker_time:.2f} с, код выхода {code}")
+    logger.info(f"Параллельный прогон: {wall_time:.2f} с")
+    if serial_time is not None:
+        logger.info(f"Последовательный прогон: {serial_time:.2f} с, ускорение x{serial_time / wall_time:.2f}")
+
+    return max(exit_codes)
+
+
 def main():
     """Основная функция запуска тестов"""
+    parser = argparse.ArgumentParser(description='Запуск тестов синхронизации')
+    parser.add_argument('paths', nargs='*', default=['test_synchronization.py'])
+    parser.add_argument('--workers', type=int, default=1,
+                        help='число параллельных воркеров со своими копиями баз филиалов')
+    parser.add_argument('--compare', action='store_true',
+                        help='дополнительно прогнать тесты последовательно и вывести ускорение')
+    parser.add_argument('--keep-databases', action='store_true', help='не удалять базы воркеров')
+    args = parser.parse_args()
+
     setup_logging()
     logger = logging.getLogger(__name__)
 
     logger.info("ЗАПУСК ТЕСТОВ СИНХРОНИЗАЦИИ БАЗ ДАННЫХ")
 
-    # Запуск pytest
-    pytest_args = [
-        'test_synchronization.py',
-        '-v',
-        '--tb=short',
-        '--color=yes'
-    ]
+    if args.workers > 1:
+        exit_code = run_parallel(args.paths, args.workers, args.compare, args.keep_databases)
+    else:
+        # Запуск pytest
+        pytest_args = [
+            *args.paths,
+            '-v',
+            '--tb=short',
+            '--color=yes'
+        ]
 
-    exit_code = pytest.main(pytest_args)
+        exit_code = pytest.main(pytest_args)
 
     if exit_code == 0:
         logger.info("ВСЕ ТЕСТЫ УСПЕШНО ПРОЙДЕНЫ!")
@@ -44,4 +177,4 @@ def main():
 
 
 if __name__ == '__main__':
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
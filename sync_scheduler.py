@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import namedtuple
+from itertools import permutations
+from config import Config
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Направление синхронизации и направления, которые должны завершиться раньше
+SyncTask = namedtuple('SyncTask', ['source', 'target', 'depends_on'])
+
+# Результат выполнения направления
+SyncTaskResult = namedtuple('SyncTaskResult', ['task', 'result', 'error', 'elapsed'])
+
+
+def plan_pairwise(branch_names):
+    """Все упорядоченные пары филиалов; направления независимы друг от друга"""
+    return [SyncTask(source, target, ()) for source, target in permutations(branch_names, 2)]
+
+
+def plan_hub_and_spoke(hub, branch_names):
+    """Сначала все филиалы отправляют изменения в центральный, затем центральный раздает их остальным.
+
+    Изменения, принятые центральным филиалом, журналируются с базой-источником, поэтому
+    раздача отправляет их всем филиалам, кроме того, из которого они пришли.
+    """
+    spokes = [name for name in branch_names if name != hub]
+    collect = [SyncTask(spoke, hub, ()) for spoke in spokes]
+    collect_keys = tuple((task.source, task.target) for task in collect)
+    distribute = [SyncTask(hub, spoke, collect_keys) for spoke in spokes]
+    return collect + distribute
+
+
+class SyncScheduler:
+    """Параллельное выполнение плана синхронизации как DAG на пуле потоков.
+
+    Направление запускается, когда завершены все его зависимости и у обоих
+    филиалов есть свободный слот: одновременно с одним филиалом работает не
+    больше branch_limit направлений.
+    """
+
+    def __init__(self, manager, operation=None, max_workers=None, branch_limit=None):
+        self.manager = manager
+        self.operation = operation or manager.sync_incremental
+        self.max_workers = max_workers or Config.SYNC_WORKERS
+        self.branch_limit = branch_limit or Config.SYNC_BRANCH_CONCURRENCY
+        self._branch_slots = {name: threading.Semaphore(self.branch_limit) for name in manager.engines}
+
+    @staticmethod
+    def _validate(tasks):
+        """Проверка, что все зависимости есть в плане и план не содержит циклов"""
+        keys = {(task.source, task.target) for task in tasks}
+        for task in tasks:
+            missing = [dependency for dependency in task.depends_on if dependency not in keys]
+            if missing:
+                raise ValueError(f"Направление {task.source} -> {task.target} зависит от отсутствующих {missing}")
+
+        resolved = set()
+        remaining = list(tasks)
+        while remaining:
+            ready = [task for task in remaining if all(key in resolved for key in task.depends_on)]
+            if not ready:
+                raise ValueError(f"План синхронизации содержит циклические зависимости: {remaining}")
+            for task in ready:
+                resolved.add((task.source, task.target))
+                remaining.remove(task)
+
+    def _run_task(self, task):
+        # Слоты берутся в порядке имен филиалов, чтобы встречные направления не блокировали друг друга
+        first, second = sorted((task.source, task.target))
+        started = time.perf_counter()
+        with self._branch_slots[first], self._branch_slots[second]:
+            try:
+                result = self.operation(task.source, task.target)
+                return SyncTaskResult(task, result, None, time.perf_counter() - started)
+            except Exception as e:
+                logger.error(f"Ошибка синхронизации {task.source} -> {task.target}: {e}")
+                return SyncTaskResult(task, None, e, time.perf_counter() - started)
+
+    def run(self, tasks):
+        """Выполнить план. Возвращает {(source, target): SyncTaskResult}.
+
+        Направления, зависимости которых завершились с ошибкой, не запускаются.
+        """
+        self._validate(tasks)
+        pending = list(tasks)
+        results = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for task in list(pending):
+                    dependencies = [results.get(key) for key in task.depends_on]
+                    if any(result is None for result in dependencies):
+                        continue
+                    pending.remove(task)
+                    failed = [result.task for result in dependencies if result.error is not None]
+                    if failed:
+                        error = RuntimeError(f"Пропущено из-за ошибки в зависимостях: {failed}")
+                        results[(task.source, task.target)] = SyncTaskResult(task, None, error, 0.0)
+                        continue
+                    running[pool.submit(self._run_task, task)] = task
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    results[(task.source, task.target)] = future.result()
+                    logger.info(f"Направление {task.source} -> {task.target} завершено")
+
+        return results
@@ -0,0 +1,146 @@
+import pytest
+from test_base import TestBase
+from async_database import AsyncDatabaseManager
+from database import SYNC_INSERTED, SYNC_EXISTS
+from history_tracking import HISTORY_HIRE, HISTORY_TRANSFER, HISTORY_RENAME, HISTORY_DISMISSAL
+from sqlalchemy import text
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SQL = text("""
+    SELECT e.passport, h.action, h.poscode, h.surname FROM emplhistory h
+    JOIN employee e ON e.emplcode = h.emplcode
+    WHERE e.passport = ANY(:passports) AND e.filial = :filial
+    ORDER BY e.passport, h.historyid
+""")
+
+
+def run_async(coroutine_function, **options):
+    """Запуск сценария с отдельным асинхронным менеджером в собственном цикле событий"""
+    async def scenario():
+        async_db = await AsyncDatabaseManager(**options).connect()
+        try:
+            return await coroutine_function(async_db)
+        finally:
+            await async_db.close()
+
+    return asyncio.run(scenario())
+
+
+class TestAsyncDatabase(TestBase):
+    # Асинхронный менеджер работает на своих соединениях и должен видеть данные теста
+    ISOLATED = False
+
+    def test_async_new_employee_sync(self):
+        """Асинхронная синхронизация нескольких новых сотрудников"""
+        passports = [self.get_test_passport(number) for number in (11, 12, 13)]
+        # Сотрудник в Ф2 гарантирует коды выше тестовой границы для синхронизированных записей
+        self.add_employee('filial2', self.make_employee(self.get_test_passport(14), 2))
+        for passport in passports:
+            self.add_employee('filial1', self.make_employee(passport, 1))
+
+        results = run_async(lambda async_db: async_db.synchronize_employees('filial1', 'filial2', passports))
+        logger.info(f"Результаты асинхронной синхронизации: {results}")
+
+        assert all(results.values()), "Все сотрудники должны быть синхронизированы"
+        for passport in passports:
+            assert self.employee_exists('filial2', passport, filial=2)
+
+        # Повторная синхронизация не создает дубликатов
+        repeated = run_async(lambda async_db: async_db.safe_synchronize_employee('filial1', 'filial2', passports[0]))
+        assert not repeated
+
+    def test_async_bulk_sync_and_dismissal(self):
+        """Асинхронная пакетная синхронизация и синхронизация увольнения"""
+        new_passport = self.get_test_passport(15)
+        fired_passport = self.get_test_passport(16)
+        self.add_employee('filial1', self.make_employee(new_passport, 1))
+        self.add_employee('filial1', self.make_employee(fired_passport, 1))
+        self.add_employee('filial2', self.make_employee(fired_passport, 2, status='Fired'))
+
+        async def scenario(async_db):
+            return await async_db.gather(
+                async_db.bulk_synchronize_employees('filial1', 'filial2', [new_passport]),
+                async_db.safe_synchronize_dismissal('filial2', 'filial1', fired_passport)
+            )
+
+        outcomes, dismissed = run_async(scenario)
+
+        assert outcomes == {new_passport: SYNC_INSERTED}
+        assert dismissed, "Увольнение должно быть синхронизировано"
+
+        session = self.db.get_session('filial1')
+        try:
+            status = session.execute(
+                text("SELECT status FROM employee WHERE passport = :passport AND filial = 1"),
+                {'passport': fired_passport}
+            ).scalar()
+        finally:
+            session.close()
+        assert status == 'Fired'
+
+    def test_opposite_bulk_syncs_do_not_deadlock(self):
+        """Встречные пакетные синхронизации завершаются и при одном слоте на базу"""
+        passport_f1, passport_f2 = self.get_test_passport(17), self.get_test_passport(18)
+        self.add_employee('filial1', self.make_employee(passport_f1, 1))
+        self.add_employee('filial2', self.make_employee(passport_f2, 2))
+
+        async def scenario(async_db):
+            return await asyncio.wait_for(async_db.gather(
+                async_db.bulk_synchronize_employees('filial1', 'filial2', [passport_f1]),
+                async_db.bulk_synchronize_employees('filial2', 'filial1', [passport_f2])
+            ), timeout=30)
+
+        to_f2, to_f1 = run_async(scenario, max_concurrency=1)
+
+        assert to_f2 == {passport_f1: SYNC_INSERTED}
+        assert to_f1 == {passport_f2: SYNC_INSERTED}
+
+    def get_history(self, database_name, passports, filial):
+        with self.db.connection_scope(database_name) as conn:
+            history = {passport: [] for passport in passports}
+            for row in conn.execute(HISTORY_SQL, {'passports': passports, 'filial': filial}):
+                history[row.passport].append((row.action, row.poscode, row.surname))
+            return history
+
+    def test_async_sync_carries_history_like_sync_manager(self):
+        """Асинхронный менеджер переносит историю так же, как синхронный"""
+        bulk_hire, row_hire, existing, fired = [self.get_test_passport(number) for number in (19, 20, 21, 22)]
+        passports = [bulk_hire, row_hire, existing, fired]
+        self.add_employees('filial1', [self.make_employee(passport, surname='Историкова') for passport in passports])
+        self.add_employees('filial2', [self.make_employee(passport, 2, surname='Историкова')
+                                       for passport in (existing, fired)])
+        with self.db.connection_scope('filial1') as conn:
+            conn.execute(text("UPDATE employee SET poscode = 2 WHERE passport = ANY(:passports) AND filial = 1"),
+                         {'passports': [bulk_hire, row_hire, existing]})
+            conn.execute(text("UPDATE employee SET surname = 'Новикова' WHERE passport = :passport AND filial = 1"),
+                         {'passport': existing})
+            conn.execute(text("UPDATE employee SET status = 'Fired' WHERE passport = :passport AND filial = 1"),
+                         {'passport': fired})
+
+        async def scenario(async_db):
+            outcomes = await async_db.bulk_synchronize_employees('filial1', 'filial2', [bulk_hire, existing])
+            # Повторный построчный перенос существующему сотруднику записи не дублирует
+            synced = await async_db.gather(
+                async_db.safe_synchronize_employee('filial1', 'filial2', row_hire),
+                async_db.safe_synchronize_employee('filial1', 'filial2', existing),
+                async_db.safe_synchronize_dismissal('filial1', 'filial2', fired)
+            )
+            return outcomes, synced
+
+        outcomes, synced = run_async(scenario)
+
+        source = self.get_history('filial1', passports, 1)
+        target = self.get_history('filial2', passports, 2)
+        logger.info(f"История в Ф2: {target}")
+        hire = (HISTORY_HIRE, 1, 'Историкова')
+        transfer = (HISTORY_TRANSFER, 2, 'Историкова')
+        assert outcomes == {bulk_hire: SYNC_INSERTED, existing: SYNC_EXISTS}
+        assert synced == [True, False, True]
+        assert target[bulk_hire] == source[bulk_hire] == [hire, transfer]
+        assert target[row_hire] == source[row_hire] == [hire, transfer]
+        assert target[existing] == [hire, transfer, (HISTORY_RENAME, 2, 'Новикова')]
+        # Увольнение переносится из источника, а не пишется триггером целевой базы второй раз
+        assert target[fired] == [hire, (HISTORY_DISMISSAL, 1, 'Историкова')]
@@ -1,36 +1,95 @@
 import pytest
-from database import DatabaseManager
+from config import Config
+from database import get_shared_manager, TARGET_EXISTS_SQL, INSERT_EMPLOYEE_SQL
+from migrations import apply_migrations
+import itertools
+from datetime import date
 import logging
 from sqlalchemy import text
 import time
+import os
 
 logger = logging.getLogger(__name__)
 
+# Один идентификатор прогона на процесс pytest: вставки тестов регистрируются под ним
+# и удаляются очисткой точечно
+if not Config.TEST_RUN_ID:
+    Config.TEST_RUN_ID = f'pytest-{os.getpid()}-{int(time.time())}'
+
+# Номер воркера параллельного запуска (run_tests.py --workers): у каждого воркера свой
+# диапазон паспортов, поэтому генераторы не пересекаются даже на общей базе
+TEST_WORKER_ID = int(os.getenv('TEST_WORKER_ID', '0'))
+WORKER_SEQUENCE_SPAN = 100000
+
+# Счетчик процесса вместо time.time() в каждом тесте: два теста одной секунды не совпадают.
+# Начало зависит от времени, чтобы последовательные запуски не повторяли значения
+_test_sequence = itertools.count(int(time.time()) % (WORKER_SEQUENCE_SPAN // 2))
+
+# Базы, в которых процесс уже применил миграции схемы (индексы, журналы, триггеры)
+_migrated_databases = set()
+
+COUNT_EMPLOYEES_SQL = text("SELECT COUNT(*) FROM employee")
+COUNT_FILIAL_EMPLOYEES_SQL = text("SELECT COUNT(*) FROM employee WHERE filial = :filial")
+COUNT_CONFLICTS_SQL = text("SELECT COUNT(*) FROM conflist")
+COUNT_RESOLVED_CONFLICTS_SQL = text("SELECT COUNT(*) FROM conflist WHERE resolved = :resolved")
+COUNT_PASSPORT_SQL = text("SELECT COUNT(*) FROM employee WHERE passport = :passport")
+
 
 class TestBase:
+    # Тест выполняется во внешней транзакции на закрепленном соединении каждого филиала
+    # и откатывается в конце, очистка не нужна. Тесты, данные которых должны видеть
+    # другие соединения (потоки, асинхронный менеджер, DDL, водяные знаки по txid),
+    # отключают изоляцию и очищаются по реестру тестового прогона.
+    ISOLATED = True
+
     @pytest.fixture(autouse=True)
     def setup(self):
         """Настройка перед каждым тестом"""
-        self.db = DatabaseManager()
-        self.test_counter = int(time.time() % 10000)  # Уникальный базовый номер
+        # Общий менеджер: пулы соединений и проверка подключения переиспользуются между тестами
+        self.db = get_shared_manager()
+        # Миграции применяются до внешней транзакции теста: их DDL ждал бы ее блокировок
+        for database_name, engine in self.db.engines.items():
+            if database_name not in _migrated_databases:
+                apply_migrations(engine)
+                _migrated_databases.add(database_name)
+        self.test_counter = next(_test_sequence) % WORKER_SEQUENCE_SPAN  # Уникальный номер теста в воркере
+
+        if self.ISOLATED:
+            with self.db.unit_of_work(rollback_only=True):
+                yield
+            return
+
         yield
         # Очистка после каждого теста
         try:
             self.db.cleanup_test_data()
         except Exception as e:
             logger.warning(f"Ошибка при очистке тестовых данных: {e}")
-        finally:
-            self.db.close()
 
-    def get_next_test_code(self):
-        """Генерация следующего тестового кода сотрудника"""
-        self.test_counter += 1
-        return 6000 + self.test_counter
+    def get_next_test_code(self, database_name='filial1'):
+        """Следующий код сотрудника из аллокатора базы: тестовые вставки не занимают коды,
+        уже зарезервированные аллокатором для синхронизации"""
+        return self.db.allocators[database_name].next_code()
 
     def get_test_passport(self, test_number):
-        """Генерация тестового паспорта с временной меткой для уникальности"""
-        timestamp = int(time.time() % 10000)
-        return f'7{timestamp:04d}{test_number:02d}0'
+        """Генерация тестового паспорта: воркер, номер теста в воркере и номер паспорта в тесте"""
+        return f'7{TEST_WORKER_ID % 100:02d}{self.test_counter:05d}{test_number % 100:02d}'
+
+    def make_employee(self, passport, filial=1, **overrides):
+        """Данные тестового сотрудника с новым кодом; отдельные поля задаются через overrides"""
+        employee = {
+            'emplcode': self.get_next_test_code(self.db._database_for_filial(filial)),
+            'name': 'Иван',
+            'surname': 'Тестов',
+            'patronymic': 'Петрович',
+            'birthday': date(1985, 3, 22),
+            'passport': passport,
+            'poscode': 1,
+            'filial': filial,
+            'status': 'Active'
+        }
+        employee.update(overrides)
+        return employee
 
     def emulate_synchronization(self):
         """Эмуляция синхронизации между филиалами - безопасная версия"""
@@ -57,12 +116,9 @@ class TestBase:
         session = self.db.get_session(database_name)
         try:
             if filial:
-                result = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE filial = :filial"),
-                    {'filial': filial}
-                )
+                result = session.execute(COUNT_FILIAL_EMPLOYEES_SQL, {'filial': filial})
             else:
-                result = session.execute(text("SELECT COUNT(*) FROM employee"))
+                result = session.execute(COUNT_EMPLOYEES_SQL)
             return result.scalar()
         finally:
             session.close()
@@ -72,12 +128,9 @@ class TestBase:
         session = self.db.get_session(database_name)
         try:
             if resolved is not None:
-                result = session.execute(
-                    text("SELECT COUNT(*) FROM conflist WHERE resolved = :resolved"),
-                    {'resolved': resolved}
-                )
+                result = session.execute(COUNT_RESOLVED_CONFLICTS_SQL, {'resolved': resolved})
             else:
-                result = session.execute(text("SELECT COUNT(*) FROM conflist"))
+                result = session.execute(COUNT_CONFLICTS_SQL)
             return result.scalar()
         finally:
             session.close()
@@ -87,15 +140,9 @@ class TestBase:
         session = self.db.get_session(database_name)
         try:
             if filial:
-                result = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE passport = :passport AND filial = :filial"),
-                    {'passport': passport, 'filial': filial}
-                )
+                result = session.execute(TARGET_EXISTS_SQL, {'passport': passport, 'filial': filial})
             else:
-                result = session.execute(
-                    text("SELECT COUNT(*) FROM employee WHERE passport = :passport"),
-                    {'passport': passport}
-                )
+                result = session.execute(COUNT_PASSPORT_SQL, {'passport': passport})
             return result.scalar() > 0
         finally:
             session.close()
@@ -104,16 +151,14 @@ class TestBase:
         """Добавить сотрудника в указанную базу"""
         session = self.db.get_session(database_name)
         try:
-            session.execute(
-                text("""
-                    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
-                    VALUES (:emplcode, :name, :surname, :patronymic, :birthday, :passport, :poscode, :filial, :status)
-                """),
-                empl_data
-            )
+            session.execute(INSERT_EMPLOYEE_SQL, empl_data)
             session.commit()
         except Exception as e:
             session.rollback()
             raise e
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+
+    def add_employees(self, database_name, employees):
+        """Добавить набор сотрудников одним COPY; возвращает число вставленных"""
+        return self.db.bulk_load_employees(database_name, employees)
@@ -0,0 +1,47 @@
+import pytest
+from test_base import TestBase
+from diff_engine import DIFF_ADD, DIFF_UPDATE, DIFF_CONFLICT, DIFF_TARGET_ONLY
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestBranchDiff(TestBase):
+
+    def test_diff_reports_precise_delta(self):
+        """Сверка находит добавления, обновления, конфликты и записи только в target"""
+        logger.info("=== Сверка филиалов по хешам корзин ===")
+
+        same, fired, renamed, missing, extra = (self.get_test_passport(number) for number in range(31, 36))
+        for passport in (same, fired, renamed, missing):
+            self.add_employee('filial1', self.make_employee(passport, 1))
+        self.add_employees('filial2', [
+            self.make_employee(same, 2),
+            self.make_employee(fired, 2, status='Fired'),
+            self.make_employee(renamed, 2, surname='Другая'),
+            self.make_employee(extra, 2),
+        ])
+
+        delta = self.db.diff_branches('filial1', 'filial2')
+        logger.info(f"Статистика сверки: {delta['stats']}")
+
+        test_passports = {same, fired, renamed, missing, extra}
+        found = {kind: [passport for passport in delta[kind] if passport in test_passports]
+                 for kind in (DIFF_ADD, DIFF_UPDATE, DIFF_CONFLICT, DIFF_TARGET_ONLY)}
+        assert found == {
+            DIFF_ADD: [missing],
+            DIFF_UPDATE: [fired],
+            DIFF_CONFLICT: [renamed],
+            DIFF_TARGET_ONLY: [extra],
+        }
+
+        logger.info("✅ УСПЕХ: Сверка вернула точный набор расхождений")
+
+    def test_diff_of_branch_with_itself_is_empty(self):
+        """Совпадающие наборы не требуют спуска в корзины"""
+        self.add_employee('filial1', self.make_employee(self.get_test_passport(36), 1))
+
+        delta = self.db.diff_branches('filial1', 'filial1')
+
+        assert not any(delta[kind] for kind in (DIFF_ADD, DIFF_UPDATE, DIFF_CONFLICT, DIFF_TARGET_ONLY))
+        assert delta['stats']['levels'] == 1 and delta['stats']['rows'] == 0
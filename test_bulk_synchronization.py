@@ -0,0 +1,152 @@
+import pytest
+from test_base import TestBase
+from database import SYNC_INSERTED, SYNC_EXISTS, SYNC_NOT_FOUND
+from datetime import datetime, timedelta
+from sqlalchemy import text, bindparam
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestBulkSynchronization(TestBase):
+
+    def get_status(self, database_name, passport, filial):
+        session = self.db.get_session(database_name)
+        try:
+            return session.execute(
+                text("SELECT status FROM employee WHERE passport = :passport AND filial = :filial"),
+                {'passport': passport, 'filial': filial}
+            ).scalar()
+        finally:
+            session.close()
+
+    def test_bulk_new_employee_sync(self):
+        """Пакетная синхронизация: новые переносятся, существующие пропускаются"""
+        logger.info("=== Пакетная синхронизация новых сотрудников ===")
+
+        new_passport = self.get_test_passport(71)
+        existing_passport = self.get_test_passport(72)
+        missing_passport = self.get_test_passport(73)
+
+        self.add_employee('filial1', self.make_employee(new_passport, 1))
+        self.add_employee('filial1', self.make_employee(existing_passport, 1))
+        self.add_employee('filial2', self.make_employee(existing_passport, 2))
+
+        initial_f2_count = self.get_employee_count('filial2', filial=2)
+
+        outcomes = self.db.bulk_synchronize_employees(
+            'filial1', 'filial2', [new_passport, existing_passport, missing_passport]
+        )
+        logger.info(f"Результаты пакетной синхронизации: {outcomes}")
+
+        assert outcomes == {
+            new_passport: SYNC_INSERTED,
+            existing_passport: SYNC_EXISTS,
+            missing_passport: SYNC_NOT_FOUND
+        }
+        assert self.employee_exists('filial2', new_passport, filial=2), "Сотрудник не синхронизирован в Ф2"
+        assert self.get_employee_count('filial2', filial=2) == initial_f2_count + 1, \
+            "В Ф2 должен добавиться ровно один сотрудник"
+
+        # Повторный запуск ничего не добавляет
+        repeated = self.db.bulk_synchronize_employees('filial1', 'filial2', [new_passport])
+        assert repeated == {new_passport: SYNC_EXISTS}
+
+        logger.info("✅ УСПЕХ: Пакетная синхронизация выполнена")
+
+    def test_bulk_dismissal_sync(self):
+        """Пакетная синхронизация увольнений: один UPDATE, отчет об измененных и ненайденных"""
+        logger.info("=== Пакетная синхронизация увольнений ===")
+
+        fired_passport = self.get_test_passport(74)
+        same_passport = self.get_test_passport(75)
+        unmatched_passport = self.get_test_passport(76)
+
+        self.add_employee('filial1', self.make_employee(fired_passport, 1))
+        self.add_employee('filial1', self.make_employee(same_passport, 1, status='Fired'))
+        self.add_employee('filial2', self.make_employee(fired_passport, 2, status='Fired'))
+        self.add_employee('filial2', self.make_employee(same_passport, 2, status='Fired'))
+        self.add_employee('filial2', self.make_employee(unmatched_passport, 2, status='Fired'))
+
+        result = self.db.bulk_synchronize_dismissals('filial2', 'filial1')
+        logger.info(f"Результаты пакетной синхронизации увольнений: {result}")
+
+        assert fired_passport in result['updated_passports']
+        assert same_passport not in result['updated_passports'], "Совпадающий статус не должен обновляться"
+        assert unmatched_passport in result['unmatched']
+        assert self.get_status('filial1', fired_passport, 1) == 'Fired'
+
+        # С since учитываются только изменения после указанного момента
+        repeated = self.db.bulk_synchronize_dismissals(
+            'filial2', 'filial1', since=datetime.now() + timedelta(hours=1)
+        )
+        assert repeated == {'updated': 0, 'updated_passports': [], 'unmatched': []}
+
+        recent_passport = self.get_test_passport(84)
+        old_passport = self.get_test_passport(85)
+        for passport in (recent_passport, old_passport):
+            self.add_employee('filial1', self.make_employee(passport, 1))
+            self.add_employee('filial2', self.make_employee(passport, 2))
+        with self.db.connection_scope('filial2') as conn:
+            since = conn.execute(text("SELECT NOW()")).scalar()
+            conn.execute(text("UPDATE employee SET status = 'Fired' WHERE passport = ANY(:passports)"),
+                         {'passports': [recent_passport, old_passport]})
+            # Все изменения теста в одной транзакции: запись журнала одного увольнения сдвигается до since
+            conn.execute(text("""
+                UPDATE employee_changelog SET changedate = changedate - INTERVAL '1 day'
+                WHERE emplcode IN (SELECT emplcode FROM employee WHERE passport = :passport)
+            """), {'passport': old_passport})
+
+        result = self.db.bulk_synchronize_dismissals('filial2', 'filial1', since=since)
+        assert result['updated_passports'] == [recent_passport]
+        assert self.get_status('filial1', recent_passport, 1) == 'Fired'
+        assert self.get_status('filial1', old_passport, 1) == 'Active', "Изменение до since не переносится"
+
+        logger.info("✅ УСПЕХ: Пакетная синхронизация увольнений выполнена")
+
+    def test_stream_query_yields_bounded_partitions(self):
+        """Потоковое чтение отдает результат пачками не больше batch_size"""
+        passports = [self.get_test_passport(77 + offset) for offset in range(5)]
+        for passport in passports:
+            self.add_employee('filial1', self.make_employee(passport, 1, surname='Потоков'))
+
+        partitions = list(self.db.stream_query(
+            'filial1', "SELECT passport FROM employee WHERE surname = :surname ORDER BY passport",
+            {'surname': 'Потоков'}, batch_size=2
+        ))
+
+        assert [len(partition) for partition in partitions] == [2, 2, 1]
+        assert [row.passport for partition in partitions for row in partition] == sorted(passports)
+
+    def test_bulk_load_employees_via_copy(self):
+        """COPY-загрузка пропускает паспорта, уже существующие в филиале или повторенные в загрузке,
+        и экранирует спецсимволы"""
+        existing = self.make_employee(self.get_test_passport(82), 1)
+        self.add_employee('filial1', existing)
+
+        loaded = [
+            self.make_employee(self.get_test_passport(83), 1, surname='Таб\tуляция\\'),
+            self.make_employee(self.get_test_passport(84), 1, status='Fired'),
+            dict(existing, emplcode=self.get_next_test_code()),
+        ]
+        loaded[1]['patronymic'] = 'Олег\nович'
+        # Повтор паспорта внутри загрузки: вставляется только первая строка
+        loaded.append(dict(loaded[1], emplcode=self.get_next_test_code(), status='Active'))
+
+        assert self.add_employees('filial1', loaded) == 2
+
+        session = self.db.get_session('filial1')
+        try:
+            rows = session.execute(
+                text("SELECT passport, surname, patronymic, status FROM employee WHERE passport IN :passports")
+                .bindparams(bindparam('passports', expanding=True)),
+                {'passports': [employee['passport'] for employee in loaded[:2]]}
+            ).fetchall()
+        finally:
+            session.close()
+
+        assert len(rows) == 2
+        assert {row.passport: (row.surname, row.patronymic, row.status) for row in rows} == {
+            loaded[0]['passport']: ('Таб\tуляция\\', loaded[0]['patronymic'], 'Active'),
+            loaded[1]['passport']: (loaded[1]['surname'], 'Олег\nович', 'Fired'),
+        }
@@ -0,0 +1,143 @@
+import pytest
+from test_base import TestBase
+from conflict_engine import (
+    CONFLICT_PARTIAL_MATCH, MATCH_PASSPORT, MATCH_FIO,
+    RESOLUTION_MERGE, RESOLUTION_KEEP_BOTH, RESOLUTION_UPDATE_DATA
+)
+from datetime import date
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestConflictDetection(TestBase):
+
+    def get_conflicts(self, database_name, emplcode):
+        session = self.db.get_session(database_name)
+        try:
+            return session.execute(
+                text("""
+                    SELECT conflictid, conflict_type, other_emplcode, other_filial, errlist, resolved
+                    FROM conflist WHERE emplcode = :emplcode
+                """),
+                {'emplcode': emplcode}
+            ).fetchall()
+        finally:
+            session.close()
+
+    def test_partial_match_is_logged_in_both_filials(self):
+        """Совпадение 2 из 3 параметров регистрируется в обеих базах, полное совпадение - нет"""
+        logger.info("=== Поиск конфликтов по ключам блокировки ===")
+
+        # Совпадают ФИО и дата рождения, паспорта разные
+        employee_f1 = self.make_employee(self.get_test_passport(81), 1)
+        employee_f2 = self.make_employee(self.get_test_passport(82), 2)
+        # Один и тот же сотрудник в обоих филиалах
+        same_f1 = self.make_employee(self.get_test_passport(83), 1, surname='Полнова', birthday=date(1990, 1, 1))
+        same_f2 = dict(same_f1, emplcode=self.get_next_test_code('filial2'), filial=2)
+
+        for database_name, employee in (('filial1', employee_f1), ('filial2', employee_f2),
+                                        ('filial1', same_f1), ('filial2', same_f2)):
+            self.add_employee(database_name, employee)
+
+        result = self.db.detect_conflicts('filial1', 'filial2')
+        logger.info(f"Результат поиска конфликтов: {result}")
+
+        assert result['partial_matches'] >= 1
+        assert result['full_matches'] >= 1
+
+        conflicts_f2 = self.get_conflicts('filial2', employee_f2['emplcode'])
+        assert [(row.conflict_type, row.other_emplcode, row.other_filial) for row in conflicts_f2] == [
+            (CONFLICT_PARTIAL_MATCH, employee_f1['emplcode'], 1)
+        ]
+        assert employee_f1['surname'] in conflicts_f2[0].errlist
+
+        conflicts_f1 = self.get_conflicts('filial1', employee_f1['emplcode'])
+        assert [(row.conflict_type, row.other_emplcode, row.other_filial) for row in conflicts_f1] == [
+            (CONFLICT_PARTIAL_MATCH, employee_f2['emplcode'], 2)
+        ]
+
+        assert not self.get_conflicts('filial1', same_f1['emplcode']), "Полное совпадение не является конфликтом"
+
+        # Повторный запуск не дублирует записи журнала
+        repeated = self.db.detect_conflicts('filial1', 'filial2')
+        assert repeated['logged'] == 0
+        assert len(self.get_conflicts('filial2', employee_f2['emplcode'])) == 1
+
+        logger.info("✅ УСПЕХ: Конфликт 2 из 3 зарегистрирован в обоих филиалах")
+
+    def test_open_conflicts_use_structured_log(self):
+        """Неразрешенные конфликты выбираются по структурированным полям, повторы отсекает dedup_key"""
+        employee_f1 = self.make_employee(self.get_test_passport(84), 1, surname='Открытова')
+        employee_f2 = dict(employee_f1, emplcode=self.get_next_test_code('filial2'), filial=2, birthday=date(1970, 3, 3))
+        self.add_employee('filial1', employee_f1)
+        self.add_employee('filial2', employee_f2)
+
+        self.db.detect_conflicts('filial2', 'filial1')
+        self.db.detect_conflicts('filial1', 'filial2')
+
+        open_conflicts = [
+            row for row in self.db.get_open_conflicts('filial1', limit=1000)
+            if row.emplcode == employee_f1['emplcode']
+        ]
+        assert len(open_conflicts) == 1, "Конфликт должен быть записан один раз"
+        assert open_conflicts[0].matched_fields == MATCH_PASSPORT | MATCH_FIO
+        assert open_conflicts[0].other_emplcode == employee_f2['emplcode']
+
+        session = self.db.get_session('filial1')
+        try:
+            session.execute(
+                text("UPDATE conflist SET resolved = TRUE WHERE emplcode = :emplcode"),
+                {'emplcode': employee_f1['emplcode']}
+            )
+            session.commit()
+        finally:
+            session.close()
+
+        assert not [
+            row for row in self.db.get_open_conflicts('filial1', limit=1000)
+            if row.emplcode == employee_f1['emplcode']
+        ], "Разрешенный конфликт не должен попадать в список открытых"
+
+    def test_batch_resolution_propagates_to_other_filial(self):
+        """Решения по пачке конфликтов применяются по группам действий и доходят до другого филиала"""
+        actions = [RESOLUTION_MERGE, RESOLUTION_KEEP_BOTH, RESOLUTION_UPDATE_DATA]
+        pairs = []
+        for i, action in enumerate(actions):
+            # Совпадают паспорт и ФИО, даты рождения разные
+            employee_f1 = self.make_employee(self.get_test_passport(85 + i), 1, surname=f'Решенова{i}')
+            employee_f2 = dict(employee_f1, emplcode=self.get_next_test_code('filial2'), filial=2, birthday=date(1971, 1, 1))
+            self.add_employee('filial1', employee_f1)
+            self.add_employee('filial2', employee_f2)
+            pairs.append((employee_f1, employee_f2))
+        self.db.detect_conflicts('filial1', 'filial2')
+
+        decisions = [(self.get_conflicts('filial1', f1['emplcode'])[0].conflictid, action)
+                     for (f1, _), action in zip(pairs, actions)]
+        merged_code = pairs[0][1]['emplcode']
+        with self.db.connection_scope('filial2') as conn:
+            merged_rows = conn.execute(text("""
+                SELECT (SELECT COUNT(*) FROM emplhistory WHERE emplcode = :emplcode)
+                     + (SELECT COUNT(*) FROM conflist WHERE emplcode = :emplcode)
+            """), {'emplcode': merged_code}).scalar()
+
+        result = self.db.resolve_conflicts('filial1', decisions + [(-1, RESOLUTION_MERGE)])
+        logger.info(f"Результат разрешения: {result}")
+
+        assert result['resolved'] == 3 and result['unmatched'] == [-1]
+        assert result['actions'] == {action: 1 for action in actions}
+        # Слияние удаляет историю, конфликты и самого сотрудника, два других действия меняют по строке
+        assert result['propagated'] == merged_rows + 1 + 2
+        assert all(self.get_conflicts('filial1', f1['emplcode'])[0].resolved for f1, _ in pairs)
+
+        (_, merged), (_, kept), (_, updated) = pairs
+        assert not self.employee_exists('filial2', merged['passport'], filial=2), "Дубликат удаляется слиянием"
+        assert self.employee_exists('filial2', kept['passport'][:7] + '_R', filial=2)
+        assert self.employee_exists('filial2', 'R' + updated['passport'][1:], filial=2)
+        assert all(row.resolved for _, f2 in pairs[1:] for row in self.get_conflicts('filial2', f2['emplcode']))
+
+        # Повторное решение по уже разрешенным конфликтам ничего не меняет
+        assert self.db.resolve_conflicts('filial1', decisions)['resolved'] == 0
+        with pytest.raises(ValueError):
+            self.db.resolve_conflicts('filial1', [(decisions[0][0], 'DROP')])
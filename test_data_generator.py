@@ -0,0 +1,94 @@
+import pytest
+from test_base import TestBase
+from database import INSERT_EMPLOYEE_SQL
+from data_generator import (
+    GeneratorProfile, GENERATOR_PASSPORT_PATTERN, GENERATOR_POSCODE_BASE, source_employee_chunks,
+    target_employee_chunks, target_employee_count, load_branch_pair, purge_generated, passports,
+    is_duplicate, is_partial_match
+)
+from sqlalchemy import text
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def collect(chunks):
+    rows = []
+    for columns in chunks:
+        rows.extend(zip(columns['passport'].tolist(), columns['surname'].tolist(), columns['name'].tolist(),
+                        columns['patronymic'].tolist(), columns['birthday'].tolist()))
+    return rows
+
+
+class TestDataGenerator(TestBase):
+
+    def test_target_overlap_follows_profile(self):
+        """Получатель содержит точные дубликаты, совпадения по 2 из 3 ключей и собственных сотрудников"""
+        profile = GeneratorProfile(10000, duplicate_rate=0.3, partial_match_rate=0.1, target_only_rate=0.2)
+        source = collect(source_employee_chunks(profile, 1, 1, chunk_rows=3000))
+        target = collect(target_employee_chunks(profile, 2, 1, chunk_rows=3000))
+
+        assert len({row[0] for row in source}) == len(source) == 10000
+        by_passport = {row[0]: row for row in source}
+        by_person = {row[1:]: row for row in source}
+
+        exact = partial = 0
+        for row in target:
+            match = by_passport.get(row[0]) or by_person.get(row[1:])
+            if match == row:
+                exact += 1
+            elif match is not None:
+                # Совпадают ровно два ключа из трех: паспорт, ФИО, дата рождения
+                keys = [row[0] == match[0], row[1:4] == match[1:4], row[4] == match[4]]
+                assert sum(keys) == 2, (row, match)
+                partial += 1
+
+        logger.info(f"Получатель: {len(target)}, дубликатов {exact}, частичных совпадений {partial}")
+        assert abs(exact - 3000) <= 150 and abs(partial - 1000) <= 100
+        assert len(target) == exact + partial + 2000 == target_employee_count(profile, chunk_rows=3000)
+
+        # Доли совпадений считаются теми же функциями, по которым выбирает паспорта bench_suite
+        numbers = np.arange(profile.employees)
+        assert exact == np.count_nonzero(is_duplicate(numbers, profile))
+        assert partial == np.count_nonzero(is_partial_match(numbers, profile))
+        assert set(passports(numbers[is_duplicate(numbers, profile)]).tolist()) <= {row[0] for row in target}
+
+    def test_branch_pair_is_loaded_with_position_tree_and_history(self):
+        """Пара филиалов загружается через COPY с деревом должностей и историей по каждому сотруднику"""
+        profile = GeneratorProfile(2000, positions=100, position_fanout=4)
+
+        with self.db.connection_scope('filial1') as source_conn, self.db.connection_scope('filial2') as target_conn:
+            counts = load_branch_pair(source_conn, target_conn, profile, 1, 2)
+            loaded = source_conn.execute(text("""
+                SELECT (SELECT COUNT(*) FROM employee WHERE passport LIKE :pattern) AS employees,
+                       (SELECT COUNT(DISTINCT emplcode) FROM emplhistory
+                        WHERE passport LIKE :pattern AND action = 'Прием') AS hired,
+                       (SELECT COUNT(*) FROM positions p JOIN positions parent ON parent.poscode = p.parentpos
+                        WHERE p.poscode >= :pos_base) AS linked_positions
+            """), {'pattern': GENERATOR_PASSPORT_PATTERN, 'pos_base': GENERATOR_POSCODE_BASE}).fetchone()
+
+        logger.info(f"Загружено: {counts}")
+        assert counts['source']['employee'] == loaded.employees == loaded.hired == 2000
+        assert counts['source']['positions'] == 100 and loaded.linked_positions == 99
+        assert counts['source']['emplhistory'] > 2000
+        assert counts['target']['employee'] == pytest.approx(2000 * (0.3 + 0.05 + 0.2), rel=0.1)
+
+    def test_purge_keeps_employees_synced_after_generation(self):
+        """Сотрудник, получивший код после загрузки набора, не удаляется вместе с набором"""
+        profile = GeneratorProfile(500, positions=20)
+
+        with self.db.connection_scope('filial1') as source_conn, self.db.connection_scope('filial2') as target_conn:
+            load_branch_pair(source_conn, target_conn, profile, 1, 2)
+            # Код из аллокатора выдается после диапазона, зарезервированного генератором
+            employee = self.make_employee(self.get_test_passport(91), 1)
+            source_conn.execute(INSERT_EMPLOYEE_SQL, employee)
+
+            assert purge_generated(source_conn) > 0
+            remaining = source_conn.execute(text("""
+                SELECT COUNT(*) FILTER (WHERE passport LIKE :pattern) AS generated,
+                       COUNT(*) FILTER (WHERE emplcode = :emplcode) AS kept
+                FROM employee
+            """), {'pattern': GENERATOR_PASSPORT_PATTERN, 'emplcode': employee['emplcode']}).fetchone()
+
+        assert remaining.generated == 0 and remaining.kept == 1
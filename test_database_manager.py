@@ -0,0 +1,106 @@
+import pytest
+from test_base import TestBase
+from database import get_shared_manager
+from config import Config
+from sqlalchemy import create_engine, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestDatabaseManager(TestBase):
+    # Тесты проверяют собственные единицы работы и очистку зафиксированных данных
+    ISOLATED = False
+
+    def backend_pid(self, database_name):
+        session = self.db.get_session(database_name)
+        try:
+            return session.execute(text("SELECT pg_backend_pid()")).scalar()
+        finally:
+            session.close()
+
+    def test_shared_manager_is_reused(self):
+        """Общий менеджер создается один раз на процесс"""
+        assert get_shared_manager() is self.db
+
+    def test_unit_of_work_reuses_connection(self):
+        """Единица работы выполняет все операции на одном соединении и фиксирует их в конце"""
+        test_passport = self.get_test_passport(91)
+
+        with self.db.unit_of_work():
+            first_pid = self.backend_pid('filial1')
+            self.add_employee('filial1', self.make_employee(test_passport))
+            assert self.safe_sync_new_employee(test_passport), "Синхронизация должна быть успешной"
+            assert self.backend_pid('filial1') == first_pid, "Соединение должно переиспользоваться"
+
+        assert self.employee_exists('filial1', test_passport, filial=1)
+        assert self.employee_exists('filial2', test_passport, filial=2)
+
+    def test_unit_of_work_rolls_back_on_error(self):
+        """При ошибке внутри единицы работы изменения откатываются во всех базах"""
+        test_passport = self.get_test_passport(92)
+
+        with pytest.raises(RuntimeError):
+            with self.db.unit_of_work():
+                self.add_employee('filial1', self.make_employee(test_passport))
+                raise RuntimeError("прерывание прохода")
+
+        assert not self.employee_exists('filial1', test_passport)
+
+    def test_unit_of_work_uses_injected_connections(self):
+        """Операции менеджера выполняются на переданном соединении и откатываются вместе с ним"""
+        test_passport = self.get_test_passport(99)
+
+        with self.db.engines['filial1'].connect() as conn:
+            transaction = conn.begin()
+            with self.db.unit_of_work(connections={'filial1': conn}) as uow:
+                self.add_employee('filial1', self.make_employee(test_passport))
+                assert uow.connection('filial1') is conn
+
+            assert conn.execute(
+                text("SELECT COUNT(*) FROM employee WHERE passport = :passport"), {'passport': test_passport}
+            ).scalar() == 1
+            assert not self.employee_exists('filial1', test_passport), "Без фиксации запись не видна другим"
+            transaction.rollback()
+
+        assert not self.employee_exists('filial1', test_passport)
+
+    def test_cleanup_removes_only_registered_rows(self):
+        """Очистка удаляет пачками только записи, вставленные соединениями тестового прогона"""
+        registered = self.make_employee(self.get_test_passport(93))
+        self.add_employee('filial1', registered)
+        self.add_employees('filial1', [self.make_employee(self.get_test_passport(94 + i)) for i in range(4)])
+
+        # Соединение без идентификатора прогона: его вставки не регистрируются
+        foreign = self.make_employee(self.get_test_passport(98))
+        engine = create_engine(Config.get_db_url(self.db.branches['filial1']))
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("""
+                    INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+                    VALUES (:emplcode, :name, :surname, :patronymic, :birthday, :passport, :poscode, :filial, :status)
+                """), foreign)
+
+            removed = self.db.cleanup_test_data(batch_size=2)
+            assert removed['filial1'] == 5
+            assert not self.employee_exists('filial1', registered['passport'])
+            assert self.employee_exists('filial1', foreign['passport']), "Чужие записи не удаляются"
+        finally:
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM emplhistory WHERE emplcode = :emplcode"), {'emplcode': foreign['emplcode']})
+                conn.execute(text("DELETE FROM employee WHERE emplcode = :emplcode"), {'emplcode': foreign['emplcode']})
+            engine.dispose()
+
+
+class TestTransactionIsolation(TestBase):
+
+    def test_rows_are_invisible_outside_test_transaction(self):
+        """Данные изолированного теста видны только его транзакции"""
+        test_passport = self.get_test_passport(90)
+        self.add_employee('filial1', self.make_employee(test_passport, 1))
+
+        assert self.employee_exists('filial1', test_passport)
+        with self.db.engines['filial1'].connect() as conn:
+            assert conn.execute(
+                text("SELECT COUNT(*) FROM employee WHERE passport = :passport"), {'passport': test_passport}
+            ).scalar() == 0
@@ -0,0 +1,43 @@
+import pytest
+from test_base import TestBase
+from debug_database import collect_diagnostics, MODE_EXACT, MODE_ESTIMATE
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TestDiagnostics(TestBase):
+    # Диагностика читает базы своими соединениями из пула и не видит откатываемую транзакцию теста
+    ISOLATED = False
+
+    def test_exact_counters_follow_changes(self):
+        """Точный режим считает сотрудников по филиалам и статусам одним запросом"""
+        before = collect_diagnostics(self.db, MODE_EXACT)
+
+        self.add_employees('filial1', [
+            self.make_employee(self.get_test_passport(number), 1, status=status)
+            for number, status in ((41, 'Active'), (42, 'Fired'))
+        ])
+
+        after = collect_diagnostics(self.db, MODE_EXACT)
+        logger.info(f"Диагностика: {after}")
+
+        old, new = before['filial1']['filials'].get(1, {}), after['filial1']['filials'][1]
+        assert new['employees'] - old.get('employees', 0) == 2
+        assert new['active'] - old.get('active', 0) == 1
+        assert new['fired'] - old.get('fired', 0) == 1
+        assert after['filial1']['employees'] - before['filial1']['employees'] == 2
+        assert after['filial1']['test_rows'] - before['filial1']['test_rows'] == 2
+        assert after['filial2']['employees'] == before['filial2']['employees']
+
+    def test_estimate_mode_is_json_serializable(self):
+        """Режим оценки не читает таблицы, результат пригоден для вывода в JSON"""
+        diagnostics = collect_diagnostics(self.db, MODE_ESTIMATE)
+
+        assert set(diagnostics) == set(self.db.engines)
+        for state in diagnostics.values():
+            assert state['mode'] == MODE_ESTIMATE
+            assert state['open_conflicts'] is None
+            assert 'employee' in state['table_estimates']
+        assert json.loads(json.dumps(diagnostics))['filial1']['mode'] == MODE_ESTIMATE
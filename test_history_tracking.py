@@ -0,0 +1,120 @@
+import pytest
+from test_base import TestBase
+from database import SYNC_INSERTED, SYNC_EXISTS
+from history_tracking import HISTORY_HIRE, HISTORY_TRANSFER, HISTORY_RENAME, HISTORY_DISMISSAL
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SQL = text("""
+    SELECT e.passport, h.action, h.poscode, h.surname FROM emplhistory h
+    JOIN employee e ON e.emplcode = h.emplcode
+    WHERE e.passport = ANY(:passports) AND e.filial = :filial
+    ORDER BY e.passport, h.historyid
+""")
+
+
+class TestHistoryTracking(TestBase):
+
+    def get_history(self, database_name, passports, filial):
+        with self.db.connection_scope(database_name) as conn:
+            history = {passport: [] for passport in passports}
+            for row in conn.execute(HISTORY_SQL, {'passports': passports, 'filial': filial}):
+                history[row.passport].append((row.action, row.poscode, row.surname))
+            return history
+
+    def test_bulk_changes_are_recorded_set_wise(self):
+        """Массовые изменения одним оператором пишут по записи истории на каждого сотрудника"""
+        passports = [self.get_test_passport(50 + i) for i in range(3)]
+        assert self.add_employees('filial1', [self.make_employee(passport, surname='Историкова') for passport in passports]) == 3
+
+        with self.db.connection_scope('filial1') as conn:
+            reorg = conn.execute(
+                text("UPDATE employee SET poscode = 2 WHERE passport = ANY(:passports) AND filial = 1"),
+                {'passports': passports}
+            ).rowcount
+            conn.execute(text("UPDATE employee SET status = 'Fired' WHERE passport = :passport"),
+                         {'passport': passports[0]})
+            conn.execute(text("UPDATE employee SET surname = 'Новикова' WHERE passport = :passport"),
+                         {'passport': passports[1]})
+            # Оператор без фактических изменений историю не пишет
+            conn.execute(text("UPDATE employee SET poscode = poscode WHERE passport = ANY(:passports)"),
+                         {'passports': passports})
+
+        history = self.get_history('filial1', passports, 1)
+        logger.info(f"История: {history}")
+        assert reorg == 3
+        assert [action for action, _, _ in history[passports[0]]] == [HISTORY_HIRE, HISTORY_TRANSFER, HISTORY_DISMISSAL]
+        assert history[passports[1]][-1] == (HISTORY_RENAME, 2, 'Новикова')
+        assert history[passports[2]] == [(HISTORY_HIRE, 1, 'Историкова'), (HISTORY_TRANSFER, 2, 'Историкова')]
+
+    def test_status_change_without_dismissal_is_not_a_rename(self):
+        """Смена статуса без увольнения не пишет историю, смена фамилии вместе с ней пишется как смена фамилии"""
+        passports = [self.get_test_passport(56 + i) for i in range(2)]
+        self.add_employees('filial1', [self.make_employee(passport, surname='Историкова') for passport in passports])
+
+        with self.db.connection_scope('filial1') as conn:
+            conn.execute(text("UPDATE employee SET status = 'OnLeave' WHERE passport = :passport AND filial = 1"),
+                         {'passport': passports[0]})
+            conn.execute(
+                text("UPDATE employee SET status = 'OnLeave', surname = 'Новикова' "
+                     "WHERE passport = :passport AND filial = 1"),
+                {'passport': passports[1]}
+            )
+
+        history = self.get_history('filial1', passports, 1)
+        logger.info(f"История: {history}")
+        assert history[passports[0]] == [(HISTORY_HIRE, 1, 'Историкова')]
+        assert history[passports[1]] == [(HISTORY_HIRE, 1, 'Историкова'), (HISTORY_RENAME, 1, 'Новикова')]
+
+    def test_bulk_sync_carries_history_in_order(self):
+        """Пакетная синхронизация переносит историю новых сотрудников в исходном порядке без лишнего приема"""
+        passports = [self.get_test_passport(60 + i) for i in range(4)]
+        self.add_employees('filial1', [self.make_employee(passport, surname='Историкова') for passport in passports])
+        with self.db.connection_scope('filial1') as conn:
+            for poscode in (2, 3, 1):
+                conn.execute(
+                    text("UPDATE employee SET poscode = :poscode WHERE passport = ANY(:passports) AND filial = 1"),
+                    {'poscode': poscode, 'passports': passports[:2]}
+                )
+
+        outcomes = self.db.bulk_synchronize_employees('filial1', 'filial2', passports, batch_size=3)
+
+        source = self.get_history('filial1', passports, 1)
+        target = self.get_history('filial2', passports, 2)
+        logger.info(f"История в Ф2: {target}")
+        assert all(outcomes[passport] == SYNC_INSERTED for passport in passports)
+        assert target == source
+        assert [poscode for _, poscode, _ in target[passports[0]]] == [1, 2, 3, 1]
+        assert target[passports[3]] == [(HISTORY_HIRE, 1, 'Историкова')]
+
+    def test_sync_carries_history_deltas_of_existing_employees(self):
+        """Синхронизация переносит недостающие события сотрудников, которые уже есть в целевом филиале"""
+        passports = [self.get_test_passport(70 + i) for i in range(3)]
+        self.add_employees('filial1', [self.make_employee(passport, surname='Историкова') for passport in passports])
+        self.add_employees('filial2', [self.make_employee(passport, filial=2, surname='Историкова')
+                                       for passport in passports])
+        with self.db.connection_scope('filial1') as conn:
+            conn.execute(text("UPDATE employee SET poscode = 2 WHERE passport = ANY(:passports) AND filial = 1"),
+                         {'passports': passports})
+            conn.execute(text("UPDATE employee SET surname = 'Новикова' WHERE passport = :passport AND filial = 1"),
+                         {'passport': passports[0]})
+            conn.execute(text("UPDATE employee SET status = 'Fired' WHERE passport = :passport AND filial = 1"),
+                         {'passport': passports[2]})
+
+        # Пакетный и построчный пути, каждый дважды: повторный перенос записи не дублирует
+        for _ in range(2):
+            outcomes = self.db.bulk_synchronize_employees('filial1', 'filial2', passports[:1])
+            assert not self.db.safe_synchronize_employee('filial1', 'filial2', passports[1])
+            assert self.db.safe_synchronize_dismissal('filial1', 'filial2', passports[2])
+
+        target = self.get_history('filial2', passports, 2)
+        logger.info(f"История в Ф2: {target}")
+        hire = (HISTORY_HIRE, 1, 'Историкова')
+        transfer = (HISTORY_TRANSFER, 2, 'Историкова')
+        assert outcomes[passports[0]] == SYNC_EXISTS
+        assert target[passports[0]] == [hire, transfer, (HISTORY_RENAME, 2, 'Новикова')]
+        assert target[passports[1]] == [hire, transfer]
+        # Увольнение переносится из источника, а не пишется триггером целевой базы второй раз
+        assert target[passports[2]] == [hire, transfer, (HISTORY_DISMISSAL, 2, 'Историкова')]
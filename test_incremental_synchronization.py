@@ -0,0 +1,94 @@
+import pytest
+from test_base import TestBase
+from change_tracking import get_watermark, set_watermark, SAFE_UPPER_TXID_SQL
+from sqlalchemy import text
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DELETE_WATERMARK_SQL = text("DELETE FROM sync_watermark WHERE source_db = :source_db AND target_db = :target_db")
+
+
+class TestIncrementalSynchronization(TestBase):
+    # Водяной знак берется по завершенным транзакциям: изменения открытой транзакции теста не видны
+    ISOLATED = False
+
+    @pytest.fixture(autouse=True)
+    def keep_watermark(self, setup):
+        """Водяной знак рабочего направления filial1 -> filial2 восстанавливается после теста"""
+        with self.db.engines['filial2'].connect() as conn:
+            saved = get_watermark(conn, 'filial1', 'filial2')
+        yield
+        with self.db.engines['filial2'].begin() as conn:
+            if saved is None:
+                conn.execute(DELETE_WATERMARK_SQL, {'source_db': 'filial1', 'target_db': 'filial2'})
+            else:
+                set_watermark(conn, 'filial1', 'filial2', saved)
+
+    def start_from_current_watermark(self):
+        """Водяной знак на текущий момент, чтобы в проход попали только изменения теста"""
+        with self.db.engines['filial1'].connect() as source_conn:
+            upper_txid = source_conn.execute(SAFE_UPPER_TXID_SQL).scalar()
+        with self.db.engines['filial2'].begin() as target_conn:
+            set_watermark(target_conn, 'filial1', 'filial2', upper_txid)
+
+    def wait_for_safe_changes(self, timeout=30):
+        """Ожидание, пока водяной знак сможет дойти до последнего изменения источника.
+
+        xmin снимка общий для всего кластера: открытые транзакции других воркеров
+        параллельного запуска откладывают изменения теста до следующего прохода.
+        """
+        deadline = time.monotonic() + timeout
+        with self.db.engines['filial1'].connect() as source_conn:
+            last_txid = source_conn.execute(text("SELECT MAX(txid) FROM employee_changelog")).scalar()
+            while source_conn.execute(SAFE_UPPER_TXID_SQL).scalar() <= last_txid:
+                assert time.monotonic() < deadline, "Открытые транзакции не завершились"
+                source_conn.rollback()
+                time.sleep(0.05)
+
+    def test_incremental_sync_reads_only_changes(self):
+        """Инкрементальная синхронизация переносит только изменения после водяного знака"""
+        logger.info("=== Инкрементальная синхронизация ===")
+
+        self.start_from_current_watermark()
+
+        hired_passport = self.get_test_passport(81)
+        fired_passport = self.get_test_passport(82)
+
+        self.add_employee('filial2', self.make_employee(fired_passport, 2))
+        self.add_employee('filial1', self.make_employee(fired_passport, 1))
+        self.add_employee('filial1', self.make_employee(hired_passport, 1))
+
+        self.wait_for_safe_changes()
+        first = self.db.sync_incremental('filial1', 'filial2')
+        logger.info(f"Первый проход: {first}")
+
+        assert not first['full_scan'], "Проход должен идти по журналу изменений"
+        assert first['inserted'] == 1, f"Ожидался 1 новый сотрудник, получено: {first['inserted']}"
+        assert self.employee_exists('filial2', hired_passport, filial=2)
+
+        # Увольнение в Ф1 попадает в следующий проход
+        session = self.db.get_session('filial1')
+        try:
+            session.execute(
+                text("UPDATE employee SET status = 'Fired' WHERE passport = :passport AND filial = 1"),
+                {'passport': fired_passport}
+            )
+            session.commit()
+        finally:
+            session.close()
+
+        self.wait_for_safe_changes()
+        second = self.db.sync_incremental('filial1', 'filial2')
+        logger.info(f"Второй проход: {second}")
+
+        assert second['inserted'] == 0
+        assert second['updated'] == 1, f"Ожидалось 1 обновление статуса, получено: {second['updated']}"
+        assert second['watermark'] >= first['watermark']
+
+        # Без новых изменений проход ничего не применяет
+        third = self.db.sync_incremental('filial1', 'filial2')
+        assert third['inserted'] == 0 and third['updated'] == 0
+
+        logger.info("✅ УСПЕХ: Инкрементальная синхронизация применяет только изменения")
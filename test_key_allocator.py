@@ -0,0 +1,42 @@
+import pytest
+from test_base import TestBase
+from key_allocator import EmplcodeAllocator
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TestKeyAllocator(TestBase):
+    # Воркеры вставляют сотрудников из разных потоков на своих соединениях
+    ISOLATED = False
+
+    def test_concurrent_allocation_has_no_collisions(self):
+        """Параллельные воркеры с отдельными аллокаторами не получают одинаковых кодов"""
+        logger.info("=== Стресс-тест аллокатора табельных номеров ===")
+
+        workers = 8
+        codes_per_worker = 500
+        engine = self.db.engines['filial2']
+
+        def worker(_):
+            allocator = EmplcodeAllocator(engine, block_size=50)
+            return [allocator.next_code() for _ in range(codes_per_worker)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(worker, range(workers)))
+        elapsed = time.perf_counter() - started
+
+        codes = [code for worker_codes in results for code in worker_codes]
+        logger.info(f"Выдано {len(codes)} кодов за {elapsed:.3f} с ({len(codes) / elapsed:.0f} кодов/с)")
+
+        assert len(codes) == workers * codes_per_worker
+        assert len(set(codes)) == len(codes), "Аллокатор выдал повторяющиеся коды"
+
+        # Диапазон, зарезервированный после воркеров, не пересекается с уже выданными
+        tail = self.db.allocators['filial2'].reserve_range(10)
+        assert min(tail) > max(codes), "Новый диапазон пересекается с выданными кодами"
+
+        logger.info("✅ УСПЕХ: Коллизий табельных номеров нет")
@@ -0,0 +1,79 @@
+import pytest
+from test_base import TestBase
+from database import DatabaseManager
+from metrics import (
+    MetricsRegistry, OPERATION_SECONDS, OPERATION_ROWS, OPERATION_ROUND_TRIPS, POOL_WAIT_SECONDS,
+    OUTCOME_OK, OUTCOME_SKIPPED
+)
+from datetime import date
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def operation_labels(operation, database, outcome=None):
+    labels = {'database': database, 'operation': operation}
+    if outcome is not None:
+        labels['outcome'] = outcome
+    return tuple(sorted(labels.items()))
+
+
+class TestMetrics(TestBase):
+
+    def test_sync_operation_is_measured(self):
+        """Синхронизация сотрудника записывает длительность, исход, строки и запросы к базе"""
+        passport = self.get_test_passport(1)
+        self.add_employee('filial1', {
+            'emplcode': self.get_next_test_code(),
+            'name': 'Игорь',
+            'surname': 'Метрикин',
+            'patronymic': 'Олегович',
+            'birthday': date(1983, 6, 15),
+            'passport': passport,
+            'poscode': 1,
+            'filial': 1,
+            'status': 'Active'
+        })
+
+        metrics = self.db.metrics
+        before = metrics.snapshot()
+        assert self.db.safe_synchronize_employee('filial1', 'filial2', passport)
+        assert not self.db.safe_synchronize_employee('filial1', 'filial2', passport)
+        after = metrics.snapshot()
+
+        def delta(kind, key):
+            old = before[kind].get(key, (0, 0) if kind == 'histograms' else 0)
+            new = after[kind][key]
+            return new[0] - old[0] if kind == 'histograms' else new - old
+
+        name = 'safe_synchronize_employee'
+        assert delta('histograms', (OPERATION_SECONDS, operation_labels(name, 'filial2', OUTCOME_OK))) == 1
+        assert delta('histograms', (OPERATION_SECONDS, operation_labels(name, 'filial2', OUTCOME_SKIPPED))) == 1
+        assert delta('counters', (OPERATION_ROWS, operation_labels(name, 'filial2'))) == 1
+        # Проверка в target, чтение source и вставка, затем только проверка в target
+        assert delta('counters', (OPERATION_ROUND_TRIPS, operation_labels(name, 'filial2'))) >= 4
+
+        exposition = metrics.render_prometheus()
+        logger.info(exposition)
+        assert f'# TYPE {OPERATION_SECONDS} histogram' in exposition
+        assert f'{OPERATION_SECONDS}_count{{database="filial2",operation="{name}",outcome="ok"}}' in exposition
+
+    def test_pool_wait_is_recorded_and_disabled_registry_stays_empty(self):
+        """Ожидание соединения пишется через события пула; выключенный реестр ничего не собирает"""
+        enabled, disabled = MetricsRegistry(), MetricsRegistry(enabled=False)
+        managers = [DatabaseManager(metrics=enabled), DatabaseManager(metrics=disabled)]
+        try:
+            for manager in managers:
+                manager.execute_function('filial1', 'now')
+
+            snapshot = enabled.snapshot()
+            wait_count, wait_sum = snapshot['histograms'][(POOL_WAIT_SECONDS, (('database', 'filial1'),))]
+            assert wait_count >= 1 and wait_sum >= 0
+            assert snapshot['histograms'][
+                (OPERATION_SECONDS, operation_labels('execute_function', 'filial1', OUTCOME_OK))][0] == 1
+
+            assert disabled.snapshot() == {'counters': {}, 'histograms': {}}
+            assert disabled.render_prometheus() == ''
+        finally:
+            for manager in managers:
+                manager.close()
@@ -0,0 +1,54 @@
+import pytest
+from test_base import TestBase
+from migrations import MIGRATIONS, apply_migrations, check_hot_queries
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Объем данных, при котором планировщик выбирает индекс, если он есть
+FIXTURE_ROWS = 20000
+FIXTURE_BASE_CODE = 300000
+
+
+class TestMigrations(TestBase):
+    # DDL миграций ждал бы блокировок, удерживаемых транзакцией теста
+    ISOLATED = False
+
+    def seed_fixture(self, database_name):
+        """Сотрудники, история и разрешенные конфликты в объеме, близком к рабочему.
+
+        Записи о приеме в emplhistory пишет триггер истории при вставке сотрудников.
+        """
+        with self.db.engines[database_name].begin() as conn:
+            conn.execute(text("""
+                INSERT INTO employee (emplcode, name, surname, patronymic, birthday, passport, poscode, filial, status)
+                SELECT :base_code + i, 'Индекс', 'Проверкин' || i, 'Планович', DATE '1980-01-01' + i % 10000,
+                       'M' || lpad(i::text, 9, '0'), 1 + i % 4, 1,
+                       CASE WHEN i % 100 = 0 THEN 'Fired' ELSE 'Active' END
+                FROM generate_series(0, :count - 1) AS i
+            """), {'base_code': FIXTURE_BASE_CODE, 'count': FIXTURE_ROWS})
+            conn.execute(text("""
+                INSERT INTO conflist (emplcode, errlist, resolved)
+                SELECT emplcode, 'Разрешенный конфликт', TRUE
+                FROM employee WHERE passport LIKE 'M%' AND filial = 1
+            """))
+            for table in ('employee', 'emplhistory', 'conflist'):
+                conn.execute(text(f"ANALYZE {table}"))
+
+    def test_migrations_are_rerunnable(self):
+        """Повторный запуск миграций ничего не применяет и не падает"""
+        engine = self.db.engines['filial1']
+        apply_migrations(engine)
+        assert apply_migrations(engine) == []
+
+        with engine.connect() as conn:
+            applied = set(conn.execute(text("SELECT migration_id FROM schema_migrations")).scalars())
+        assert {migration_id for migration_id, _ in MIGRATIONS} <= applied
+
+    def test_hot_queries_use_indexes(self):
+        """На данных рабочего объема горячие запросы не читают таблицы последовательно"""
+        apply_migrations(self.db.engines['filial1'])
+        self.seed_fixture('filial1')
+
+        check_hot_queries(self.db.engines['filial1'])
@@ -0,0 +1,39 @@
+import pytest
+from test_base import TestBase
+from query_catalog import CatalogQuery, PREPARED_PREFIX
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+PREPARED_STATEMENTS_SQL = text("SELECT name FROM pg_prepared_statements WHERE name LIKE :prefix")
+
+
+class TestQueryCatalog(TestBase):
+
+    def test_execute_function_binds_any_arity(self):
+        """Функция вызывается с любым числом аргументов, имя функции проверяется"""
+        assert len(self.db.execute_function('filial1', 'now')) == 1
+        assert self.db.execute_function('filial1', 'length', 'абвг')[0][0] == 4
+        assert self.db.execute_function('filial1', 'left', 'филиал', 3)[0][0] == 'фил'
+        assert self.db.execute_function('filial1', 'pg_catalog.concat_ws', '-', 'a', 'b')[0][0] == 'a-b'
+        with pytest.raises(ValueError):
+            self.db.execute_function('filial1', 'now(); DROP TABLE employee; SELECT now')
+
+    def test_sync_uses_server_prepared_statements(self):
+        """Горячие запросы готовятся на сервере один раз и выполняются через EXECUTE"""
+        query = CatalogQuery('probe', "SELECT :a::int + :b + :a")
+        assert query.prepare_sql == f"PREPARE {PREPARED_PREFIX}probe AS SELECT $1::int + $2 + $1"
+        assert query.params == ('a', 'b')
+
+        passports = [self.get_test_passport(70 + i) for i in range(2)]
+        for passport in passports:
+            self.add_employee('filial1', self.make_employee(passport, 1))
+            assert self.db.safe_synchronize_employee('filial1', 'filial2', passport)
+            assert self.employee_exists('filial2', passport, filial=2)
+
+        with self.db.connection_scope('filial2') as conn:
+            prepared = {row.name for row in conn.execute(PREPARED_STATEMENTS_SQL, {'prefix': f'{PREPARED_PREFIX}%'})}
+            logger.info(f"Подготовленные операторы: {prepared}")
+            assert {f'{PREPARED_PREFIX}target_exists', f'{PREPARED_PREFIX}insert_employee'} <= prepared
+            assert prepared == conn.connection.info['prepared_statements']
@@ -0,0 +1,135 @@
+import pytest
+from test_base import TestBase
+from retry_executor import RetryExecutor, RetryPolicy, RETRY_CONTENTION, classify_error
+from metrics import MetricsRegistry, RETRIES, RETRIES_EXHAUSTED, BATCH_SPLITS
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOCK_POSITION_SQL = text("SELECT poscode FROM positions WHERE poscode = 1 FOR UPDATE NOWAIT")
+
+
+class DeadlockDetected(Exception):
+    """Ошибка с SQLSTATE deadlock_detected, как у psycopg2"""
+    pgcode = '40P01'
+
+
+class SerializationFailure(Exception):
+    """Ошибка с SQLSTATE serialization_failure, как у psycopg2"""
+    pgcode = '40001'
+
+
+class TestRetryExecutor(TestBase):
+
+    def make_executor(self, attempts=4):
+        registry = MetricsRegistry()
+        return RetryExecutor(registry, RetryPolicy(attempts, 0.001, 0.01), sleep=lambda delay: None), registry
+
+    def counter(self, registry, name, **labels):
+        return sum(value for (metric, metric_labels), value in registry.snapshot()['counters'].items()
+                   if metric == name and all(item in metric_labels for item in labels.items()))
+
+    def test_contention_splits_batch_and_retries_only_failed_subset(self):
+        """Ошибка конкуренции делит пачку, успешные части повторно не выполняются"""
+        executor, registry = self.make_executor()
+        applied = []
+        failures = {'hot': 2}
+
+        def apply_batch(batch):
+            applied.append(list(batch))
+            if 'hot' in batch and failures['hot']:
+                failures['hot'] -= 1
+                raise DeadlockDetected('deadlock detected')
+            return {item: 'ok' for item in batch}
+
+        items = [f'p{i}' for i in range(6)] + ['hot'] + [f'q{i}' for i in range(5)]
+        results, failed = executor.run_batches(items, apply_batch, 4, operation='test', database='filial1')
+        logger.info(f"Выполненные пачки: {applied}")
+
+        assert failed == [] and results == {item: 'ok' for item in items}
+        # Каждый элемент, кроме элементов прерванных пачек, выполнен один раз
+        assert sum(batch.count('p0') for batch in applied) == 1
+        assert ['hot'] in applied, "Пачка с конфликтующей строкой делится до одной строки"
+        assert self.counter(registry, RETRIES, sqlstate='40P01') == 2
+        assert self.counter(registry, BATCH_SPLITS) == 2
+
+        # Пачка, не выполненная за все попытки, возвращается отдельно, остальные выполняются
+        failures['hot'] = 100
+        results, failed = executor.run_batches(items, apply_batch, 4, operation='test', database='filial1')
+        assert failed == ['hot'] and len(results) == len(items) - 1
+        assert self.counter(registry, RETRIES_EXHAUSTED) == 1
+
+    def test_lock_conflict_is_retried_until_released(self):
+        """Отказ NOWAIT из-за блокировки (55P03) повторяется, постоянная ошибка - нет"""
+        executor, registry = self.make_executor()
+        holder = self.db.engines['filial1'].connect()
+        holder_transaction = holder.begin()
+        holder.execute(text("SELECT poscode FROM positions WHERE poscode = 1 FOR UPDATE"))
+        attempts = []
+
+        def lock_position():
+            attempts.append(1)
+            with self.db.engines['filial1'].connect() as conn:
+                try:
+                    return conn.execute(LOCK_POSITION_SQL).scalar()
+                except Exception as e:
+                    assert classify_error(e) == RETRY_CONTENTION
+                    # Держатель блокировки завершает транзакцию после первого отказа
+                    if holder_transaction.is_active:
+                        holder_transaction.rollback()
+                    raise
+
+        try:
+            assert executor.call(lock_position, operation='lock', database='filial1') == 1
+        finally:
+            holder.close()
+        assert len(attempts) == 2
+        assert self.counter(registry, RETRIES, sqlstate='55P03') == 1
+
+        def broken_query():
+            attempts.append(1)
+            with self.db.engines['filial1'].connect() as conn:
+                conn.execute(text("SELECT missing_column FROM positions"))
+
+        attempts.clear()
+        with pytest.raises(Exception):
+            executor.call(broken_query, operation='broken', database='filial1')
+        assert len(attempts) == 1, "Постоянная ошибка не повторяется"
+
+
+class TestManagerRetries(TestBase):
+    # Повторы выполняются только вне единицы работы, а изолированный тест идет внутри нее
+    ISOLATED = False
+
+    def test_safe_sync_retries_outside_unit_of_work_only(self, monkeypatch):
+        """Менеджер повторяет синхронизацию после ошибки сериализации, но не внутри единицы работы"""
+        registry = MetricsRegistry()
+        executor = RetryExecutor(registry, RetryPolicy(4, 0.001, 0.01), sleep=lambda delay: None)
+        monkeypatch.setattr(self.db, 'retry', executor)
+        synchronize_once = self.db._synchronize_employee_once
+        attempts = []
+
+        def fail_first_attempt(*args):
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise SerializationFailure('could not serialize access due to concurrent update')
+            return synchronize_once(*args)
+
+        monkeypatch.setattr(self.db, '_synchronize_employee_once', fail_first_attempt)
+        retried, single = self.get_test_passport(90), self.get_test_passport(91)
+        for passport in (retried, single):
+            self.add_employee('filial1', self.make_employee(passport, 1))
+
+        assert self.db.safe_synchronize_employee('filial1', 'filial2', retried)
+        assert len(attempts) == 2
+        assert self.employee_exists('filial2', retried, filial=2)
+
+        # Внутри единицы работы ошибка сериализации прерывает всю транзакцию: повтор не выполняется
+        attempts.clear()
+        with self.db.unit_of_work():
+            assert not self.db.safe_synchronize_employee('filial1', 'filial2', single)
+        assert len(attempts) == 1
+        assert not self.employee_exists('filial2', single, filial=2)
+        assert sum(value for (metric, labels), value in registry.snapshot()['counters'].items()
+                   if metric == RETRIES and ('sqlstate', '40001') in labels) == 1
@@ -0,0 +1,157 @@
+import pytest
+from test_base import TestBase
+from database import DatabaseManager
+from change_tracking import set_watermark, SAFE_UPPER_TXID_SQL
+from sync_scheduler import SyncScheduler, SyncTask, plan_pairwise, plan_hub_and_spoke
+from sqlalchemy import text
+from types import SimpleNamespace
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class RecordingOperation:
+    """Операция-заглушка: запоминает порядок направлений и нагрузку на филиалы"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.finished = []
+        self.active = {}
+        self.max_active = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, source, target):
+        with self._lock:
+            for name in (source, target):
+                self.active[name] = self.active.get(name, 0) + 1
+                self.max_active[name] = max(self.max_active.get(name, 0), self.active[name])
+        time.sleep(0.02)
+        with self._lock:
+            for name in (source, target):
+                self.active[name] -= 1
+            self.finished.append((source, target))
+        if (source, target) in self.fail:
+            raise RuntimeError("сбой направления")
+        return {'inserted': 0, 'updated': 0}
+
+
+def make_manager(branch_count):
+    names = [f'filial{number}' for number in range(1, branch_count + 1)]
+    return SimpleNamespace(engines={name: None for name in names}, sync_incremental=None), names
+
+
+class TestSyncScheduler:
+
+    def test_pairwise_plan_covers_all_directions(self):
+        """Попарный план содержит все упорядоченные пары филиалов"""
+        _, names = make_manager(4)
+        tasks = plan_pairwise(names)
+        assert len(tasks) == 4 * 3
+        assert all(not task.depends_on for task in tasks)
+
+    def test_branch_limit_is_respected(self):
+        """С одним филиалом одновременно работает не больше branch_limit направлений"""
+        manager, names = make_manager(4)
+        operation = RecordingOperation()
+        scheduler = SyncScheduler(manager, operation=operation, max_workers=8, branch_limit=1)
+
+        results = scheduler.run(plan_pairwise(names))
+
+        assert len(results) == 12
+        assert all(result.error is None for result in results.values())
+        assert max(operation.max_active.values()) == 1
+
+    def test_hub_and_spoke_runs_collection_first(self):
+        """В схеме "звезда" раздача из центра начинается после сбора всех изменений"""
+        manager, names = make_manager(4)
+        operation = RecordingOperation()
+        scheduler = SyncScheduler(manager, operation=operation, max_workers=4, branch_limit=3)
+
+        scheduler.run(plan_hub_and_spoke('filial1', names))
+
+        collected = [index for index, (_, target) in enumerate(operation.finished) if target == 'filial1']
+        distributed = [index for index, (source, _) in enumerate(operation.finished) if source == 'filial1']
+        assert max(collected) < min(distributed)
+
+    def test_failed_dependency_skips_dependents(self):
+        """Направления, зависящие от упавшего, не запускаются"""
+        manager, names = make_manager(3)
+        operation = RecordingOperation(fail=[('filial2', 'filial1')])
+        scheduler = SyncScheduler(manager, operation=operation, max_workers=2)
+
+        results = scheduler.run(plan_hub_and_spoke('filial1', names))
+
+        assert results[('filial2', 'filial1')].error is not None
+        assert results[('filial1', 'filial3')].error is not None
+        assert ('filial1', 'filial3') not in operation.finished
+
+    def test_cyclic_plan_is_rejected(self):
+        """Циклические зависимости обнаруживаются до запуска"""
+        manager, _ = make_manager(2)
+        tasks = [
+            SyncTask('filial1', 'filial2', (('filial2', 'filial1'),)),
+            SyncTask('filial2', 'filial1', (('filial1', 'filial2'),)),
+        ]
+        with pytest.raises(ValueError):
+            SyncScheduler(manager, operation=RecordingOperation()).run(tasks)
+
+
+class TestHubAndSpokeSync(TestBase):
+    # Водяные знаки берутся по завершенным транзакциям, направления работают на своих соединениях
+    ISOLATED = False
+
+    HUB = 'hub_test'
+    SPOKE_A = 'spoke_a_test'
+    SPOKE_B = 'spoke_b_test'
+
+    def make_registry(self):
+        """Звезда из трех филиалов на тестовых базах: второй луч - филиал 3 в базе filial2.
+
+        Собственные имена направлений не трогают водяные знаки filial1 -> filial2.
+        """
+        return DatabaseManager({
+            self.HUB: dict(self.db.branches['filial1']),
+            self.SPOKE_A: dict(self.db.branches['filial2']),
+            self.SPOKE_B: {**self.db.branches['filial2'], 'filial': 3},
+        })
+
+    def start_from_current_watermarks(self, manager, tasks):
+        for task in tasks:
+            with manager.engines[task.source].connect() as source_conn:
+                upper_txid = source_conn.execute(SAFE_UPPER_TXID_SQL).scalar()
+            with manager.engines[task.target].begin() as target_conn:
+                set_watermark(target_conn, task.source, task.target, upper_txid)
+
+    def drop_watermarks(self, manager):
+        for engine in manager.engines.values():
+            with engine.begin() as conn:
+                conn.execute(text("DELETE FROM sync_watermark WHERE source_db = ANY(:names)"),
+                             {'names': list(manager.engines)})
+
+    def sync_until_delivered(self, manager, passports, attempts=3):
+        """Проходы плана до доставки во второй луч: xmin кластера может отложить изменения до следующего"""
+        for _ in range(attempts):
+            results = manager.sync_all_branches(hub=self.HUB)
+            assert all(result.error is None for result in results.values())
+            if all(self.employee_exists('filial2', passport, filial=3) for passport in passports):
+                return True
+        return False
+
+    def test_hub_relays_spoke_changes_on_every_run(self):
+        """Центральный филиал раздает новых сотрудников одного луча другому и после первого прохода"""
+        manager = self.make_registry()
+        try:
+            self.start_from_current_watermarks(manager, plan_hub_and_spoke(self.HUB, list(manager.engines)))
+
+            passports = []
+            for number in (31, 32):
+                passports.append(self.get_test_passport(number))
+                self.add_employee('filial2', self.make_employee(passports[-1], 2))
+
+                assert self.sync_until_delivered(manager, passports), f"Сотрудники {passports} не дошли до луча B"
+                assert all(self.employee_exists('filial1', passport, filial=1) for passport in passports)
+        finally:
+            self.drop_watermarks(manager)
+            manager.close()
@@ -1,5 +1,6 @@
 import pytest
 from test_base import TestBase
+from conflict_engine import CONFLICT_PARTIAL_MATCH, MATCH_FIO, MATCH_BIRTHDAY
 from datetime import date, datetime
 import logging
 from sqlalchemy import text
@@ -99,7 +100,7 @@ class TestSynchronization(TestBase):
         # Используем уникальные тестовые данные
         test_passport = self.get_test_passport(2)
         empl_code_f1 = self.get_next_test_code()
-        empl_code_f2 = self.get_next_test_code()
+        empl_code_f2 = self.get_next_test_code('filial2')
 
         # Проверяем, что такого сотрудника точно нет в базах
         employee_exists = self.employee_exists('filial1', test_passport) or self.employee_exists('filial2',
@@ -225,7 +226,7 @@ class TestSynchronization(TestBase):
         }
 
         employee_data_f2 = {
-            'emplcode': self.get_next_test_code(),
+            'emplcode': self.get_next_test_code('filial2'),
             'name': 'Иван',
             'surname': 'Петров',
             'patronymic': 'Сергеевич',
@@ -292,7 +293,7 @@ class TestSynchronization(TestBase):
         }
 
         employee_data_f2 = {
-            'emplcode': self.get_next_test_code(),
+            'emplcode': self.get_next_test_code('filial2'),
             'name': 'Мария',
             'surname': 'Сидорова',
             'patronymic': 'Ивановна',
@@ -311,8 +312,8 @@ class TestSynchronization(TestBase):
         initial_conflicts_f1 = self.get_conflict_count('filial1')
         initial_conflicts_f2 = self.get_conflict_count('filial2')
 
-        # Эмуляция обнаружения конфликта
-        self._simulate_conflict_detection(test_passport_f1, test_passport_f2)
+        # Поиск конфликтов между филиалами
+        self.db.detect_conflicts('filial1', 'filial2')
 
         # Шаг 3: Проверяем, что конфликт зарегистрирован
         final_conflicts_f1 = self.get_conflict_count('filial1')
@@ -325,16 +326,24 @@ class TestSynchronization(TestBase):
         assert final_conflicts_f1 > initial_conflicts_f1 or final_conflicts_f2 > initial_conflicts_f2, \
             "Должен быть зарегистрирован хотя бы один конфликт"
 
-        # Проверяем содержимое журнала конфликтов
+        # Проверяем содержимое журнала конфликтов по структурированным полям
         session = self.db.get_session('filial1')
         try:
             conflict = session.execute(
-                text("SELECT errlist FROM conflist WHERE errlist LIKE '%Сидорова%'")
+                text("""
+                    SELECT conflict_type, other_emplcode, other_filial, matched_fields, errlist
+                    FROM conflist
+                    WHERE emplcode = :emplcode AND NOT resolved
+                """),
+                {'emplcode': employee_data_f1['emplcode']}
             ).fetchone()
 
-            if conflict:
-                logger.info(f"Найден конфликт: {conflict[0]}")
-                assert 'Сидорова' in conflict[0], "В описании конфликта должна быть фамилия сотрудника"
+            assert conflict, "Конфликт должен быть зарегистрирован для сотрудника Ф1"
+            logger.info(f"Найден конфликт: {conflict.errlist}")
+            assert conflict.conflict_type == CONFLICT_PARTIAL_MATCH
+            assert (conflict.other_emplcode, conflict.other_filial) == (employee_data_f2['emplcode'], 2)
+            assert conflict.matched_fields == MATCH_FIO | MATCH_BIRTHDAY
+            assert 'Сидорова' in conflict.errlist, "В описании конфликта должна быть фамилия сотрудника"
         finally:
             session.close()
 
@@ -434,49 +443,15 @@ class TestSynchronization(TestBase):
         self.add_employee('filial1', employee_data)
         logger.info(f"Создан сотрудник {empl_code} с начальной должностью 1")
 
-        # Шаг 2: Вносим изменения в должность
+        # Шаг 2: Меняем должность - запись в историю делает триггер в том же операторе
         session = self.db.get_session('filial1')
         try:
-            # Записываем изменение в историю
-            session.execute(
-                text("""
-                    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
-                    VALUES (:emplcode, :changedate, :surname, :passport, :poscode, :action)
-                """),
-                {
-                    'emplcode': empl_code,
-                    'changedate': date.today(),
-                    'surname': 'Орлов',
-                    'passport': test_passport,
-                    'poscode': 1,
-                    'action': 'Начальная должность'
-                }
-            )
-
-            # Меняем должность
             session.execute(
                 text("UPDATE employee SET poscode = :new_poscode WHERE emplcode = :emplcode"),
                 {'new_poscode': 2, 'emplcode': empl_code}
             )
-
-            # Записываем изменение в историю
-            session.execute(
-                text("""
-                    INSERT INTO emplhistory (emplcode, changedate, surname, passport, poscode, action)
-                    VALUES (:emplcode, :changedate, :surname, :passport, :poscode, :action)
-                """),
-                {
-                    'emplcode': empl_code,
-                    'changedate': date.today(),
-                    'surname': 'Орлов',
-                    'passport': test_passport,
-                    'poscode': 2,
-                    'action': 'Повышение'
-                }
-            )
-
             session.commit()
-            logger.info("Внесены изменения в должность и историю")
+            logger.info("Изменена должность")
 
         finally:
             session.close()
@@ -484,56 +459,38 @@ class TestSynchronization(TestBase):
         # Шаг 3: Синхронизируем сотрудника
         sync_result = self.safe_sync_new_employee(test_passport)
 
-        # Шаг 4: Проверяем сохранение истории
+        # Шаг 4: Проверяем сохранение истории в Ф1 и ее перенос в Ф2 в том же порядке
+        history_query = text("""
+            SELECT h.action, h.poscode FROM emplhistory h
+            JOIN employee e ON e.emplcode = h.emplcode
+            WHERE e.passport = :passport AND e.filial = :filial
+            ORDER BY h.historyid
+        """)
         session_f1 = self.db.get_session('filial1')
+        session_f2 = self.db.get_session('filial2')
         try:
-            history_count = session_f1.execute(
-                text("SELECT COUNT(*) FROM emplhistory WHERE emplcode = :emplcode"),
-                {'emplcode': empl_code}
-            ).scalar()
+            history_f1 = [tuple(row) for row in session_f1.execute(history_query, {'passport': test_passport, 'filial': 1})]
+            history_f2 = [tuple(row) for row in session_f2.execute(history_query, {'passport': test_passport, 'filial': 2})]
 
             current_position = session_f1.execute(
                 text("SELECT poscode FROM employee WHERE emplcode = :emplcode"),
                 {'emplcode': empl_code}
             ).scalar()
 
-            logger.info(f"Записей в истории: {history_count}, текущая должность: {current_position}")
+            logger.info(f"История в Ф1: {history_f1}, в Ф2: {history_f2}, текущая должность: {current_position}")
 
             # Утверждения
-            assert history_count >= 2, f"Должно быть не менее 2 записей в истории, получено: {history_count}"
-            assert current_position == 2, f"Текущая должность должна быть 2, получено: {current_position}"
             assert sync_result, "Синхронизация должна быть успешной"
+            assert history_f1 == [('Прием', 1), ('Перевод', 2)], f"Неверная история в Ф1: {history_f1}"
+            assert history_f2 == history_f1, f"История должна перенестись в Ф2 без изменений: {history_f2}"
+            assert current_position == 2, f"Текущая должность должна быть 2, получено: {current_position}"
 
         finally:
             session_f1.close()
+            session_f2.close()
 
         logger.info("✅ УСПЕХ: ТЕСТ 6 ПРОЙДЕН: История изменений сохранена")
 
-    def _simulate_conflict_detection(self, passport1, passport2):
-        """Эмуляция обнаружения конфликта"""
-        session = self.db.get_session('filial1')
-        try:
-            # Эмуляция логики обнаружения конфликта
-            session.execute(
-                text("""
-                    INSERT INTO conflist (emplcode, errlist, conflictdate, resolved)
-                    VALUES (
-                        (SELECT emplcode FROM employee WHERE passport = :passport1 AND filial = 1),
-                        :errlist, 
-                        NOW(), 
-                        FALSE
-                    )
-                """),
-                {
-                    'passport1': passport1,
-                    'errlist': f'CONFLICT: Возможное дублирование сотрудников {passport1} и {passport2}'
-                }
-            )
-            session.commit()
-            logger.info("Эмулировано обнаружение конфликта")
-        finally:
-            session.close()
-
     def _simulate_conflict_resolution(self, passport):
         """Эмуляция разрешения конфликта"""
         session = self.db.get_session('filial1')
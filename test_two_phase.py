@@ -0,0 +1,125 @@
+import pytest
+from test_base import TestBase
+from two_phase import TPC_COMMIT, new_group_id, participant_xid, decide
+from sqlalchemy import text
+import logging
+
+logger = logging.getLogger(__name__)
+
+PREPARED_SQL = text("SELECT COUNT(*) FROM pg_prepared_xacts WHERE gid LIKE :pattern")
+DECISIONS_SQL = text("SELECT COUNT(*) FROM sync_tpc_decisions WHERE group_id = :group_id")
+STATUS_SQL = text("SELECT status FROM employee WHERE passport = :passport")
+
+
+class LostCommit:
+    """Транзакция участника, соединение которой обрывается на COMMIT PREPARED"""
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+        self.is_active = True
+
+    def prepare(self):
+        self.transaction.prepare()
+
+    def commit(self):
+        # Подготовленная транзакция остается на сервере, как после обрыва соединения
+        self.transaction.connection.invalidate()
+        self.is_active = False
+        raise ConnectionError("соединение потеряно при фиксации")
+
+    def rollback(self):
+        pass
+
+
+class TestTwoPhaseCommit(TestBase):
+    # Подготовленные транзакции нельзя выполнить во внешней откатываемой транзакции теста
+    ISOLATED = False
+
+    def get_status(self, database_name, passport):
+        with self.db.engines[database_name].connect() as conn:
+            return conn.execute(STATUS_SQL, {'passport': passport}).scalar()
+
+    def prepare_group(self, group_id, status, passport):
+        """Подготовленные транзакции в обеих базах без фиксации - как после падения координатора"""
+        for database_name in ('filial1', 'filial2'):
+            conn = self.db.engines[database_name].connect()
+            transaction = conn.begin_twophase(participant_xid(group_id, database_name))
+            conn.execute(text("UPDATE employee SET status = :status WHERE passport = :passport"),
+                         {'status': status, 'passport': passport})
+            transaction.prepare()
+            # Соединение с подготовленной транзакцией закрывается, транзакция остается на сервере
+            conn.invalidate()
+
+    def test_batch_commits_in_one_prepare_cycle_per_filial(self):
+        """Встречная синхронизация пачки фиксируется согласованно одной группой на все базы"""
+        passports = [self.get_test_passport(40 + i) for i in range(3)]
+        for passport in passports:
+            self.add_employee('filial1', self.make_employee(passport, 1))
+            self.add_employee('filial2', self.make_employee(passport, 2, status='Fired'))
+
+        with self.db.unit_of_work(twophase=True) as uow:
+            for passport in passports:
+                assert self.db.safe_synchronize_dismissal('filial2', 'filial1', passport)
+            group_id = uow.group_id
+
+        assert all(self.get_status('filial1', passport) == 'Fired' for passport in passports)
+        with self.db.engines['filial1'].connect() as conn:
+            assert conn.execute(PREPARED_SQL, {'pattern': f'{group_id}%'}).scalar() == 0
+            assert conn.execute(DECISIONS_SQL, {'group_id': group_id}).scalar() == 0, "Решение удаляется после фиксации"
+
+        # Ошибка внутри единицы работы не применяет изменения ни в одной базе
+        with pytest.raises(RuntimeError):
+            with self.db.unit_of_work(twophase=True):
+                with self.db.connection_scope('filial1') as conn:
+                    conn.execute(text("UPDATE employee SET status = 'Active' WHERE passport = :passport"),
+                                 {'passport': passports[0]})
+                assert self.db.safe_synchronize_dismissal('filial1', 'filial2', passports[0])
+                raise RuntimeError("сбой посередине прохода")
+        assert self.get_status('filial1', passports[0]) == 'Fired'
+        assert self.get_status('filial2', passports[0]) == 'Fired'
+
+    def test_failed_participant_commit_is_reported(self):
+        """Сбой фиксации участника после решения называет его gid, транзакцию фиксирует восстановление"""
+        passport = self.get_test_passport(47)
+        self.add_employee('filial1', self.make_employee(passport, 1))
+        self.add_employee('filial2', self.make_employee(passport, 2, status='Fired'))
+
+        with pytest.raises(RuntimeError) as error:
+            with self.db.unit_of_work(twophase=True) as uow:
+                assert self.db.safe_synchronize_dismissal('filial2', 'filial1', passport)
+                group_id = uow.group_id
+                uow._transactions['filial1'] = LostCommit(uow._transactions['filial1'])
+
+        assert participant_xid(group_id, 'filial1') in str(error.value)
+        assert participant_xid(group_id, 'filial2') not in str(error.value)
+        assert self.get_status('filial1', passport) == 'Active'
+
+        self.db.recover_in_doubt(grace=0)
+        assert self.get_status('filial1', passport) == 'Fired'
+        with self.db.engines['filial1'].connect() as conn:
+            assert conn.execute(PREPARED_SQL, {'pattern': f'{group_id}%'}).scalar() == 0
+
+    def test_recovery_completes_in_doubt_groups(self):
+        """Восстановление фиксирует группу с решением о фиксации и откатывает группу без решения"""
+        committed, abandoned = self.get_test_passport(45), self.get_test_passport(46)
+        for passport in (committed, abandoned):
+            self.add_employee('filial1', self.make_employee(passport, 1))
+            self.add_employee('filial2', self.make_employee(passport, 2))
+
+        decided_group, undecided_group = new_group_id(), new_group_id()
+        self.prepare_group(decided_group, 'Fired', committed)
+        decide(self.db.engines[self.db.coordinator_db], decided_group, TPC_COMMIT)
+        self.prepare_group(undecided_group, 'Fired', abandoned)
+
+        # Свежие транзакции может завершать работающий координатор - их восстановление не трогает
+        assert self.db.recover_in_doubt() == {'committed': 0, 'rolled_back': 0}
+        recovered = self.db.recover_in_doubt(grace=0)
+        logger.info(f"Восстановлено: {recovered}")
+
+        assert recovered['committed'] >= 2 and recovered['rolled_back'] >= 2
+        for database_name in ('filial1', 'filial2'):
+            assert self.get_status(database_name, committed) == 'Fired'
+            assert self.get_status(database_name, abandoned) == 'Active'
+        with self.db.engines['filial1'].connect() as conn:
+            assert conn.execute(PREPARED_SQL, {'pattern': f'{decided_group}%'}).scalar() == 0
+            assert conn.execute(PREPARED_SQL, {'pattern': f'{undecided_group}%'}).scalar() == 0
@@ -0,0 +1,118 @@
+from sqlalchemy import text
+from collections import defaultdict
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Группа - одна согласованная фиксация единицы работы: в каждой базе-участнике
+# своя подготовленная транзакция с gid "<группа>:<база>" (gid уникален в кластере,
+# а базы филиалов могут жить в одном кластере)
+TPC_GID_PREFIX = 'sync-tpc'
+TPC_COMMIT = 'commit'
+TPC_ROLLBACK = 'rollback'
+
+# Миграция журнала решений координатора: таблица повторяет модель TwoPhaseDecision.
+# Создается во всех базах реестра, журналом служит таблица первой базы
+TPC_DECISIONS_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS sync_tpc_decisions (
+        group_id VARCHAR(100) PRIMARY KEY,
+        outcome VARCHAR(10) NOT NULL,
+        decided_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+]
+
+DECISION_LOG_INSTALLED_SQL = text("SELECT to_regclass('sync_tpc_decisions') IS NOT NULL")
+
+# Решение по группе записывается в журнал координатора один раз: первый записавший
+# (координатор после подготовки всех участников или восстановление) определяет исход
+DECIDE_SQL = text("""
+    INSERT INTO sync_tpc_decisions (group_id, outcome) VALUES (:group_id, :outcome)
+    ON CONFLICT (group_id) DO NOTHING
+""")
+
+DECISION_SQL = text("SELECT outcome FROM sync_tpc_decisions WHERE group_id = :group_id")
+
+FORGET_DECISIONS_SQL = text("DELETE FROM sync_tpc_decisions WHERE group_id = ANY(:group_ids)")
+
+# Решения старше окна ожидания без подготовленных транзакций больше не нужны
+FORGET_STALE_DECISIONS_SQL = text("""
+    DELETE FROM sync_tpc_decisions WHERE decided_at < NOW() - make_interval(secs => :grace)
+""")
+
+# Подготовленные транзакции групп этой базы, оставшиеся дольше окна ожидания:
+# более свежие еще может завершить работающий координатор
+IN_DOUBT_SQL = text("""
+    SELECT gid FROM pg_prepared_xacts
+    WHERE database = current_database() AND gid LIKE :pattern
+      AND prepared < NOW() - make_interval(secs => :grace)
+    ORDER BY prepared
+""")
+
+
+def new_group_id():
+    """Идентификатор группы согласованной фиксации"""
+    return f'{TPC_GID_PREFIX}:{uuid.uuid4().hex}'
+
+
+def participant_xid(group_id, database_name):
+    """gid подготовленной транзакции участника группы"""
+    return f'{group_id}:{database_name}'
+
+
+def group_of(xid):
+    """Группа, которой принадлежит gid участника"""
+    return xid.rsplit(':', 1)[0]
+
+
+def decide(engine, group_id, outcome):
+    """Запись решения по группе в журнал координатора отдельной транзакцией.
+
+    Возвращает действующее решение: если восстановление уже записало откат,
+    запись фиксации не проходит и возвращается откат.
+    """
+    with engine.begin() as conn:
+        conn.execute(DECIDE_SQL, {'group_id': group_id, 'outcome': outcome})
+        return conn.execute(DECISION_SQL, {'group_id': group_id}).scalar()
+
+
+def forget(engine, group_ids):
+    """Удаление решений завершенных групп"""
+    with engine.begin() as conn:
+        conn.execute(FORGET_DECISIONS_SQL, {'group_ids': list(group_ids)})
+
+
+def recover_in_doubt(engines, coordinator, grace):
+    """Завершение подготовленных транзакций, оставленных упавшим координатором.
+
+    engines - {база: движок}, coordinator - движок с журналом решений. Группа без
+    записанного решения откатывается (решение об откате записывается, чтобы опоздавший
+    координатор его не перебил), группа с решением о фиксации фиксируется во всех базах.
+    Возвращает {'committed': число транзакций, 'rolled_back': число транзакций}.
+    """
+    in_doubt = defaultdict(list)
+    for database_name, engine in engines.items():
+        with engine.connect() as conn:
+            xids = conn.execute(IN_DOUBT_SQL, {'pattern': f'{TPC_GID_PREFIX}:%', 'grace': grace}).scalars().all()
+        for xid in xids:
+            in_doubt[group_of(xid)].append((database_name, xid))
+
+    recovered = {TPC_COMMIT: 0, TPC_ROLLBACK: 0}
+    for group_id, participants in in_doubt.items():
+        outcome = decide(coordinator, group_id, TPC_ROLLBACK)
+        for database_name, xid in participants:
+            with engines[database_name].connect() as conn:
+                if outcome == TPC_COMMIT:
+                    conn.commit_prepared(xid, recover=True)
+                else:
+                    conn.rollback_prepared(xid, recover=True)
+            recovered[outcome] += 1
+        logger.warning(f"Группа {group_id} восстановлена: {outcome}, участников {len(participants)}")
+
+    if in_doubt:
+        forget(coordinator, in_doubt)
+    with coordinator.begin() as conn:
+        conn.execute(FORGET_STALE_DECISIONS_SQL, {'grace': grace})
+    return {'committed': recovered[TPC_COMMIT], 'rolled_back': recovered[TPC_ROLLBACK]}